@@ -1,13 +1,19 @@
-import streamlit as st
+import contextlib
 import os
-import tempfile
+import re
+import time
+import streamlit as st
 from PIL import Image
 
-from pdf_processor import extract_text_from_pdf
+from pdf_processor import process_pdf
 from flashcard_generator import generate_flashcards
 from summary_generator import generate_summaries
 from qa_system import answer_question
-from vector_store import create_vector_store, get_retriever
+from vector_store import create_vector_store, get_retriever, update_vector_store
+from study_scheduler import StudyScheduler
+from sharded_search import ShardedQueryExecutor
+import tracing
+from profiling import RequestProfiler, document_hash
 
 # Page configuration
 st.set_page_config(
@@ -16,11 +22,41 @@ st.set_page_config(
     layout="wide",
 )
 
+@st.cache_resource
+def get_study_scheduler():
+    """One review log shared by all sessions (replayed once per server process)"""
+    return StudyScheduler(os.environ.get("STUDY_LOG_PATH", os.path.join(".study", "reviews.log")))
+
+def get_store_path(file_name):
+    """SQLite database of an uploaded file under STORE_DIR, or None to keep the index in memory"""
+    store_dir = os.environ.get("STORE_DIR")
+    if not store_dir:
+        return None
+    os.makedirs(store_dir, exist_ok=True)
+    return os.path.join(store_dir, re.sub(r'[^\w.-]', '_', file_name) + ".sqlite")
+
+def get_query_executor():
+    """
+    Worker processes that score this session's queries in parallel, if QUERY_WORKERS is set (for large libraries)
+    
+    Each session gets its own: an executor re-packs the index whenever it is
+    handed another store's snapshot and scores one query at a time, so a
+    shared one would make sessions re-pack and wait for each other.
+    """
+    workers = int(os.environ.get("QUERY_WORKERS", "0"))
+    if workers <= 0:
+        return None
+    if st.session_state.get('query_executor') is None:
+        st.session_state.query_executor = ShardedQueryExecutor(workers=workers)
+    return st.session_state.query_executor
+
 # Initialize session state variables
 if 'pdf_text' not in st.session_state:
     st.session_state.pdf_text = None
 if 'pdf_name' not in st.session_state:
     st.session_state.pdf_name = None
+if 'pdf_hash' not in st.session_state:
+    st.session_state.pdf_hash = None
 if 'vector_store' not in st.session_state:
     st.session_state.vector_store = None
 if 'flashcards' not in st.session_state:
@@ -29,13 +65,23 @@ if 'summaries' not in st.session_state:
     st.session_state.summaries = {}
 if 'uploaded_files' not in st.session_state:
     st.session_state.uploaded_files = []
+if 'documents' not in st.session_state:
+    st.session_state.documents = {}  # Last processed revision of each uploaded file
 if 'current_tab' not in st.session_state:
     st.session_state.current_tab = "Upload"
 
+def profiled(kind, query=None, source=None, **details):
+    """Profile a request (see profiling.py) if profiling is switched on in the sidebar"""
+    if not st.session_state.get('profile_requests'):
+        return contextlib.nullcontext()
+    return RequestProfiler(kind, document_hash=st.session_state.pdf_hash, query=query, details=details,
+                           store=st.session_state.vector_store, source=source)
+
 def reset_session():
     """Reset all session state variables"""
     st.session_state.pdf_text = None
     st.session_state.pdf_name = None
+    st.session_state.pdf_hash = None
     st.session_state.vector_store = None
     st.session_state.flashcards = []
     st.session_state.summaries = {}
@@ -50,6 +96,13 @@ tab = st.sidebar.radio(
 )
 st.session_state.current_tab = tab
 
+# Opt-in profiling of the next uploads and requests, written to PROFILE_DIR
+st.sidebar.checkbox("Profile requests", key="profile_requests",
+                    help="Write a flame graph and memory report of each upload or request, to reproduce slow cases")
+
+# Script runs are timed as the "render" stage when TRACING is set
+render_started = time.perf_counter()
+
 # Display relevant information in the sidebar
 if st.session_state.pdf_name:
     st.sidebar.success(f"Working with: {st.session_state.pdf_name}")
@@ -66,16 +119,36 @@ if tab == "Upload":
     
     if uploaded_file is not None:
         with st.spinner("Processing your PDF..."):
-            # Save the uploaded file to a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                pdf_path = tmp_file.name
-            
-            # Extract text from PDF
-            text = extract_text_from_pdf(pdf_path)
+            # Parse the upload straight from memory: text, metadata and outline in one pass.
+            # Pages unchanged since the last upload of this file are not extracted again.
+            previous = st.session_state.documents.get(uploaded_file.name)
+            pdf_bytes = uploaded_file.getvalue()
+            st.session_state.pdf_hash = document_hash(pdf_bytes)
+            with profiled("upload", source=pdf_bytes, file_name=uploaded_file.name) as profiler:
+                document = process_pdf(pdf_bytes, previous=previous)
+                text = document['text']
+                st.session_state.documents[uploaded_file.name] = document
+                
+                if (previous is not None and st.session_state.pdf_name == uploaded_file.name
+                        and st.session_state.vector_store is not None):
+                    # Revised upload: re-index only the pages that changed
+                    vector_store = update_vector_store(st.session_state.vector_store, text,
+                                                       outline=document['outline'],
+                                                       page_offsets=document['page_offsets'],
+                                                       source=uploaded_file.name)
+                    if text != previous['text']:
+                        st.session_state.flashcards = []
+                        st.session_state.summaries = {}
+                else:
+                    # Create vector store for RAG (on disk, in SQLite, when STORE_DIR is set)
+                    vector_store = create_vector_store(text, outline=document['outline'],
+                                                       page_offsets=document['page_offsets'],
+                                                       source=uploaded_file.name,
+                                                       path=get_store_path(uploaded_file.name))
+                if profiler is not None:
+                    profiler.store = vector_store
             
-            # Create vector store for RAG
-            vector_store = create_vector_store(text)
+            vector_store.query_executor = get_query_executor()
             
             # Save in session state
             st.session_state.pdf_text = text
@@ -83,15 +156,27 @@ if tab == "Upload":
             st.session_state.vector_store = vector_store
             st.session_state.uploaded_files.append(uploaded_file.name)
             
-            # Clean up temp file
-            os.unlink(pdf_path)
-            
         st.success(f"Successfully processed {uploaded_file.name}!")
+        
+        # Report pages that could not be extracted
+        for error in document['errors']:
+            if error['page'] is None:
+                st.error(f"Could not read the PDF: {error['error']}")
+            else:
+                st.warning(f"Page {error['page'] + 1} could not be extracted: {error['error']}")
         st.write("You can now navigate to the Flashcards, Summaries, or Q&A tabs to use your document.")
         
         # Show preview of the extracted text
         with st.expander("Preview extracted text"):
             st.write(text[:1000] + "..." if len(text) > 1000 else text)
+        
+        # Show the detected document outline
+        if st.session_state.vector_store.outline:
+            with st.expander("Document outline"):
+                for section in st.session_state.vector_store.outline:
+                    indent = "&nbsp;" * 4 * section['level']
+                    pages = f"p. {section['page'] + 1}" if section['end_page'] == section['page'] else f"pp. {section['page'] + 1}-{section['end_page'] + 1}"
+                    st.markdown(f"{indent}{section['title']} <span style='color:#888;'>({pages})</span>", unsafe_allow_html=True)
 
 elif tab == "Flashcards":
     st.title("Flashcards")
@@ -101,9 +186,12 @@ elif tab == "Flashcards":
     else:
         if not st.session_state.flashcards:
             with st.spinner("Generating flashcards..."):
-                retriever = get_retriever(st.session_state.vector_store)
-                flashcards = generate_flashcards(st.session_state.pdf_text, retriever)
+                search_kwargs = {"k": 4, "search_type": "mmr"}
+                retriever = get_retriever(st.session_state.vector_store, search_kwargs)
+                with profiled("flashcards", search_kwargs=search_kwargs):
+                    flashcards = generate_flashcards(st.session_state.pdf_text, retriever)
                 st.session_state.flashcards = flashcards
+                get_study_scheduler().add_cards(st.session_state.pdf_name, flashcards)
         
         # Display the flashcards in a more visually appealing format
         st.write("### Study Flashcards")
@@ -140,13 +228,57 @@ elif tab == "Flashcards":
                         
                     st.markdown("<hr style='margin: 15px 0px; opacity: 0.3;'>", unsafe_allow_html=True)
         
+        # Narrow down the cards drawn on regeneration
+        card_topic = None
+        section_titles = [section['title'] for section in st.session_state.vector_store.outline]
+        if section_titles:
+            choice = st.selectbox("Flashcards from:", ["Whole document"] + section_titles)
+            if choice != "Whole document":
+                card_topic = choice
+        
         # Option to regenerate flashcards
         if st.button("Regenerate Flashcards"):
             with st.spinner("Regenerating flashcards..."):
-                retriever = get_retriever(st.session_state.vector_store)
-                flashcards = generate_flashcards(st.session_state.pdf_text, retriever)
+                search_kwargs = {"k": 4, "search_type": "mmr"}
+                retriever = get_retriever(st.session_state.vector_store, search_kwargs)
+                with profiled("flashcards", search_kwargs=search_kwargs, topic=card_topic):
+                    flashcards = generate_flashcards(st.session_state.pdf_text, retriever, topic=card_topic)
                 st.session_state.flashcards = flashcards
+                get_study_scheduler().add_cards(st.session_state.pdf_name, flashcards)
                 st.rerun()
+        
+        # Study mode: review due cards with spaced repetition
+        st.write("### Study Mode")
+        scheduler = get_study_scheduler()
+        all_decks = st.checkbox("Include cards from all documents", key="study_all_decks")
+        deck = None if all_decks else st.session_state.pdf_name
+        counts = scheduler.stats(deck)
+        st.write(f"{counts['due'] + counts['new']} cards due · {counts['learned']} scheduled for later · {counts['total']} total")
+        
+        due = scheduler.due_cards(limit=1, deck=deck)
+        if not due:
+            st.success("No cards are due. Come back later!")
+        else:
+            card = due[0]
+            st.markdown(f"""
+            <div style="border:1px solid #cccccc; border-radius:10px; padding:15px; margin-bottom:15px; background-color:#f8f9fa;">
+                <p><strong>Question:</strong> {card['question']}</p>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            if st.checkbox("Show Answer", key=f"study_answer_{card['card_id']}"):
+                st.markdown(f"""
+                <div style="border:1px solid #dddddd; border-radius:10px; padding:15px; margin-bottom:20px; background-color:#e8f4f8;">
+                    <p><strong>Answer:</strong> {card['answer']}</p>
+                </div>
+                """, unsafe_allow_html=True)
+                
+                # Grade the recall; the card is rescheduled and the next due card is shown
+                grade_cols = st.columns(4)
+                for col, grade in zip(grade_cols, ["again", "hard", "good", "easy"]):
+                    if col.button(grade.capitalize(), key=f"study_{grade}"):
+                        scheduler.review(card['card_id'], grade)
+                        st.rerun()
 
 elif tab == "Summaries":
     st.title("Topic Summaries")
@@ -156,8 +288,10 @@ elif tab == "Summaries":
     else:
         if not st.session_state.summaries:
             with st.spinner("Generating topic summaries..."):
-                retriever = get_retriever(st.session_state.vector_store)
-                summaries = generate_summaries(st.session_state.pdf_text, retriever)
+                search_kwargs = {"k": 4, "search_type": "mmr"}
+                retriever = get_retriever(st.session_state.vector_store, search_kwargs)
+                with profiled("summaries", search_kwargs=search_kwargs):
+                    summaries = generate_summaries(st.session_state.pdf_text, retriever)
                 st.session_state.summaries = summaries
         
         # Display the summaries with better styling
@@ -187,8 +321,10 @@ elif tab == "Summaries":
         # Option to regenerate summaries
         if st.button("Regenerate Summaries"):
             with st.spinner("Regenerating summaries..."):
-                retriever = get_retriever(st.session_state.vector_store)
-                summaries = generate_summaries(st.session_state.pdf_text, retriever)
+                search_kwargs = {"k": 4, "search_type": "mmr"}
+                retriever = get_retriever(st.session_state.vector_store, search_kwargs)
+                with profiled("summaries", search_kwargs=search_kwargs):
+                    summaries = generate_summaries(st.session_state.pdf_text, retriever)
                 st.session_state.summaries = summaries
                 st.rerun()
 
@@ -210,6 +346,14 @@ elif tab == "Q&A":
         if 'conversation_history' not in st.session_state:
             st.session_state.conversation_history = []
             
+        # Optionally restrict the search to one section of the document outline
+        section_titles = [section['title'] for section in st.session_state.vector_store.outline]
+        selected_section = None
+        if section_titles:
+            choice = st.selectbox("Search within:", ["Whole document"] + section_titles)
+            if choice != "Whole document":
+                selected_section = choice
+        
         # Input for question with a button for better UX
         col1, col2 = st.columns([4, 1])
         with col1:
@@ -222,8 +366,10 @@ elif tab == "Q&A":
             st.session_state.last_question = question
             
             with st.spinner("Finding the answer..."):
-                retriever = get_retriever(st.session_state.vector_store)
-                answer = answer_question(question, retriever)
+                search_kwargs = {"k": 4, "section": selected_section}
+                retriever = get_retriever(st.session_state.vector_store, search_kwargs)
+                with profiled("query", query=question, search_kwargs=search_kwargs):
+                    answer = answer_question(question, retriever)
                 
                 # Add to conversation history
                 st.session_state.conversation_history.append({"question": question, "answer": answer})
@@ -271,3 +417,29 @@ elif tab == "Q&A":
 # Add a footer
 st.markdown("---")
 st.markdown("**Personalized Learning Assistant** • Created using Streamlit and RAG Technology")
+
+# Per-stage timings and counters, when tracing is enabled
+if tracing.is_enabled():
+    tracing.record("render", time.perf_counter() - render_started, tab=tab)
+    
+    # Export for a Prometheus textfile collector (or as JSON for a .json path)
+    metrics_path = os.environ.get("TRACING_METRICS_FILE")
+    if metrics_path:
+        tracing.write_metrics(metrics_path)
+    
+    with st.sidebar.expander("Diagnostics"):
+        rows = [{"stage": row['stage'] + "".join(f" ({value})" for value in row['labels'].values()),
+                 "calls": row['calls'], "mean ms": row['mean_ms'], "max ms": row['max_ms']}
+                for row in tracing.stage_summary()]
+        if rows:
+            st.table(rows)
+        metrics = tracing.snapshot()
+        for counter in metrics['counters']:
+            labels = ", ".join(f"{key}={value}" for key, value in counter['labels'].items())
+            st.caption(f"{counter['name']}{f' ({labels})' if labels else ''}: {counter['value']}")
+        for error in metrics['errors'][-5:]:
+            st.caption(f"⚠️ {error['stage']}: {error['error']}")
+        st.download_button("Download metrics (Prometheus)", tracing.export_prometheus(),
+                           file_name="metrics.prom", mime="text/plain")
+        st.download_button("Download traces (JSON)", tracing.export_json(),
+                           file_name="traces.json", mime="application/json")
@@ -0,0 +1,99 @@
+"""
+Compare chunking strategies on the same PDFs
+
+Measures chunking throughput and a retrieval-quality proxy for each strategy:
+sentences are sampled from the document, a handful of their content words is
+used as the query, and a hit is counted when a retrieved chunk contains the
+sentence.
+
+Usage:
+    python -m benchmarks.bench_chunking course.pdf [more.pdf ...] [--queries 200] [--json]
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from chunking import CHUNKING_STRATEGIES, SentenceTable, chunk_text
+from pdf_processor import process_pdf
+from vector_store import STOPWORDS, SimpleDocStore, split_into_documents
+
+def sample_queries(text, sentences, count, seed=0):
+    """Pick sentences to look up, with a query made of some of their content words"""
+    rng = random.Random(seed)
+    candidates = [i for i in range(len(sentences)) if sentences.tokens[i] >= 8]
+    rng.shuffle(candidates)
+    
+    queries = []
+    for i in candidates[:count]:
+        start, end = sentences.starts[i], sentences.ends[i]
+        terms = [t for t in re.findall(r'\b\w+\b', text[start:end].lower())
+                 if t not in STOPWORDS and len(t) > 2]
+        if len(terms) < 3:
+            continue
+        queries.append((" ".join(rng.sample(terms, min(5, len(terms)))), start, end))
+    return queries
+
+def evaluate_strategy(text, outline, sentences, strategy, queries, k=4, repeat=5):
+    """Time one strategy and measure how often retrieval finds the source sentence"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        spans = chunk_text(text, strategy, outline=outline, sentences=sentences)
+    chunk_seconds = (time.perf_counter() - started) / repeat
+    
+    store = SimpleDocStore(split_into_documents(text, outline, strategy))
+    hits = 0
+    reciprocal_ranks = 0.0
+    for query, start, end in queries:
+        docs = store.get_relevant_documents(query, k=k)
+        for rank, doc in enumerate(docs, start=1):
+            if doc.metadata['start'] <= start and end <= doc.metadata['end']:
+                hits += 1
+                reciprocal_ranks += 1.0 / rank
+                break
+    
+    sizes = [end - start for start, end in spans]
+    return {
+        'strategy': strategy,
+        'chunks': len(spans),
+        'avg_chunk_chars': round(sum(sizes) / len(sizes), 1) if sizes else 0,
+        'chunking_ms': round(chunk_seconds * 1000, 3),
+        'chars_per_second': round(len(text) / chunk_seconds) if chunk_seconds else None,
+        f'hit@{k}': round(hits / len(queries), 4) if queries else None,
+        'mrr': round(reciprocal_ranks / len(queries), 4) if queries else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('pdfs', nargs='+', help='PDF files to benchmark on')
+    parser.add_argument('--queries', type=int, default=200, help='Sampled queries per PDF')
+    parser.add_argument('--k', type=int, default=4, help='Number of chunks retrieved per query')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    results = []
+    for path in args.pdfs:
+        document = process_pdf(path)
+        text = document['text']
+        started = time.perf_counter()
+        sentences = SentenceTable(text)
+        sentence_ms = (time.perf_counter() - started) * 1000
+        queries = sample_queries(text, sentences, args.queries)
+        
+        for strategy in CHUNKING_STRATEGIES:
+            result = evaluate_strategy(text, document['outline'], sentences, strategy, queries, k=args.k)
+            result.update({'pdf': path, 'chars': len(text), 'sentence_split_ms': round(sentence_ms, 3)})
+            results.append(result)
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    columns = ['pdf', 'strategy', 'chunks', 'avg_chunk_chars', 'chunking_ms', f'hit@{args.k}', 'mrr']
+    print("  ".join(f"{c:>16}" for c in columns))
+    for result in results:
+        print("  ".join(f"{str(result[c])[-16:]:>16}" for c in columns))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Measure the memory each extra process needs to serve queries from a library
+
+A synthetic library is saved both as a pickled snapshot (every process
+loads its own copy) and as a packed index file (every process maps the same
+file). Child processes open each form, run queries, and report how much
+private memory they gained; pages of the mapped file are shared between
+processes and do not count.
+
+Usage:
+    python -m benchmarks.bench_packed [--chunks 50000] [--processes 3] [--json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import tempfile
+import time
+
+from benchmarks.bench_sharding import build_store, make_vocabulary
+from vector_store import PackedDocStore, SimpleDocStore
+
+def private_memory_kb():
+    """Anonymous (unshared) resident memory of this process in KB, from /proc"""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1])
+    except OSError as e:
+        print(f"Error reading process memory: {e}")
+    return 0
+
+def serve(kind, path, queries, results):
+    """Child process: open the library, answer the queries, report memory gained and latency"""
+    before = private_memory_kb()
+    if kind == 'packed':
+        store = PackedDocStore(path)
+    else:
+        store = SimpleDocStore([], dedup=False, background_compaction=False)
+        with open(path, 'rb') as f:
+            store._publish(pickle.load(f))
+    loaded = private_memory_kb()
+    
+    started = time.perf_counter()
+    for query in queries:
+        store.get_relevant_documents(query, k=4)
+    elapsed = time.perf_counter() - started
+    
+    results.put({'kind': kind, 'load_kb': loaded - before, 'total_kb': private_memory_kb() - before,
+                 'query_ms': elapsed * 1000 / max(len(queries), 1)})
+
+def run(chunk_count, process_count, query_count, seed=0):
+    """Save the library both ways and measure child processes opening each"""
+    vocabulary = make_vocabulary(5000, seed)
+    store = build_store(chunk_count, vocabulary, seed)
+    rng = random.Random(seed + 1)
+    queries = [" ".join(rng.sample(vocabulary[20:500], 3)) for _ in range(query_count)]
+    
+    directory = tempfile.mkdtemp()
+    paths = {'pickled': os.path.join(directory, 'index.pickle'), 'packed': os.path.join(directory, 'index.pack')}
+    with open(paths['pickled'], 'wb') as f:
+        pickle.dump(store.snapshot(), f)
+    store.save_packed(paths['packed'])
+    
+    context = multiprocessing.get_context('spawn')
+    rows = []
+    try:
+        for kind, path in paths.items():
+            results = context.Queue()
+            processes = [context.Process(target=serve, args=(kind, path, queries, results))
+                         for _ in range(process_count)]
+            for process in processes:
+                process.start()
+            reports = [results.get() for _ in processes]
+            for process in processes:
+                process.join()
+            rows.append({
+                'kind': kind,
+                'file_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+                'private_mb_per_process': round(max(r['total_kb'] for r in reports) / 1024, 1),
+                'load_mb_per_process': round(max(r['load_kb'] for r in reports) / 1024, 1),
+                'query_ms': round(sum(r['query_ms'] for r in reports) / len(reports), 3),
+            })
+    finally:
+        for path in paths.values():
+            os.remove(path)
+        os.rmdir(directory)
+    
+    return {'chunks': chunk_count, 'processes': process_count, 'queries': query_count, 'results': rows}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=50000, help='Number of chunks in the library')
+    parser.add_argument('--processes', type=int, default=3, help='Processes opening the library')
+    parser.add_argument('--queries', type=int, default=100, help='Queries per process')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    result = run(args.chunks, args.processes, args.queries)
+    
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['chunks']} chunks, {result['processes']} processes, {result['queries']} queries each")
+        for row in result['results']:
+            print(f"  {row['kind']:>8}: file {row['file_mb']} MB, private memory per process "
+                  f"{row['private_mb_per_process']} MB (loading {row['load_mb_per_process']} MB), "
+                  f"{row['query_ms']} ms per query")
+
+if __name__ == '__main__':
+    main()
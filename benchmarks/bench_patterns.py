@@ -0,0 +1,145 @@
+"""
+Micro-benchmark of the per-sentence flashcard and summary heuristics
+
+Compares the previous per-sentence code (uncompiled regexes, repeated
+sentence.split() calls, one `in` scan per phrase per list) with the shared
+pattern bank in patterns.py, on sentences from a PDF or from a built-in
+deterministic sample.
+
+Usage:
+    python -m benchmarks.bench_patterns [course.pdf] [--repeat 5] [--json]
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from chunking import SentenceTable
+from flashcard_generator import mine_sentence
+from patterns import CUE_PHRASES, SECTION_NUMBER_PATTERN
+
+IMPORTANT_TERMS = ["key", "important", "significant", "essential", "fundamental",
+                   "critical", "vital", "primary", "main", "major", "central"]
+SECTION_MARKER_TERMS = ["introduction", "conclusion", "summary", "overview", "background",
+                        "key points", "findings", "results", "analysis", "discussion"]
+EXPLANATION_PHRASES = ["means", "refers to", "is defined as", "is a", "describes", "explains",
+                       "consists of", "involves", "includes", "represents"]
+
+def legacy_flashcard_sentence(sentence):
+    """The per-sentence flashcard work as it was done before the pattern bank"""
+    if len(sentence.split()) < 5 or len(sentence.split()) > 30:
+        pass
+    else:
+        sentence = sentence.strip()
+        definition_match = re.search(r'([A-Z][a-zA-Z\s]+)\s+(is|are|refers to|means|is defined as|can be defined as)\s+([^\.]+)', sentence)
+        if definition_match:
+            term = definition_match.group(1).strip()
+            definition = definition_match.group(3).strip()
+            if 2 <= len(term.split()) <= 5 and len(definition) >= 10:
+                return "definition"
+        colon_match = re.search(r'([A-Z][a-zA-Z\s]+):\s+([^\.]+)', sentence)
+        if colon_match:
+            term = colon_match.group(1).strip()
+            explanation = colon_match.group(2).strip()
+            if len(term.split()) <= 5 and len(explanation) >= 10:
+                return "colon"
+        if re.search(r'\b(in|on|during)\s+\d{4}\b', sentence) or re.search(r'\b\d+\s+(percent|%)\b', sentence):
+            words = sentence.split()
+            if len(words) >= 7:
+                return "fact"
+    if any(term in sentence.lower() for term in IMPORTANT_TERMS):
+        words = sentence.split()
+        if len(words) >= 8:
+            return "statement"
+    return None
+
+def legacy_summary_sentence(sentence):
+    """The per-sentence summary cue checks as they were done before the pattern bank"""
+    sentence_lower = sentence.lower()
+    marker = any(marker in sentence_lower for marker in SECTION_MARKER_TERMS)
+    numbered = re.match(r'^(\d+\.|\([\d]+\)|\w+\))', sentence.strip()) is not None
+    length = len(sentence.split())
+    skip = len(sentence.split()) < 5 or len(sentence.split()) > 40
+    explanation = any(phrase in sentence_lower for phrase in EXPLANATION_PHRASES)
+    return marker, numbered, length, skip, explanation
+
+def summary_sentence(sentence):
+    """The per-sentence summary cue checks with the pattern bank"""
+    sentence_lower = sentence.lower()
+    words = sentence_lower.split()
+    cues = CUE_PHRASES.labels(words)
+    numbered = SECTION_NUMBER_PATTERN.match(sentence.strip()) is not None
+    length = len(words)
+    skip = length < 5 or length > 40
+    return "section_marker" in cues, numbered, length, skip, "explanation" in cues
+
+def sample_sentences(count=5000, seed=0):
+    """Deterministic course-like sentences mixing all the cue kinds"""
+    rng = random.Random(seed)
+    nouns = ["cell membrane", "enzyme", "protein synthesis", "gradient", "osmosis", "metabolism",
+             "mitochondria", "energy transfer", "diffusion", "glucose"]
+    templates = [
+        "{A} is defined as the process by which {b} controls {c} in living tissue.",
+        "{A}: the main mechanism that moves {b} across the {c} during transport.",
+        "In 1953 researchers showed that {b} increased by 40 percent when {c} was present.",
+        "The key idea of this overview is that {b} depends on {c} and on temperature.",
+        "Students often confuse {b} with {c} because both involve moving particles.",
+        "This analysis describes how {b} and {c} interact in the results of the experiment.",
+    ]
+    sentences = []
+    for _ in range(count):
+        b, c = rng.sample(nouns, 2)
+        template = rng.choice(templates)
+        sentences.append(template.format(A=rng.choice(nouns).title(), b=b, c=c))
+    return sentences
+
+def time_per_sentence(function, sentences, repeat):
+    """Best-of-repeat time per sentence, in microseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for sentence in sentences:
+            function(sentence)
+        best = min(best, time.perf_counter() - started)
+    return best / len(sentences) * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('pdf', nargs='?', help='PDF to take sentences from (default: built-in sample)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions (best is kept)')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    if args.pdf:
+        from pdf_processor import process_pdf
+        text = process_pdf(args.pdf)['text']
+        table = SentenceTable(text)
+        sentences = [text[start:end] for start, end in zip(table.starts, table.ends)]
+    else:
+        sentences = sample_sentences()
+    
+    results = []
+    for name, legacy, current in [("flashcard_mining", legacy_flashcard_sentence, mine_sentence),
+                                  ("summary_cues", legacy_summary_sentence, summary_sentence)]:
+        legacy_us = time_per_sentence(legacy, sentences, args.repeat)
+        current_us = time_per_sentence(current, sentences, args.repeat)
+        results.append({
+            'benchmark': name,
+            'sentences': len(sentences),
+            'legacy_us_per_sentence': round(legacy_us, 3),
+            'pattern_bank_us_per_sentence': round(current_us, 3),
+            'speedup': round(legacy_us / current_us, 2) if current_us else None,
+        })
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    for result in results:
+        print(f"{result['benchmark']:>18}: {result['legacy_us_per_sentence']:8.3f} us -> "
+              f"{result['pattern_bank_us_per_sentence']:8.3f} us per sentence "
+              f"({result['speedup']}x, {result['sentences']} sentences)")
+
+if __name__ == '__main__':
+    main()
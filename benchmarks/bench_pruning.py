@@ -0,0 +1,143 @@
+"""
+Measure MaxScore pruning against exhaustive scoring as queries grow longer
+
+A generated course (see benchmarks/corpus.py) is indexed, optionally
+repeated as several uploads to make a larger library, and queried with
+stretches of its own prose of increasing length, like long questions or the
+fixed queries of the flashcard and summary generators. Every query is
+expanded with related terms as the store would expand it (unless
+--no-expansion) and scored both exhaustively and with pruning
+(IndexSnapshot.top_scores); the benchmark checks that the rankings are
+identical and reports the latency of each, the speedup and the share of
+candidate chunks pruning skipped.
+
+Usage:
+    python -m benchmarks.bench_pruning [--pages 60] [--copies 4] [--lengths 2 4 8 12 16] [--no-expansion] [--json]
+"""
+import argparse
+import json
+import random
+import re
+import time
+
+from benchmarks.corpus import make_course_pdf
+from benchmarks.run_suite import percentile
+from pdf_processor import process_pdf
+from vector_store import SimpleDocStore, positioned_terms, split_into_documents
+
+def build_store(pages, copies, seed=0):
+    """A store holding the generated course once per copy, each copy as its own upload"""
+    pdf, _ = make_course_pdf(pages=pages, seed=seed)
+    document = process_pdf(pdf)
+    store = SimpleDocStore([], dedup=False, background_compaction=False)
+    for copy in range(copies):
+        docs = split_into_documents(document['text'], document['outline'])
+        for doc in docs:
+            doc.metadata['source'] = f"copy{copy}"
+        store.add_documents(docs)
+    return store, document['text']
+
+def make_queries(text, length, count, rng):
+    """Stretches of the course prose holding `length` query terms each"""
+    words = re.findall(r'\w+', text)
+    queries = []
+    while len(queries) < count:
+        start = rng.randrange(len(words))
+        query = []
+        for word in words[start:]:
+            query.append(word)
+            if len(positioned_terms(" ".join(query))) >= length:
+                queries.append(" ".join(query))
+                break
+    return queries
+
+def run(store, text, lengths, queries=50, k=4, repeat=3, seed=0, expansion=True):
+    """
+    Time exhaustive and pruned scoring for each query length
+    
+    Args:
+        store (SimpleDocStore): The store to query
+        text (str): Text the queries are drawn from
+        lengths (list): Numbers of query terms
+        queries (int): Queries per length
+        k (int): Results per query
+        repeat (int): Runs per query and mode; the fastest counts
+        seed (int): Random seed of the queries
+        expansion (bool): Expand the queries with related terms (see IndexSnapshot.expand_terms)
+    
+    Returns:
+        list: One result dict per length
+    """
+    rng = random.Random(seed)
+    snapshot = store.snapshot()
+    rows = []
+    for length in lengths:
+        timings = {False: [], True: []}
+        scored = {False: 0, True: 0}
+        mismatches = 0
+        for query in make_queries(text, length, queries, rng):
+            positioned = positioned_terms(query)
+            terms = [term for term, _ in positioned]
+            offsets = [position for _, position in positioned]
+            expansions = snapshot.expand_terms(terms) if expansion else None
+            rankings = {}
+            for prune in (False, True):
+                best = None
+                for _ in range(repeat):
+                    started = time.perf_counter()
+                    ranking, scored_count = snapshot.top_scores(terms, k + 1, offsets=offsets, prune=prune,
+                                                                expansions=expansions)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                timings[prune].append(best * 1000)
+                scored[prune] += scored_count
+                rankings[prune] = ranking
+            if rankings[False] != rankings[True]:
+                mismatches += 1
+        
+        exhaustive_ms = percentile(timings[False], 0.5)
+        pruned_ms = percentile(timings[True], 0.5)
+        rows.append({
+            'terms': length,
+            'exhaustive_p50_ms': round(exhaustive_ms, 4),
+            'pruned_p50_ms': round(pruned_ms, 4),
+            'exhaustive_p95_ms': round(percentile(timings[False], 0.95), 4),
+            'pruned_p95_ms': round(percentile(timings[True], 0.95), 4),
+            'speedup': round(exhaustive_ms / pruned_ms, 2) if pruned_ms else None,
+            'chunks_skipped': round(1 - scored[True] / scored[False], 4) if scored[False] else 0.0,
+            'mismatches': mismatches,
+        })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=60, help='Pages of the generated course')
+    parser.add_argument('--copies', type=int, default=4, help='Uploads of the course in the library')
+    parser.add_argument('--lengths', nargs='+', type=int, default=[2, 4, 8, 12, 16], help='Query terms per query')
+    parser.add_argument('--queries', type=int, default=50, help='Queries per length')
+    parser.add_argument('--k', type=int, default=4, help='Results per query')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per query and mode')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the course and the queries')
+    parser.add_argument('--no-expansion', action='store_true', help='Score the query terms only')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    store, text = build_store(args.pages, args.copies, args.seed)
+    rows = run(store, text, args.lengths, args.queries, args.k, args.repeat, args.seed, not args.no_expansion)
+    
+    if args.json:
+        print(json.dumps({'chunks': len(store.documents), 'results': rows}, indent=2))
+    else:
+        print(f"{len(store.documents)} chunks, {args.queries} queries per length, top {args.k}")
+        for row in rows:
+            print(f"  {row['terms']:>3} terms: exhaustive {row['exhaustive_p50_ms']:.3f} ms, "
+                  f"pruned {row['pruned_p50_ms']:.3f} ms (x{row['speedup']}), "
+                  f"{row['chunks_skipped']:.0%} of chunks skipped")
+    
+    mismatches = sum(row['mismatches'] for row in rows)
+    if mismatches:
+        print(f"Error: {mismatches} pruned rankings differ from exhaustive scoring")
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Measure ingest and query cost as a library grows
+
+Uploads are simulated as batches of chunks added one after another. After
+every interval of batches the benchmark reports ingest throughput, query
+latency percentiles and the segment layout, once per merge fanout, so the
+tiered merge policy can be compared with leaving every upload in its own
+segment (fanout 0).
+
+Usage:
+    python -m benchmarks.bench_segments [--batches 400] [--batch-size 25] [--fanouts 4 0] [--json]
+"""
+import argparse
+import json
+import random
+import time
+from collections import Counter
+
+from langchain.docstore.document import Document
+
+from segments import segment_tier
+from vector_store import SimpleDocStore
+
+WORDS = ("cell membrane protein energy glucose enzyme reaction molecule structure function "
+         "transport diffusion gradient water oxygen carbon nucleus ribosome lipid osmosis "
+         "photosynthesis respiration chlorophyll mitochondria chromosome gene mutation species "
+         "population ecosystem predator nutrient hormone neuron synapse antibody virus bacteria").split()
+
+def make_batch(rng, batch, size):
+    """Chunks of one simulated upload"""
+    docs = []
+    for _ in range(size):
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(12)).capitalize() + "." for _ in range(5)]
+        docs.append(Document(page_content=" ".join(sentences), metadata={'source': f"upload{batch}"}))
+    return docs
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run(fanout, batches, batch_size, interval, queries, seed=0):
+    """
+    Grow a store batch by batch and sample its performance
+    
+    Args:
+        fanout (int): Merge fanout of the store (0 disables merging)
+        batches (int): Number of uploads to add
+        batch_size (int): Chunks per upload
+        interval (int): Batches between measurements
+        queries (int): Queries timed at each measurement
+        seed (int): Random seed
+    
+    Returns:
+        dict: Per-interval samples and totals
+    """
+    rng = random.Random(seed)
+    query_rng = random.Random(seed + 1)
+    # Merges run inline so their cost is part of the measured ingest time
+    store = SimpleDocStore([], dedup=False, background_compaction=False, merge_fanout=fanout)
+    
+    samples = []
+    ingest_seconds = 0.0
+    for start in range(0, batches, interval):
+        count = min(interval, batches - start)
+        docs = [make_batch(rng, batch, batch_size) for batch in range(start, start + count)]
+        
+        started = time.perf_counter()
+        for batch_docs in docs:
+            store.add_documents(batch_docs)
+        elapsed = time.perf_counter() - started
+        ingest_seconds += elapsed
+        
+        latencies = []
+        for _ in range(queries):
+            query = " ".join(query_rng.sample(WORDS, 3))
+            started = time.perf_counter()
+            store.get_relevant_documents(query, k=4)
+            latencies.append((time.perf_counter() - started) * 1000)
+        
+        snapshot = store.snapshot()
+        tiers = Counter(segment_tier(segment) for segment in snapshot.segments)
+        samples.append({
+            'chunks': snapshot.size,
+            'segments': len(snapshot.segments),
+            'tiers': {str(tier): tiers[tier] for tier in sorted(tiers)},
+            'ingest_chunks_per_s': round(count * batch_size / elapsed, 1) if elapsed else 0.0,
+            'query_ms_p50': round(percentile(latencies, 0.5), 3),
+            'query_ms_p99': round(percentile(latencies, 0.99), 3),
+        })
+    
+    return {
+        'fanout': fanout,
+        'chunks': store.snapshot().size,
+        'segments': len(store.snapshot().segments),
+        'ingest_seconds': round(ingest_seconds, 3),
+        'ingest_chunks_per_s': round(batches * batch_size / ingest_seconds, 1) if ingest_seconds else 0.0,
+        'samples': samples,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--batches', type=int, default=400, help='Number of uploads to add')
+    parser.add_argument('--batch-size', type=int, default=25, help='Chunks per upload')
+    parser.add_argument('--interval', type=int, default=50, help='Uploads between measurements')
+    parser.add_argument('--queries', type=int, default=200, help='Queries timed per measurement')
+    parser.add_argument('--fanouts', type=int, nargs='+', default=[4, 0],
+                        help='Merge fanouts to compare (0 never merges)')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    results = [run(fanout, args.batches, args.batch_size, args.interval, args.queries)
+               for fanout in args.fanouts]
+    
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    
+    for result in results:
+        print(f"fanout {result['fanout']}: {result['chunks']} chunks in {result['segments']} segments, "
+              f"{result['ingest_chunks_per_s']} chunks/s overall")
+        print(f"  {'chunks':>8} {'segments':>8} {'chunks/s':>10} {'p50 ms':>8} {'p99 ms':>8}  tiers")
+        for sample in result['samples']:
+            tiers = " ".join(f"{tier}:{count}" for tier, count in sample['tiers'].items())
+            print(f"  {sample['chunks']:>8} {sample['segments']:>8} {sample['ingest_chunks_per_s']:>10} "
+                  f"{sample['query_ms_p50']:>8} {sample['query_ms_p99']:>8}  {tiers}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+Compare in-process query scoring with the sharded process-pool executor
+
+Builds a synthetic library, then times the same queries scored in the
+store's own process and through ShardedQueryExecutor with different worker
+counts. Every sharded ranking is checked against the in-process one.
+
+Usage:
+    python -m benchmarks.bench_sharding [--chunks 200000] [--workers 1 2 4] [--queries 200] [--json]
+"""
+import argparse
+import json
+import random
+import time
+
+from langchain.docstore.document import Document
+
+from sharded_search import ShardedQueryExecutor
+from vector_store import SimpleDocStore
+
+def make_vocabulary(size, seed):
+    """Made-up words, so term frequencies follow a long tail like real text"""
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(size)]
+
+def build_store(chunk_count, vocabulary, seed, batch_size=5000):
+    """A store of random chunks, added in upload-sized batches"""
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    store = SimpleDocStore([], dedup=False, background_compaction=False)
+    for start in range(0, chunk_count, batch_size):
+        docs = [Document(page_content=" ".join(rng.choices(vocabulary, weights, k=60)),
+                         metadata={'source': f"upload{start // batch_size}"})
+                for _ in range(min(batch_size, chunk_count - start))]
+        store.add_documents(docs)
+    return store
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def time_queries(store, queries, k):
+    """Run the queries and return (result ids, latencies in ms)"""
+    results = []
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        docs = store.get_relevant_documents(query, k=k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        results.append([id(doc) for doc in docs])
+    return results, latencies
+
+def run(chunk_count, worker_counts, query_count, k, seed=0):
+    """Time the in-process scorer and each executor size on the same queries"""
+    vocabulary = make_vocabulary(5000, seed)
+    started = time.perf_counter()
+    store = build_store(chunk_count, vocabulary, seed)
+    build_seconds = time.perf_counter() - started
+    
+    rng = random.Random(seed + 1)
+    # Mid-frequency terms, so queries touch a sizeable part of the corpus
+    queries = [" ".join(rng.sample(vocabulary[20:500], 3)) for _ in range(query_count)]
+    
+    expected, latencies = time_queries(store, queries, k)
+    rows = [{'workers': 0, 'latency_ms_p50': round(percentile(latencies, 0.5), 3),
+             'latency_ms_p99': round(percentile(latencies, 0.99), 3), 'mismatches': 0}]
+    
+    for workers in worker_counts:
+        executor = ShardedQueryExecutor(workers=workers)
+        store.query_executor = executor
+        try:
+            started = time.perf_counter()
+            store.get_relevant_documents(queries[0], k=k)  # Packs the shards
+            pack_seconds = time.perf_counter() - started
+            results, latencies = time_queries(store, queries, k)
+        finally:
+            store.query_executor = None
+            executor.close()
+        rows.append({
+            'workers': workers,
+            'pack_seconds': round(pack_seconds, 3),
+            'latency_ms_p50': round(percentile(latencies, 0.5), 3),
+            'latency_ms_p99': round(percentile(latencies, 0.99), 3),
+            'mismatches': sum(1 for got, want in zip(results, expected) if got != want),
+        })
+    
+    return {'chunks': chunk_count, 'build_seconds': round(build_seconds, 3), 'queries': query_count,
+            'k': k, 'results': rows}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=200000, help='Number of chunks in the library')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Worker counts to try')
+    parser.add_argument('--queries', type=int, default=200, help='Number of queries')
+    parser.add_argument('-k', type=int, default=4, help='Results per query')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    result = run(args.chunks, args.workers, args.queries, args.k)
+    
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['chunks']} chunks indexed in {result['build_seconds']} s")
+        for row in result['results']:
+            name = "in-process" if row['workers'] == 0 else f"{row['workers']} workers"
+            packing = f", packed in {row['pack_seconds']} s" if 'pack_seconds' in row else ""
+            print(f"  {name:>12}: p50 {row['latency_ms_p50']} ms, p99 {row['latency_ms_p99']} ms, "
+                  f"{row['mismatches']} mismatches{packing}")
+    
+    if any(row['mismatches'] for row in result['results']):
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
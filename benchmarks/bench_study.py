@@ -0,0 +1,143 @@
+"""
+Measure study log replay before and after compaction, and check they agree
+
+A scheduler studies a synthetic set of decks over simulated days, appending
+one review record per answer. The log is then reopened, which compacts it
+when reviews dominate (otherwise it is compacted explicitly), and reopened
+once more from the compacted form.
+Both reopened schedulers must report the same stats() and due_cards() as
+the one that wrote the log; any difference is printed and fails the run.
+
+Usage:
+    python -m benchmarks.bench_study [--cards 2000] [--days 60] [--decks 4] [--json]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from study_scheduler import StudyScheduler
+
+START = 1_700_000_000.0
+DAY_SECONDS = 86400
+
+def study(path, cards, days, decks, seed=0):
+    """
+    Build a log by reviewing every due card once a day
+    
+    Returns:
+        StudyScheduler: The scheduler that wrote the log
+    """
+    rng = random.Random(seed)
+    scheduler = StudyScheduler(path)
+    for deck in range(decks):
+        flashcards = [{'question': f"Question {deck}-{number}?", 'answer': f"Answer {deck}-{number}."}
+                      for number in range(cards // decks)]
+        scheduler.add_cards(f"deck{deck}", flashcards, now=START)
+    
+    for day in range(days):
+        now = START + day * DAY_SECONDS
+        # Relearned cards come back within the same session
+        for _ in range(3):
+            due = scheduler.due_cards(limit=len(scheduler.cards), now=now)
+            if not due:
+                break
+            for card in due:
+                grade = rng.choices((1, 3, 4, 5), weights=(2, 2, 5, 1))[0]
+                scheduler.review(card['card_id'], grade, now=now)
+    return scheduler
+
+def snapshot(scheduler, decks, now):
+    """stats() and due_cards() of every deck (and of all decks) at one time"""
+    result = {}
+    for deck in [None] + [f"deck{deck}" for deck in range(decks)]:
+        result[str(deck)] = {
+            'stats': scheduler.stats(deck=deck, now=now),
+            'due': scheduler.due_cards(limit=len(scheduler.cards), deck=deck, now=now),
+        }
+    return result
+
+def differences(expected, actual):
+    """Human-readable differences between two snapshots"""
+    messages = []
+    for deck, wanted in expected.items():
+        got = actual.get(deck)
+        if got is None:
+            messages.append(f"deck {deck} missing")
+            continue
+        if got['stats'] != wanted['stats']:
+            messages.append(f"deck {deck}: stats {got['stats']} != {wanted['stats']}")
+        if got['due'] != wanted['due']:
+            messages.append(f"deck {deck}: {len(got['due'])} due cards differ from the "
+                            f"{len(wanted['due'])} expected")
+    return messages
+
+def run(cards=2000, days=60, decks=4, seed=0):
+    """Study, then reopen the log twice; returns sizes, timings and any differences"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'study.log')
+        writer = study(path, cards, days, decks, seed)
+        # Check a range of times, so due and learned cards both show up
+        times = [START + day * DAY_SECONDS for day in (days - 1, days, days + 7, days + 60)]
+        expected = [snapshot(writer, decks, now) for now in times]
+        log_bytes = os.path.getsize(path)
+        
+        start = time.perf_counter()
+        reopened = StudyScheduler(path)
+        open_s = time.perf_counter() - start
+        auto_compacted = os.path.getsize(path) < log_bytes
+        if not auto_compacted:
+            reopened.compact()
+        compacted_bytes = os.path.getsize(path)
+        
+        start = time.perf_counter()
+        compacted = StudyScheduler(path)
+        compacted_open_s = time.perf_counter() - start
+        
+        messages = []
+        for label, scheduler in (('reopened', reopened), ('compacted', compacted)):
+            for now, wanted in zip(times, expected):
+                messages += [f"{label} at day {(now - START) / DAY_SECONDS:.0f}: {message}"
+                             for message in differences(wanted, snapshot(scheduler, decks, now))]
+    
+    return {
+        'cards': len(writer.cards),
+        'log_bytes': log_bytes,
+        'compacted_bytes': compacted_bytes,
+        'auto_compacted': auto_compacted,
+        'open_s': round(open_s, 4),
+        'compacted_open_s': round(compacted_open_s, 4),
+        'difference_count': len(messages),
+        'differences': messages,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--cards', type=int, default=2000, help='Cards across all decks')
+    parser.add_argument('--days', type=int, default=60, help='Simulated days of study')
+    parser.add_argument('--decks', type=int, default=4, help='Number of decks')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the simulated grades')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    result = run(args.cards, args.days, args.decks, args.seed)
+    
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['cards']} cards, log {result['log_bytes']} bytes, "
+              f"compacted {result['compacted_bytes']} bytes")
+        print(f"open ({'replay + compaction' if result['auto_compacted'] else 'replay, not compacted'}): "
+              f"{result['open_s']} s, "
+              f"open compacted: {result['compacted_open_s']} s")
+        print(f"differences: {result['difference_count']}")
+        for message in result['differences']:
+            print(f"  {message}")
+    
+    if result['difference_count']:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""
+Deterministic generator of synthetic course PDFs
+
+Each course has numbered chapter and section headings (also written as PDF
+bookmarks), definition sentences ("X is defined as ..."), dated facts,
+filler prose with Zipf-distributed word frequencies, and a running header
+and footer repeated on every page. The same arguments always give the same
+bytes, so benchmark runs on different machines or commits see identical
+input. The PDF is written directly, with no dependency beyond the standard
+library.
+
+Usage:
+    python -m benchmarks.corpus course.pdf [--pages 60] [--seed 0] [--definitions 2] [--no-boilerplate]
+"""
+import argparse
+import random
+
+WORDS = ("cell membrane protein energy glucose enzyme reaction molecule structure function "
+         "transport diffusion gradient water oxygen carbon nucleus ribosome lipid osmosis "
+         "photosynthesis respiration chlorophyll mitochondria chromosome gene mutation species "
+         "population ecosystem predator nutrient hormone neuron synapse antibody virus bacteria "
+         "tissue organ signal receptor pathway membrane channel pressure temperature balance").split()
+
+TOPICS = ("Cell Biology", "Genetics", "Metabolism", "Ecology", "Evolution", "Physiology",
+          "Immunology", "Neuroscience", "Microbiology", "Botany", "Biochemistry", "Anatomy")
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ra", "to", "vi", "su", "de", "po", "gu", "ze", "ba", "fi", "ho", "ju"]
+
+LINES_PER_PAGE = 40
+LINE_HEIGHT = 14
+FILLER_VOCABULARY = 3000
+SUBJECT_WORD_SHARE = 0.1  # Share of prose words taken from WORDS
+
+def make_term(rng):
+    """A made-up two-word concept name, so definitions are unique to the corpus"""
+    first = "".join(rng.choice(SYLLABLES) for _ in range(3)).capitalize()
+    return f"{first} {rng.choice(WORDS).capitalize()}"
+
+def make_vocabulary(rng, size=FILLER_VOCABULARY):
+    """
+    Made-up filler words with Zipf-like frequencies, as in natural prose
+    
+    Returns:
+        tuple: (words, cumulative weights for random.choices)
+    """
+    words = sorted({"".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(size)})
+    rng.shuffle(words)
+    cumulative = []
+    total = 0.0
+    for rank in range(len(words)):
+        total += 1 / (rank + 1)
+        cumulative.append(total)
+    return words, cumulative
+
+def prose_line(rng, vocabulary):
+    """A line of filler prose, mostly filler words with some subject words"""
+    words, cumulative = vocabulary
+    line = [rng.choice(WORDS) if rng.random() < SUBJECT_WORD_SHARE else rng.choices(words, cum_weights=cumulative)[0]
+            for _ in range(rng.randint(9, 13))]
+    return " ".join(line).capitalize() + "."
+
+def generate_course(pages=60, seed=0, definitions_per_page=2, pages_per_chapter=6, boilerplate=True,
+                    course="BIO 101"):
+    """
+    Generate the text of a synthetic course
+    
+    Args:
+        pages (int): Number of pages
+        seed (int): Random seed; equal seeds give equal courses
+        definitions_per_page (int): Definition sentences on each page
+        pages_per_chapter (int): Pages between chapter headings (sections start halfway)
+        boilerplate (bool): Add a running header and a numbered footer to every page
+        course (str): Course code used in the header
+    
+    Returns:
+        dict: 'pages' (lines of each page), 'headings' ((title, level, page) tuples),
+              'definitions' ((term, definition, page) tuples)
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    page_lines = []
+    headings = []
+    definitions = []
+    chapter = 0
+    section = 0
+    
+    for page in range(pages):
+        lines = []
+        if boilerplate:
+            lines.append(f"{course} - Introduction to Biology - Lecture Notes")
+        
+        if page % pages_per_chapter == 0:
+            chapter += 1
+            section = 0
+            title = f"{chapter}. {TOPICS[(chapter - 1) % len(TOPICS)]}"
+            lines.append(title)
+            headings.append((title, 0, page))
+        elif page % pages_per_chapter == pages_per_chapter // 2:
+            section += 1
+            title = f"{chapter}.{section} {rng.choice(WORDS).capitalize()} and {rng.choice(WORDS).capitalize()}"
+            lines.append(title)
+            headings.append((title, 1, page))
+        
+        body = [prose_line(rng, vocabulary) for _ in range(LINES_PER_PAGE - len(lines) - 2)]
+        for _ in range(definitions_per_page):
+            term = make_term(rng)
+            # Definitions of a few lengths, like real ones
+            definition = f"the {rng.choice(WORDS)} of {rng.choice(WORDS)}"
+            if rng.random() < 0.5:
+                definition += f" in {rng.choice(['the ', ''])}{rng.choice(WORDS)}"
+            body[rng.randrange(len(body))] = f"{term} is defined as {definition}."
+            definitions.append((term, definition, page))
+        body[rng.randrange(len(body))] = (f"In {rng.randint(1850, 2020)} the {rng.choice(WORDS)} "
+                                          f"rate rose by {rng.randint(2, 90)} percent.")
+        lines.extend(body)
+        
+        if boilerplate:
+            lines.append(f"Page {page + 1} of {pages}")
+        page_lines.append(lines)
+    
+    # Definitions can be overwritten by later ones on the same line; keep those that survived
+    definitions = [(term, definition, page) for term, definition, page in definitions
+                   if f"{term} is defined as {definition}." in page_lines[page]]
+    return {'pages': page_lines, 'headings': headings, 'definitions': definitions}
+
+def _escape(text):
+    """Escape a string for a PDF literal"""
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def render_pdf(course):
+    """
+    Write a generated course as PDF bytes
+    
+    Args:
+        course (dict): Result of generate_course
+    
+    Returns:
+        bytes: The PDF file
+    """
+    page_lines = course['pages']
+    headings = course['headings']
+    page_count = len(page_lines)
+    
+    # Object numbers: 1 catalog, 2 page tree, 3 font, 4 bold font, 5 outline root,
+    # then a page and a content stream per page, then one object per bookmark
+    first_page = 6
+    first_bookmark = first_page + 2 * page_count
+    objects = {}
+    outline = " /Outlines 5 0 R /PageMode /UseOutlines" if headings else ""
+    objects[1] = f"<< /Type /Catalog /Pages 2 0 R{outline} >>".encode()
+    kids = " ".join(f"{first_page + 2 * i} 0 R" for i in range(page_count))
+    objects[2] = f"<< /Type /Pages /Kids [{kids}] /Count {page_count} >>".encode()
+    objects[3] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    objects[4] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold >>"
+    
+    heading_titles = {title for title, _, _ in headings}
+    for i, lines in enumerate(page_lines):
+        commands = []
+        y = 770
+        for line in lines:
+            font = "/F2 13" if line in heading_titles else "/F1 10"
+            commands.append(f"BT {font} Tf 60 {y} Td ({_escape(line)}) Tj ET")
+            y -= LINE_HEIGHT
+        stream = "\n".join(commands).encode('latin-1', errors='replace')
+        page_object = first_page + 2 * i
+        objects[page_object] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                                f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> "
+                                f"/Contents {page_object + 1} 0 R >>").encode()
+        objects[page_object + 1] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+    
+    # Bookmarks: chapters at the top level, sections nested under their chapter
+    chapters = []
+    for number, (title, level, page) in enumerate(headings):
+        entry = {'object': first_bookmark + number, 'title': title, 'page': page, 'children': []}
+        if level == 0 or not chapters:
+            chapters.append(entry)
+        else:
+            chapters[-1]['children'].append(entry)
+    
+    def write_level(entries, parent):
+        for i, entry in enumerate(entries):
+            links = f"/Parent {parent} 0 R"
+            if i > 0:
+                links += f" /Prev {entries[i - 1]['object']} 0 R"
+            if i < len(entries) - 1:
+                links += f" /Next {entries[i + 1]['object']} 0 R"
+            children = entry['children']
+            if children:
+                links += (f" /First {children[0]['object']} 0 R /Last {children[-1]['object']} 0 R "
+                          f"/Count {len(children)}")
+                write_level(children, entry['object'])
+            objects[entry['object']] = (f"<< /Title ({_escape(entry['title'])}) {links} "
+                                        f"/Dest [{first_page + 2 * entry['page']} 0 R /XYZ 0 792 0] >>").encode()
+    
+    if chapters:
+        objects[5] = (f"<< /Type /Outlines /First {chapters[0]['object']} 0 R "
+                      f"/Last {chapters[-1]['object']} 0 R /Count {len(chapters)} >>").encode()
+        write_level(chapters, 5)
+    else:
+        objects[5] = b"<< /Type /Outlines /Count 0 >>"
+    
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(output)
+        output += b"%d 0 obj\n" % number + objects[number] + b"\nendobj\n"
+    xref = len(output)
+    size = max(objects) + 1
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for number in range(1, size):
+        output += b"%010d 00000 n \n" % offsets[number]
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref)
+    return bytes(output)
+
+def make_course_pdf(path=None, **options):
+    """
+    Generate a course and write it as a PDF
+    
+    Args:
+        path (str, optional): File to write; only the bytes are returned if omitted
+        **options: Arguments of generate_course
+    
+    Returns:
+        tuple: (PDF bytes, the generated course)
+    """
+    course = generate_course(**options)
+    data = render_pdf(course)
+    if path is not None:
+        with open(path, 'wb') as f:
+            f.write(data)
+    return data, course
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('output', help='PDF file to write')
+    parser.add_argument('--pages', type=int, default=60, help='Number of pages')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--definitions', type=int, default=2, help='Definitions per page')
+    parser.add_argument('--pages-per-chapter', type=int, default=6, help='Pages between chapter headings')
+    parser.add_argument('--no-boilerplate', action='store_true', help='Leave out the running header and footer')
+    args = parser.parse_args()
+    
+    data, course = make_course_pdf(args.output, pages=args.pages, seed=args.seed,
+                                   definitions_per_page=args.definitions,
+                                   pages_per_chapter=args.pages_per_chapter,
+                                   boilerplate=not args.no_boilerplate)
+    print(f"Wrote {args.output}: {args.pages} pages, {len(course['headings'])} headings, "
+          f"{len(course['definitions'])} definitions, {len(data)} bytes")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+"""
+Evaluate retrieval quality and latency against a golden set
+
+A golden set is a JSON file of questions, each labelled with the passages
+that answer it:
+
+    {"document": "course.pdf",
+     "queries": [{"question": "What is osmosis?", "passages": ["Osmosis is defined as ..."]}]}
+
+A retrieved chunk is relevant when it contains a labelled passage (compared
+on lower-cased words, so whitespace and punctuation changes from cleaning do
+not matter). Each passage counts once, at the rank of the first chunk that
+contains it. For every backend the harness reports recall@k, MRR and nDCG@k
+with p50/p95/p99 query latency, and the differences from the first backend
+in the run, so a faster backend that retrieves worse shows up at once.
+
+Without --golden, a synthetic course is generated (see benchmarks/corpus.py)
+and its definition sentences are the labels.
+
+Usage:
+    python -m benchmarks.evaluate_retrieval [--backends simple packed sharded] [--k 1 4 10] [--json]
+    python -m benchmarks.evaluate_retrieval --golden golden.json [--pdf course.pdf] [--max-drop 0.01]
+    python -m benchmarks.evaluate_retrieval --write-golden golden.json [--pages 60]
+"""
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from benchmarks.corpus import make_course_pdf
+from benchmarks.run_suite import percentile
+from pdf_processor import process_pdf
+from sharded_search import ShardedQueryExecutor
+from vector_store import PackedDocStore, create_vector_store, get_retriever
+
+# Metrics where the harness compares backends (and --max-drop applies)
+QUALITY_PREFIXES = ('recall@', 'mrr', 'ndcg@')
+
+def normalize(text):
+    """Lower-cased words of a text, for matching passages against chunks"""
+    return " ".join(re.findall(r'\w+', text.lower()))
+
+def golden_from_course(course, document=None):
+    """
+    Golden set of a generated course: "What is X?" for each definition
+    
+    Args:
+        course (dict): Result of benchmarks.corpus.generate_course
+        document (str, optional): PDF file name recorded in the golden set
+    
+    Returns:
+        dict: The golden set
+    """
+    return {
+        'document': document,
+        'queries': [{'question': f"What is {term}?", 'passages': [f"{term} is defined as {definition}."]}
+                    for term, definition, _ in course['definitions']],
+    }
+
+def simple_backend(document, k):
+    """The in-memory SimpleDocStore"""
+    store = create_vector_store(document['text'], outline=document['outline'],
+                                page_offsets=document['page_offsets'], source="golden")
+    return get_retriever(store, {"k": k}), None
+
+def packed_backend(document, k):
+    """A SimpleDocStore saved as a packed index file and reopened (PackedDocStore)"""
+    store = create_vector_store(document['text'], outline=document['outline'],
+                                page_offsets=document['page_offsets'], source="golden")
+    handle, path = tempfile.mkstemp(suffix='.pack')
+    os.close(handle)
+    store.save_packed(path)
+    packed = PackedDocStore(path)
+    
+    def close():
+        packed.snapshot().close()
+        os.remove(path)
+    return get_retriever(packed, {"k": k}), close
+
+def sqlite_backend(document, k):
+    """An SQLiteDocStore in a temporary database file (FTS5 BM25 ranking)"""
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'index.sqlite')
+    store = create_vector_store(document['text'], outline=document['outline'],
+                                page_offsets=document['page_offsets'], source="golden", path=path)
+    
+    def close():
+        store.close()
+        shutil.rmtree(directory)
+    return get_retriever(store, {"k": k}), close
+
+def sharded_backend(document, k, workers=2):
+    """A SimpleDocStore scoring queries in worker processes (ShardedQueryExecutor)"""
+    store = create_vector_store(document['text'], outline=document['outline'],
+                                page_offsets=document['page_offsets'], source="golden")
+    store.query_executor = ShardedQueryExecutor(workers=workers)
+    return get_retriever(store, {"k": k}), store.query_executor.close
+
+# Name -> function(document, k) returning (retriever bound to k results, close function or None)
+BACKENDS = {
+    'simple': simple_backend,
+    'packed': packed_backend,
+    'sharded': sharded_backend,
+    'sqlite': sqlite_backend,
+}
+
+def score_ranking(docs, passages, ks):
+    """
+    Quality metrics of one ranked result list
+    
+    Args:
+        docs (list): Retrieved Documents, best first
+        passages (list): Normalized relevant passages
+        ks (list): Cut-offs for recall and nDCG
+    
+    Returns:
+        dict: 'recall@k' and 'ndcg@k' for each k, and 'mrr'
+    """
+    # Rank (1-based) at which each passage is first retrieved
+    found = {}
+    for rank, doc in enumerate(docs, start=1):
+        content = normalize(doc.page_content)
+        for number, passage in enumerate(passages):
+            if number not in found and passage in content:
+                found[number] = rank
+    
+    ranks = sorted(found.values())
+    scores = {'mrr': 1 / ranks[0] if ranks else 0.0}
+    for k in ks:
+        hits = [rank for rank in ranks if rank <= k]
+        scores[f"recall@{k}"] = len(hits) / len(passages) if passages else 0.0
+        # Binary gains; the ideal ranking puts every passage at the top
+        dcg = sum(1 / math.log2(rank + 1) for rank in hits)
+        ideal = sum(1 / math.log2(rank + 1) for rank in range(1, min(k, len(passages)) + 1))
+        scores[f"ndcg@{k}"] = dcg / ideal if ideal else 0.0
+    return scores
+
+def evaluate(retriever, golden, ks=(1, 4, 10), repeat=1):
+    """
+    Evaluate a retriever against a golden set
+    
+    Args:
+        retriever: Any object with get_relevant_documents(question), returning at least max(ks) results
+        golden (dict): The golden set
+        ks (tuple): Cut-offs for recall and nDCG
+        repeat (int): Times each question is asked; latency percentiles cover every call
+    
+    Returns:
+        dict: Mean quality metrics, 'p50_ms', 'p95_ms', 'p99_ms' and 'queries'
+    """
+    totals = {}
+    latencies = []
+    queries = [query for query in golden['queries'] if query['passages']]
+    
+    for query in queries:
+        passages = [normalize(passage) for passage in query['passages']]
+        for _ in range(repeat):
+            started = time.perf_counter()
+            docs = retriever.get_relevant_documents(query['question'])
+            latencies.append((time.perf_counter() - started) * 1000)
+        for name, value in score_ranking(docs, passages, ks).items():
+            totals[name] = totals.get(name, 0.0) + value
+    
+    count = max(len(queries), 1)
+    result = {'queries': len(queries)}
+    for name, total in totals.items():
+        result[name] = round(total / count, 4)
+    result['p50_ms'] = round(percentile(latencies, 0.50), 4)
+    result['p95_ms'] = round(percentile(latencies, 0.95), 4)
+    result['p99_ms'] = round(percentile(latencies, 0.99), 4)
+    return result
+
+def run(document, golden, backends, ks=(1, 4, 10), repeat=3):
+    """
+    Build every backend on the same document and evaluate it
+    
+    Args:
+        document (dict): Result of process_pdf
+        golden (dict): The golden set
+        backends (list): Names in BACKENDS
+        ks (tuple): Cut-offs for recall and nDCG
+        repeat (int): Times each question is asked
+    
+    Returns:
+        list: One result dict per backend; all but the first have 'delta' entries
+              (difference from the first backend) for the quality metrics
+    """
+    rows = []
+    for name in backends:
+        started = time.perf_counter()
+        retriever, close = BACKENDS[name](document, max(ks))
+        build_s = time.perf_counter() - started
+        try:
+            row = {'backend': name, 'build_s': round(build_s, 4)}
+            row.update(evaluate(retriever, golden, ks, repeat))
+        finally:
+            if close is not None:
+                close()
+        rows.append(row)
+    
+    reference = rows[0] if rows else None
+    for row in rows[1:]:
+        row['delta'] = {metric: round(value - reference[metric], 4) for metric, value in row.items()
+                        if metric.startswith(QUALITY_PREFIXES)}
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--golden', help='Golden set JSON (default: generated from a synthetic course)')
+    parser.add_argument('--pdf', help="Document to index (default: the golden set's 'document', next to it)")
+    parser.add_argument('--write-golden', help='Write the generated golden set (and its PDF next to it) and exit')
+    parser.add_argument('--pages', type=int, default=60, help='Pages of the generated course')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated course')
+    parser.add_argument('--backends', nargs='+', default=['simple'], choices=sorted(BACKENDS),
+                        help='Backends to evaluate; the first is the reference for the deltas')
+    parser.add_argument('--k', nargs='+', type=int, default=[1, 4, 10], help='Cut-offs for recall and nDCG')
+    parser.add_argument('--repeat', type=int, default=3, help='Times each question is asked (for latency)')
+    parser.add_argument('--max-drop', type=float,
+                        help='Exit with status 1 if a quality metric drops by more than this against the reference')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    if args.golden:
+        with open(args.golden) as f:
+            golden = json.load(f)
+        pdf_path = args.pdf or os.path.join(os.path.dirname(args.golden), golden['document'])
+        document = process_pdf(pdf_path)
+    else:
+        pdf, course = make_course_pdf(pages=args.pages, seed=args.seed)
+        golden = golden_from_course(course, document="course.pdf")
+        if args.write_golden:
+            with open(os.path.join(os.path.dirname(args.write_golden), golden['document']), 'wb') as f:
+                f.write(pdf)
+            with open(args.write_golden, 'w') as f:
+                json.dump(golden, f, indent=2)
+            print(f"Wrote {args.write_golden}: {len(golden['queries'])} questions")
+            return
+        document = process_pdf(pdf)
+    
+    rows = run(document, golden, args.backends, tuple(sorted(args.k)), args.repeat)
+    
+    if args.json:
+        print(json.dumps({'queries': len(golden['queries']), 'k': sorted(args.k), 'results': rows}, indent=2))
+    else:
+        print(f"{len(golden['queries'])} questions, reference backend {rows[0]['backend']}")
+        for row in rows:
+            figures = ", ".join(f"{metric} {value}" for metric, value in row.items()
+                                if metric not in ('backend', 'delta', 'queries'))
+            print(f"  {row['backend']:>8}: {figures}")
+            drops = {metric: value for metric, value in row.get('delta', {}).items() if value}
+            if drops:
+                print(f"{'':>12}differences: " + ", ".join(f"{metric} {value:+}" for metric, value in drops.items()))
+    
+    if args.max_drop is not None:
+        dropped = [(row['backend'], metric, value) for row in rows for metric, value in row.get('delta', {}).items()
+                   if value < -args.max_drop]
+        for backend, metric, value in dropped:
+            print(f"Error: {backend} {metric} dropped by {-value} against {rows[0]['backend']}")
+        if dropped:
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Replay a profiled request offline against the same document and index
+
+Reads a profile report written by profiling.RequestProfiler, opens the packed
+index (and, for uploads, the PDF) saved next to it, runs the same request
+again under the profiler, and prints how long the original and the replay
+took. The replay writes its own profile, so the two flame graphs can be
+compared.
+
+Usage:
+    python -m benchmarks.replay_profile .profiles/<name>.json [--repeat 3] [--mode deterministic] [--json]
+"""
+import argparse
+import json
+import os
+import time
+
+from flashcard_generator import generate_flashcards
+from pdf_processor import process_pdf
+from profiling import PROFILE_MODES, RequestProfiler
+from qa_system import answer_question
+from sqlite_store import SQLiteDocStore, is_sqlite_file
+from summary_generator import generate_summaries
+from vector_store import PackedDocStore, create_vector_store, get_retriever
+
+def replay_request(report, store, source):
+    """Run the request a report describes once"""
+    details = report['details']
+    kind = report['kind']
+    if kind == 'upload':
+        document = process_pdf(source)
+        return create_vector_store(document['text'], outline=document['outline'],
+                                   page_offsets=document['page_offsets'], source=details.get('file_name'))
+    retriever = get_retriever(store, details.get('search_kwargs'))
+    if kind == 'query':
+        return answer_question(report['query'], retriever)
+    if kind == 'flashcards':
+        return generate_flashcards(store.text, retriever, topic=details.get('topic'))
+    if kind == 'summaries':
+        return generate_summaries(store.text, retriever)
+    raise ValueError(f"Cannot replay a {kind!r} request")
+
+def replay(report_path, repeat=3, mode=None, directory=None):
+    """
+    Replay a profiled request
+    
+    Args:
+        report_path (str): The profile report (.json)
+        repeat (int): Unprofiled runs to time
+        mode (str, optional): Profiler mode of the replay (default: the original's)
+        directory (str, optional): Where the replay's profile is written (default: next to the report)
+    
+    Returns:
+        dict: Original and replayed durations and the replay's profile report
+    """
+    with open(report_path) as f:
+        report = json.load(f)
+    
+    # Replay files are named relative to the profile directory
+    directory = directory or os.path.dirname(report_path)
+    store = None
+    if report.get('index_path'):
+        index_path = os.path.join(os.path.dirname(report_path), report['index_path'])
+        store = SQLiteDocStore(index_path) if is_sqlite_file(index_path) else PackedDocStore(index_path)
+    source = None
+    if report.get('pdf_path'):
+        with open(os.path.join(os.path.dirname(report_path), report['pdf_path']), 'rb') as f:
+            source = f.read()
+    if store is None and report['kind'] != 'upload':
+        raise ValueError(f"{report_path} has no saved index to replay against")
+    
+    # Plain runs first, for timings unaffected by the profiler
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        replay_request(report, store, source)
+        times.append(time.perf_counter() - started)
+    
+    with RequestProfiler(f"replay-{report['kind']}", document_hash=report['document_hash'], query=report['query'],
+                         details=report['details'], directory=directory,
+                         mode=mode or report['mode']) as profiler:
+        replay_request(report, store, source)
+    
+    return {
+        'kind': report['kind'],
+        'query': report['query'],
+        'original_s': report['duration_s'],
+        'original_mode': report['mode'],
+        'replay_min_s': round(min(times), 6) if times else None,
+        'replay_profiled_s': profiler.report['duration_s'] if profiler.report else None,
+        'profile': profiler.report,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('report', help='Profile report (.json) to replay')
+    parser.add_argument('--repeat', type=int, default=3, help='Unprofiled runs to time')
+    parser.add_argument('--mode', choices=PROFILE_MODES, help='Profiler mode of the replay')
+    parser.add_argument('--directory', help='Where to write the replay profile')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    result = replay(args.report, args.repeat, args.mode, args.directory)
+    
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['kind']} {result['query']!r}")
+        print(f"  original: {result['original_s']:.4f} s ({result['original_mode']}, profiled)")
+        if result['replay_min_s'] is not None:
+            print(f"  replay:   {result['replay_min_s']:.4f} s (fastest unprofiled run)")
+        if result['profile']:
+            print(f"  replay profiled: {result['replay_profiled_s']:.4f} s -> {result['profile']['collapsed_path']}")
+
+if __name__ == '__main__':
+    main()
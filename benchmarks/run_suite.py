@@ -0,0 +1,235 @@
+"""
+End-to-end benchmark suite over a synthetic course PDF
+
+Generates a deterministic course (see benchmarks/corpus.py) and times each
+stage of the pipeline: extraction, header/footer stripping and cleaning,
+chunking (every strategy), indexing, retrieval, question answering,
+flashcards and summaries. Each stage runs several times; the fastest run
+is the figure compared between runs because it is the least affected by
+other load on the machine. A few quality figures (retrieval hit rate,
+chunk and card counts) are recorded next to the timings, so a speed-up
+that changes results is visible too.
+
+Results are JSON. Given a baseline from an earlier run, timings that got
+slower by more than the threshold, and quality figures that dropped, are
+flagged as regressions and the exit status is 1.
+
+Usage:
+    python -m benchmarks.run_suite [--pages 60] [--repeat 3] [--output results.json]
+    python -m benchmarks.run_suite --baseline results.json [--threshold 0.15] [--json]
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import time
+
+from benchmarks.corpus import make_course_pdf
+from chunking import CHUNKING_STRATEGIES
+from flashcard_generator import generate_flashcards
+from pdf_processor import join_cleaned_pages, process_pdf, strip_headers_footers
+from qa_system import answer_question
+from summary_generator import generate_summaries
+from vector_store import create_vector_store, get_retriever, split_into_documents
+
+RESULTS_VERSION = 1
+
+# Quality figures where a lower value is a regression (timings are always lower-is-better)
+HIGHER_IS_BETTER = {'retrieval.hit_rate', 'qa.hit_rate'}
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def timed(function, repeat):
+    """
+    Run a function several times
+    
+    Returns:
+        tuple: (result of the last run, {'min_s': ..., 'median_s': ...})
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - started)
+    return result, {'min_s': round(min(times), 6), 'median_s': round(statistics.median(times), 6)}
+
+def git_commit():
+    """Current commit of the working tree, if it is a git checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(pages=60, seed=0, repeat=3, queries=100):
+    """
+    Time every stage of the pipeline on a generated course
+    
+    Args:
+        pages (int): Pages of the generated course
+        seed (int): Seed of the generated course
+        repeat (int): Runs per stage
+        queries (int): Retrieval queries (and a third as many QA questions)
+    
+    Returns:
+        dict: Run information and a flat 'metrics' dict
+    """
+    pdf, course = make_course_pdf(pages=pages, seed=seed)
+    metrics = {}
+    
+    def record(stage, timing, **figures):
+        metrics[f"{stage}.min_s"] = timing['min_s']
+        metrics[f"{stage}.median_s"] = timing['median_s']
+        for name, value in figures.items():
+            metrics[f"{stage}.{name}"] = value
+    
+    # Extraction (PyPDF2 parsing, boilerplate stripping, cleaning and the outline)
+    document, timing = timed(lambda: process_pdf(pdf), repeat)
+    record('extraction', timing, pages=len(document['pages']), chars=len(document['text']))
+    
+    # Header/footer stripping and text cleaning on their own
+    raw_pages = document['raw_pages']
+    (text, page_offsets, _), timing = timed(
+        lambda: join_cleaned_pages(strip_headers_footers(raw_pages)[0]), repeat)
+    record('cleaning', timing)
+    text, page_offsets, outline = document['text'], document['page_offsets'], document['outline']
+    
+    for strategy in CHUNKING_STRATEGIES:
+        docs, timing = timed(lambda: split_into_documents(text, outline, strategy=strategy,
+                                                          page_offsets=page_offsets), repeat)
+        record(f"chunking.{strategy}", timing, chunks=len(docs))
+    
+    store, timing = timed(lambda: create_vector_store(text, outline=outline, page_offsets=page_offsets,
+                                                      source="course.pdf"), repeat)
+    record('indexing', timing, chunks=len(store.documents))
+    
+    # Retrieval: look up the generated definitions by their term
+    definitions = course['definitions']
+    lookups = [definitions[i * len(definitions) // queries] for i in range(min(queries, len(definitions)))]
+    latencies = []
+    def retrieve():
+        hits = 0
+        latencies.clear()
+        for term, definition, _ in lookups:
+            started = time.perf_counter()
+            docs = store.get_relevant_documents(term, k=4)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += any(definition in doc.page_content for doc in docs)
+        return hits
+    hits, timing = timed(retrieve, repeat)
+    record('retrieval', timing, p50_ms=round(percentile(latencies, 0.5), 4),
+           p99_ms=round(percentile(latencies, 0.99), 4), hit_rate=round(hits / max(len(lookups), 1), 4))
+    
+    # Question answering over the retriever the app uses
+    retriever = get_retriever(store, {"k": 4})
+    questions = lookups[::3]
+    def answer():
+        return sum(1 for term, definition, _ in questions
+                   if definition in answer_question(f"What is {term}?", retriever))
+    hits, timing = timed(answer, repeat)
+    record('qa', timing, questions=len(questions), hit_rate=round(hits / max(len(questions), 1), 4))
+    
+    mmr_retriever = get_retriever(store, {"k": 4, "search_type": "mmr"})
+    cards, timing = timed(lambda: generate_flashcards(text, mmr_retriever, num_cards=10, seed=seed), repeat)
+    record('flashcards', timing, cards=len(cards))
+    
+    summaries, timing = timed(lambda: generate_summaries(text, mmr_retriever), repeat)
+    record('summaries', timing, topics=len(summaries))
+    
+    return {
+        'version': RESULTS_VERSION,
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'config': {'pages': pages, 'seed': seed, 'repeat': repeat, 'queries': queries},
+        'metrics': metrics,
+    }
+
+def compare(current, baseline, threshold=0.15, min_delta_s=0.002):
+    """
+    Flag metrics that regressed against a baseline run
+    
+    Timings (min_s, p50_ms, p99_ms) regress when they grow by more than
+    threshold and by more than min_delta_s; quality figures in
+    HIGHER_IS_BETTER regress when they drop at all. Counts that changed are
+    reported as changes, since they mean the two runs did different work.
+    
+    Args:
+        current (dict): Results of this run
+        baseline (dict): Results of an earlier run
+        threshold (float): Allowed relative slowdown
+        min_delta_s (float): Slowdowns smaller than this many seconds are noise
+    
+    Returns:
+        dict: 'regressions', 'improvements' and 'changes', each a list of
+              {'metric', 'baseline', 'current'} entries
+    """
+    report = {'regressions': [], 'improvements': [], 'changes': []}
+    if baseline.get('config') != current.get('config'):
+        print(f"Error: baseline config {baseline.get('config')} differs from {current.get('config')}")
+    
+    for name, value in current['metrics'].items():
+        old = baseline['metrics'].get(name)
+        if old is None or name.endswith('.median_s'):
+            continue
+        entry = {'metric': name, 'baseline': old, 'current': value}
+        if name.endswith(('.min_s', '_ms')):
+            delta_s = (value - old) / 1000 if name.endswith('_ms') else value - old
+            if value > old * (1 + threshold) and delta_s > min_delta_s:
+                report['regressions'].append(entry)
+            elif value < old / (1 + threshold) and -delta_s > min_delta_s:
+                report['improvements'].append(entry)
+        elif name in HIGHER_IS_BETTER:
+            if value < old:
+                report['regressions'].append(entry)
+            elif value > old:
+                report['improvements'].append(entry)
+        elif value != old:
+            report['changes'].append(entry)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pages', type=int, default=60, help='Pages of the generated course')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the generated course')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage')
+    parser.add_argument('--queries', type=int, default=100, help='Retrieval queries')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', help='Results JSON of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Allowed relative slowdown')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    result = run_suite(args.pages, args.seed, args.repeat, args.queries)
+    if args.baseline:
+        with open(args.baseline) as f:
+            result['comparison'] = compare(result, json.load(f), args.threshold)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"commit {result['commit']}, Python {result['python']}, config {result['config']}")
+        for name, value in result['metrics'].items():
+            print(f"  {name:<32} {value}")
+        comparison = result.get('comparison')
+        if comparison:
+            for kind in ('regressions', 'improvements', 'changes'):
+                for entry in comparison[kind]:
+                    print(f"{kind[:-1].upper():>12}: {entry['metric']} {entry['baseline']} -> {entry['current']}")
+            print(f"{len(comparison['regressions'])} regressions against {args.baseline}")
+    
+    if result.get('comparison', {}).get('regressions'):
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
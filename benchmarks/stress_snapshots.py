@@ -0,0 +1,206 @@
+"""
+Stress concurrent queries against a store that is being updated
+
+Reader threads query the store while writer threads add batches of chunks,
+delete older batches by source and re-index a paged document. Every batch
+shares a marker word, so a reader that looks the marker up must see either
+none or all of a batch's chunks; anything else means it saw a half-applied
+update. Reader latency is reported to show that queries do not wait for
+indexing.
+
+Usage:
+    python -m benchmarks.stress_snapshots [--seconds 10] [--readers 4] [--writers 2] [--json]
+"""
+import argparse
+import json
+import random
+import threading
+import time
+
+from langchain.docstore.document import Document
+
+from vector_store import SimpleDocStore
+
+WORDS = ("cell membrane protein energy glucose enzyme reaction molecule structure function "
+         "transport diffusion gradient water oxygen carbon nucleus ribosome lipid osmosis").split()
+
+def make_chunk(rng, marker):
+    """A chunk of random sentences containing the marker word once"""
+    sentences = [" ".join(rng.choice(WORDS) for _ in range(10)).capitalize() + "." for _ in range(4)]
+    sentences.insert(rng.randrange(len(sentences) + 1), f"The {marker} appears here.")
+    return " ".join(sentences)
+
+def make_pages(rng, count, revision):
+    """Pages of a paged document, with one page changed per revision"""
+    pages = [" ".join(make_chunk(random.Random(page), f"pagemarker{page}") for _ in range(3))
+             for page in range(count)]
+    changed = revision % count
+    pages[changed] += f" Revision note {revision} " + make_chunk(rng, "revisionmarker")
+    return pages
+
+def join_pages(pages):
+    """Join pages the way pdf_processor.join_cleaned_pages does"""
+    offsets = []
+    position = 0
+    for page in pages:
+        offsets.append(position)
+        position += len(page) + 1
+    return " ".join(pages), offsets
+
+class StressState:
+    """Counters shared by the threads"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.published = []  # Batch numbers added so far
+        self.next_batch = 0
+        self.latencies = []
+        self.queries = 0
+        self.violations = []
+        self.errors = []
+        self.writes = {'add': 0, 'delete': 0, 'reindex': 0}
+
+def writer(store, state, batch_size, deadline, seed, page_count):
+    """Add batches, delete old ones and re-index the paged document until the deadline"""
+    rng = random.Random(seed)
+    revision = 0
+    while time.perf_counter() < deadline:
+        try:
+            action = rng.random()
+            if action < 0.5:
+                with state.lock:
+                    batch = state.next_batch
+                    state.next_batch += 1
+                docs = [Document(page_content=make_chunk(rng, f"batchmarker{batch}"),
+                                 metadata={'source': f"batch{batch}"})
+                        for _ in range(batch_size)]
+                store.add_documents(docs)
+                with state.lock:
+                    state.published.append(batch)
+                    state.writes['add'] += 1
+            elif action < 0.8:
+                with state.lock:
+                    if len(state.published) < 4:
+                        continue
+                    batch = state.published.pop(rng.randrange(len(state.published) - 2))
+                store.delete_source(f"batch{batch}")
+                with state.lock:
+                    state.writes['delete'] += 1
+            else:
+                revision += 1
+                text, offsets = join_pages(make_pages(rng, page_count, revision))
+                store.index_pages(text, offsets, source="paged")
+                with state.lock:
+                    state.writes['reindex'] += 1
+        except Exception as e:
+            with state.lock:
+                state.errors.append(f"writer: {e!r}")
+
+def reader(store, state, batch_size, deadline, seed, page_count):
+    """Query batch markers and pages until the deadline, checking what each query sees"""
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        with state.lock:
+            upper = state.next_batch
+        try:
+            if rng.random() < 0.8 and upper:
+                batch = rng.randrange(upper)
+                marker = f"batchmarker{batch}"
+                started = time.perf_counter()
+                docs = store.get_relevant_documents(marker, k=batch_size + 5)
+                elapsed = time.perf_counter() - started
+                seen = sum(1 for doc in docs if f"The {marker} appears" in doc.page_content)
+                if seen not in (0, batch_size):
+                    with state.lock:
+                        state.violations.append(f"batch {batch}: saw {seen} of {batch_size} chunks")
+            else:
+                # The paged document always has exactly its pages' chunks for a page marker
+                page = rng.randrange(page_count)
+                marker = f"pagemarker{page}"
+                started = time.perf_counter()
+                docs = store.get_relevant_documents(marker, k=20)
+                elapsed = time.perf_counter() - started
+                pages = {doc.metadata.get('page') for doc in docs if f"The {marker} appears" in doc.page_content}
+                if pages and pages != {page}:
+                    with state.lock:
+                        state.violations.append(f"page {page}: chunks tagged with pages {sorted(pages)}")
+            with state.lock:
+                state.latencies.append(elapsed)
+                state.queries += 1
+        except Exception as e:
+            with state.lock:
+                state.errors.append(f"reader: {e!r}")
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run(seconds, readers, writers, batch_size, page_count):
+    """Run the stress test and summarise it"""
+    store = SimpleDocStore([])
+    text, offsets = join_pages(make_pages(random.Random(0), page_count, 0))
+    store.index_pages(text, offsets, source="paged")
+    
+    state = StressState()
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=writer, args=(store, state, batch_size, deadline, i, page_count))
+               for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(store, state, batch_size, deadline, 100 + i, page_count))
+                for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    latencies_ms = [latency * 1000 for latency in state.latencies]
+    snapshot = store.snapshot()
+    return {
+        'seconds': seconds,
+        'readers': readers,
+        'writers': writers,
+        'queries': state.queries,
+        'writes': state.writes,
+        'latency_ms_p50': round(percentile(latencies_ms, 0.5), 3),
+        'latency_ms_p99': round(percentile(latencies_ms, 0.99), 3),
+        'latency_ms_max': round(max(latencies_ms, default=0.0), 3),
+        'segments': len(snapshot.segments),
+        'chunks': snapshot.size,
+        'deleted_chunks': snapshot.deleted_count,
+        'violations': state.violations[:20],
+        'violation_count': len(state.violations),
+        'errors': state.errors[:20],
+        'error_count': len(state.errors),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10, help='How long to run')
+    parser.add_argument('--readers', type=int, default=4, help='Number of reader threads')
+    parser.add_argument('--writers', type=int, default=2, help='Number of writer threads')
+    parser.add_argument('--batch-size', type=int, default=8, help='Chunks per added batch')
+    parser.add_argument('--pages', type=int, default=20, help='Pages of the re-indexed document')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+    
+    result = run(args.seconds, args.readers, args.writers, args.batch_size, args.pages)
+    
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"{result['queries']} queries, writes {result['writes']}")
+        print(f"query latency: p50 {result['latency_ms_p50']} ms, p99 {result['latency_ms_p99']} ms, "
+              f"max {result['latency_ms_max']} ms")
+        print(f"final index: {result['chunks']} chunks in {result['segments']} segments, "
+              f"{result['deleted_chunks']} deleted")
+        print(f"violations: {result['violation_count']}, errors: {result['error_count']}")
+        for message in result['violations'] + result['errors']:
+            print(f"  {message}")
+    
+    if result['violation_count'] or result['error_count']:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+import re
+from bisect import bisect_left
+
+# Same sentence boundary rule used by the QA, flashcard and summary heuristics
+SENTENCE_BOUNDARY = re.compile(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s')
+TOKEN_PATTERN = re.compile(r'\w+')
+
+class SentenceTable:
+    """
+    Sentence offsets and sizes for a text, computed once and shared by all strategies
+    
+    Only offsets are stored; the text itself is never sliced or copied here.
+    """
+    
+    def __init__(self, text):
+        """
+        Args:
+            text (str): The text to split into sentences
+        """
+        self.text = text
+        self.starts = []
+        self.ends = []
+        self.tokens = []
+        
+        position = 0
+        for match in SENTENCE_BOUNDARY.finditer(text):
+            self._add(position, match.start())
+            position = match.end()
+        self._add(position, len(text))
+    
+    def _add(self, start, end):
+        """Record a sentence span, skipping empty ones"""
+        text = self.text
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        if start < end:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.tokens.append(len(TOKEN_PATTERN.findall(text, start, end)))
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def size(self, i, measure):
+        """Size of sentence i in tokens or characters"""
+        if measure == "chars":
+            return self.ends[i] - self.starts[i]
+        return self.tokens[i]
+    
+    def pieces(self, first, last, budget, measure):
+        """
+        Yield (start, end, size) units for sentences first..last-1
+        
+        Sentences longer than the token budget are cut at token boundaries so
+        that no unit exceeds it. Character budgets keep long sentences whole.
+        """
+        for i in range(first, last):
+            size = self.size(i, measure)
+            if measure == "chars" or size <= budget:
+                yield self.starts[i], self.ends[i], size
+                continue
+            
+            start = self.starts[i]
+            count = 0
+            for match in TOKEN_PATTERN.finditer(self.text, self.starts[i], self.ends[i]):
+                if count == budget:
+                    yield start, match.start(), count
+                    start = match.start()
+                    count = 0
+                count += 1
+            yield start, self.ends[i], count
+
+def pack_sentences(sentences, budget, overlap=0, measure="tokens", first=0, last=None):
+    """
+    Pack consecutive sentences into chunks of at most `budget`
+    
+    Args:
+        sentences (SentenceTable): Precomputed sentence offsets
+        budget (int): Maximum chunk size
+        overlap (int): Size carried over from the end of the previous chunk
+        measure (str): "tokens" or "chars"
+        first (int): First sentence to pack
+        last (int, optional): One past the last sentence to pack
+    
+    Returns:
+        list: (start, end) chunk spans
+    """
+    if last is None:
+        last = len(sentences)
+    
+    units = list(sentences.pieces(first, last, budget, measure))
+    spans = []
+    i = 0
+    while i < len(units):
+        size = 0
+        j = i
+        while j < len(units) and (j == i or size + units[j][2] <= budget):
+            size += units[j][2]
+            j += 1
+        spans.append((units[i][0], units[j - 1][1]))
+        if j >= len(units):
+            break
+        
+        # Step back over trailing units to build the overlap, always moving forward
+        next_start = j
+        carried = 0
+        while overlap and next_start - 1 > i and carried + units[next_start - 1][2] <= overlap:
+            next_start -= 1
+            carried += units[next_start][2]
+        i = next_start
+    
+    return spans
+
+def sentence_strategy(sentences, max_tokens, overlap_tokens=0, outline=None, measure="tokens"):
+    """Sentence packing without overlap"""
+    return pack_sentences(sentences, max_tokens, 0, measure)
+
+def sliding_window_strategy(sentences, max_tokens, overlap_tokens=0, outline=None, measure="tokens"):
+    """Sentence-aligned sliding window with overlap between neighbouring chunks"""
+    return pack_sentences(sentences, max_tokens, overlap_tokens, measure)
+
+def section_strategy(sentences, max_tokens, overlap_tokens=0, outline=None, measure="tokens"):
+    """Sentence packing that never lets a chunk cross an outline section boundary"""
+    if not outline:
+        return pack_sentences(sentences, max_tokens, 0, measure)
+    
+    spans = []
+    boundaries = sorted({section['start'] for section in outline})
+    first = 0
+    for boundary in boundaries + [None]:
+        last = len(sentences) if boundary is None else bisect_left(sentences.starts, boundary)
+        if last > first:
+            spans.extend(pack_sentences(sentences, max_tokens, 0, measure, first, last))
+        first = last
+    
+    return spans
+
+# Available chunking strategies, by name
+CHUNKING_STRATEGIES = {
+    "sentence": sentence_strategy,
+    "sliding": sliding_window_strategy,
+    "section": section_strategy,
+}
+
+def chunk_text(text, strategy="sliding", max_tokens=150, overlap_tokens=30, outline=None,
+               measure="tokens", sentences=None):
+    """
+    Split text into chunk spans using one of the registered strategies
+    
+    Args:
+        text (str): The text to chunk
+        strategy (str): Name of a strategy in CHUNKING_STRATEGIES
+        max_tokens (int): Size budget of each chunk
+        overlap_tokens (int): Overlap between neighbouring chunks (sliding strategy only)
+        outline (list, optional): Document outline, used by the section strategy
+        measure (str): Count the budget in "tokens" or "chars"
+        sentences (SentenceTable, optional): Precomputed sentences of text, to reuse across calls
+    
+    Returns:
+        list: (start, end) offsets of each chunk in text
+    """
+    if strategy not in CHUNKING_STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy '{strategy}'. "
+                         f"Available: {', '.join(CHUNKING_STRATEGIES)}")
+    
+    if sentences is None:
+        sentences = SentenceTable(text)
+    
+    return CHUNKING_STRATEGIES[strategy](sentences, max_tokens, overlap_tokens, outline, measure)
@@ -0,0 +1,181 @@
+from array import array
+
+import numpy as np
+
+# Two terms co-occur when at most this many tokens apart in a chunk
+COOCCURRENCE_WINDOW = 5
+
+# Pairs seen fewer times than this are noise, however high their PMI
+MIN_COOCCURRENCE = 3
+
+# Only pairs at least this strongly associated (normalized PMI, -1 to 1) are related
+MIN_NPMI = 0.2
+
+# Related terms kept per term
+RELATED_TERMS = 5
+
+# Score of an expansion term per occurrence, relative to a query term, at a
+# normalized PMI of 1; and the most expansion terms added to a query
+EXPANSION_WEIGHT = 0.25
+EXPANSION_TERMS = 4
+
+# Most a chunk's expansion terms add to its score all together: less than one
+# query term match, so chunks holding a query term always outrank chunks
+# holding only related terms
+EXPANSION_CAP = 0.5
+
+# Weights are rounded to multiples of 1/WEIGHT_STEPS so that float32 storage
+# (packed files) and scores summed in any order come out exactly the same
+WEIGHT_STEPS = 256
+
+def count_cooccurrences(term_positions, window=COOCCURRENCE_WINDOW):
+    """
+    Occurrences of terms, and of pairs of terms close to each other, in chunks
+    
+    Args:
+        term_positions (iterable): Term -> token positions of each chunk
+        window (int): Largest token distance of a co-occurring pair
+    
+    Returns:
+        tuple: (terms (list), occurrences of each term, and for every pair that
+                co-occurs its two term numbers, smaller first, and its count;
+                all four NumPy arrays)
+    """
+    numbers = {}
+    sequence = []  # Term numbers at their token positions, chunk after chunk, -1 for dropped words
+    for positions in term_positions:
+        if not positions:
+            continue
+        start = len(sequence)
+        sequence.extend([-1] * (max(token_positions[-1] for token_positions in positions.values()) + 1))
+        for term, token_positions in positions.items():
+            number = numbers.setdefault(term, len(numbers))
+            for position in token_positions:
+                sequence[start + position] = number
+        # A window's worth of padding keeps chunks apart
+        sequence.extend([-1] * window)
+    terms = list(numbers)
+    tokens = np.array(sequence, dtype=np.int64)
+    term_counts = np.bincount(tokens[tokens >= 0], minlength=len(terms))
+    
+    # Pairs at each distance, as first * len(terms) + second
+    keys = [np.zeros(0, dtype=np.int64)]
+    for distance in range(1, window + 1):
+        before, after = tokens[:-distance], tokens[distance:]
+        both = (before >= 0) & (after >= 0) & (before != after)
+        keys.append(np.minimum(before[both], after[both]) * len(terms) + np.maximum(before[both], after[both]))
+    keys, pair_counts = np.unique(np.concatenate(keys), return_counts=True)
+    return terms, term_counts, keys // max(len(terms), 1), keys % max(len(terms), 1), pair_counts
+
+class RelatedTerms:
+    """
+    The most related terms of each term of some chunks, by normalized PMI
+    
+    Pointwise mutual information compares how often two terms appear close
+    together with how often they would by chance; normalized, it runs from
+    -1 (never together) through 0 (independent) to 1 (always together).
+    Only the RELATED_TERMS strongest neighbours of each term are kept, as a
+    sparse matrix in compressed rows: the neighbours of terms[i] are
+    neighbours[offsets[i]:offsets[i + 1]] (numbers in terms), strongest
+    first, with their weights alongside.
+    """
+    
+    def __init__(self, term_positions=(), window=COOCCURRENCE_WINDOW, limit=RELATED_TERMS):
+        """
+        Args:
+            term_positions (iterable): Term -> token positions of each chunk
+            window (int): Largest token distance of a co-occurring pair
+            limit (int): Related terms kept per term
+        """
+        terms, term_counts, firsts, seconds, pair_counts = count_cooccurrences(term_positions, window)
+        total = float(term_counts.sum())
+        pair_total = float(pair_counts.sum())
+        
+        # Normalized PMI of the pairs seen often enough
+        frequent = (pair_counts >= MIN_COOCCURRENCE) & (pair_counts < pair_total)
+        firsts, seconds = firsts[frequent], seconds[frequent]
+        probabilities = pair_counts[frequent] / pair_total
+        pmi = np.log(probabilities * total * total / (term_counts[firsts] * term_counts[seconds]))
+        weights = np.round(pmi / -np.log(probabilities) * WEIGHT_STEPS) / WEIGHT_STEPS
+        strong = weights >= MIN_NPMI
+        
+        related = {}  # Term -> [(weight, word)]
+        for first, second, weight in zip(firsts[strong].tolist(), seconds[strong].tolist(), weights[strong].tolist()):
+            related.setdefault(terms[first], []).append((weight, terms[second]))
+            related.setdefault(terms[second], []).append((weight, terms[first]))
+        
+        # Compressed rows, one per term with related terms
+        self.terms = sorted(related)
+        self._numbers = {term: i for i, term in enumerate(self.terms)}
+        self.offsets = array('I', [0])
+        self.neighbours = array('I')
+        self.weights = array('f')
+        for term in self.terms:
+            pairs = sorted(related[term], key=lambda pair: (-pair[0], pair[1]))[:limit]
+            for weight, word in pairs:
+                self.neighbours.append(self._numbers[word])
+                self.weights.append(weight)
+            self.offsets.append(len(self.neighbours))
+    
+    def __len__(self):
+        """Number of stored pairs"""
+        return len(self.neighbours)
+    
+    def lookup(self, term):
+        """
+        Related terms of a term
+        
+        Returns:
+            list: (word, weight) pairs, strongest first
+        """
+        i = self._numbers.get(term)
+        if i is None:
+            return []
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return [(self.terms[j], float(weight))
+                for j, weight in zip(self.neighbours[start:end], self.weights[start:end])]
+    
+    def rows(self):
+        """Yield (term, [(word, weight)]) for every term with related terms"""
+        for term in self.terms:
+            yield term, self.lookup(term)
+
+def merge_related(neighbour_lists, limit=RELATED_TERMS):
+    """
+    Combine the related terms of one term from several sets of chunks
+    
+    Args:
+        neighbour_lists (iterable): Lists of (word, weight) pairs
+        limit (int): Related terms kept
+    
+    Returns:
+        list: (word, weight) pairs, strongest first (a word's highest weight counts)
+    """
+    weights = {}
+    for neighbours in neighbour_lists:
+        for word, weight in neighbours:
+            if weight > weights.get(word, 0.0):
+                weights[word] = weight
+    return sorted(weights.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+def top_expansions(query_terms, related, limit=EXPANSION_TERMS):
+    """
+    Pick the terms a query is expanded with
+    
+    Args:
+        query_terms (list): The query's terms
+        related (function): Term -> its (word, weight) related terms, strongest first
+        limit (int): Most expansion terms
+    
+    Returns:
+        dict: Expansion term -> score per occurrence (EXPANSION_WEIGHT at most),
+              the most strongly related terms that are not query terms
+    """
+    query = set(query_terms)
+    weights = {}
+    for term in query:
+        for word, weight in related(term):
+            if word not in query and weight > weights.get(word, 0.0):
+                weights[word] = weight
+    best = sorted(weights.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    return {word: EXPANSION_WEIGHT * weight for word, weight in best}
@@ -0,0 +1,121 @@
+import re
+import zlib
+import numpy as np
+
+WORD_PATTERN = re.compile(r'\w+')
+MAX_HASH = np.uint64(0xFFFFFFFF)
+
+class MinHashLSH:
+    """
+    Near-duplicate detection for text chunks using MinHash signatures and LSH banding
+    
+    Each chunk is reduced to a fixed-size signature over its word shingles.
+    Signatures are split into bands; chunks that share any band are candidate
+    duplicates, and a candidate is confirmed when the estimated Jaccard
+    similarity of the two signatures reaches the threshold.
+    """
+    
+    def __init__(self, num_perm=64, bands=8, threshold=0.85, shingle_size=5, seed=1):
+        """
+        Args:
+            num_perm (int): Number of hash permutations in a signature
+            bands (int): Number of LSH bands (must divide num_perm)
+            threshold (float): Estimated Jaccard similarity at which chunks count as duplicates
+            shingle_size (int): Number of words per shingle
+            seed (int): Seed for the permutation parameters
+        """
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        
+        # Universal hashing (a * x + b) mod 2^32 with odd multipliers
+        rng = np.random.RandomState(seed)
+        self._a = (rng.randint(0, 2 ** 31, size=num_perm).astype(np.uint64) << np.uint64(1)) | np.uint64(1)
+        self._b = rng.randint(0, 2 ** 31, size=num_perm).astype(np.uint64)
+        
+        self.buckets = {}
+        self.signatures = {}
+    
+    def signature(self, text):
+        """
+        Compute the MinHash signature of a text
+        
+        Args:
+            text (str): The chunk text
+        
+        Returns:
+            numpy.ndarray: Signature of num_perm unsigned 32-bit values
+        """
+        words = WORD_PATTERN.findall(text.lower())
+        size = self.shingle_size
+        if len(words) <= size:
+            shingles = {" ".join(words)}
+        else:
+            shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+        
+        hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        # One row per permutation, minimum over all shingles
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) & MAX_HASH
+        return permuted.min(axis=1).astype(np.uint32)
+    
+    def _band_keys(self, signature):
+        rows = self.rows
+        return [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(self.bands)]
+    
+    def find_duplicate(self, signature):
+        """
+        Find an indexed chunk that is a near duplicate of the signature
+        
+        Args:
+            signature (numpy.ndarray): Signature from signature()
+        
+        Returns:
+            The id of the most similar duplicate, or None
+        """
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self.buckets.get(key, ()))
+        
+        best_id = None
+        best_similarity = self.threshold
+        for doc_id in candidates:
+            similarity = float(np.mean(self.signatures[doc_id] == signature))
+            if similarity >= best_similarity:
+                best_id, best_similarity = doc_id, similarity
+        return best_id
+    
+    def insert(self, doc_id, signature):
+        """
+        Index a chunk signature
+        
+        Args:
+            doc_id: Identifier of the chunk
+            signature (numpy.ndarray): Signature from signature()
+        """
+        self.signatures[doc_id] = signature
+        for key in self._band_keys(signature):
+            self.buckets.setdefault(key, []).append(doc_id)
+    
+    def remove(self, doc_id):
+        """
+        Forget an indexed chunk
+        
+        Args:
+            doc_id: Identifier of the chunk
+        """
+        signature = self.signatures.pop(doc_id, None)
+        if signature is None:
+            return
+        for key in self._band_keys(signature):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                bucket.remove(doc_id)
+                if not bucket:
+                    del self.buckets[key]
+
@@ -0,0 +1,71 @@
+import re
+
+# Flashcard candidate kinds that state what a term is ("X is defined as ...", "X: ...")
+DEFINITION_KINDS = ("definition", "colon")
+
+# Articles dropped from the front of a term, so "the cell membrane" finds "Cell membrane"
+LEADING_ARTICLES = ("the", "a", "an")
+
+# Questions asking what a term is, the term as the first group; the specific
+# phrasings come before the plain "what is X"
+DEFINITION_QUESTIONS = [
+    re.compile(r'^\s*(?:what\s+(?:is|are)\s+)?the\s+(?:definition|meaning)\s+of\s+(.+?)[\s?.!]*$', re.IGNORECASE),
+    re.compile(r'^\s*what\s+(?:is|are)\s+meant\s+by\s+(.+?)[\s?.!]*$', re.IGNORECASE),
+    re.compile(r'^\s*what\s+(?:does|do)\s+(.+?)\s+mean[\s?.!]*$', re.IGNORECASE),
+    re.compile(r'^\s*(?:what|who)\s+(?:is|are)\s+(.+?)[\s?.!]*$', re.IGNORECASE),
+    re.compile(r'^\s*define\s+(.+?)[\s?.!]*$', re.IGNORECASE),
+]
+
+def definition_key(term):
+    """
+    Normalized form of a term for definition lookups
+    
+    Lowercased words joined by single spaces, without a leading article:
+    "The  Cell-Membrane" -> "cell membrane".
+    """
+    words = re.findall(r'\w+', term.lower())
+    if len(words) > 1 and words[0] in LEADING_ARTICLES:
+        words = words[1:]
+    return " ".join(words)
+
+def definition_term(question):
+    """
+    The term a definition question asks about
+    
+    Args:
+        question (str): The question, e.g. "What is osmosis?" or "Define osmosis"
+    
+    Returns:
+        str or None: The term, or None if the question is not a definition question
+    """
+    for pattern in DEFINITION_QUESTIONS:
+        match = pattern.match(question)
+        if match:
+            return match.group(1)
+    return None
+
+def build_definition_index(pool):
+    """
+    Index the definition sentences of a document by the term they define
+    
+    Built from the flashcard pool, which already holds every definition and
+    colon sentence of the whole document (see build_flashcard_pool), so
+    answering "what is X" becomes a dictionary lookup.
+    
+    Args:
+        pool (list): Flashcard candidates of the document
+    
+    Returns:
+        dict: Normalized term (see definition_key) -> definitions, each a dict with
+              the 'sentence' and its 'start' offset in the document text (to tell
+              which section it is in), strongest first, then in document order
+    """
+    index = {}
+    candidates = sorted((candidate for candidate in pool if candidate["kind"] in DEFINITION_KINDS),
+                        key=lambda candidate: (-candidate["score"], candidate["start"]))
+    for candidate in candidates:
+        # Pools mined before candidates kept their sentence only have the definition part
+        sentence = candidate.get("sentence") or f"{candidate['term']}: {candidate['answer']}."
+        index.setdefault(definition_key(candidate["term"]), []).append(
+            {"sentence": sentence, "start": candidate["start"]})
+    return index
@@ -1,20 +1,51 @@
 import os
 import json
-import re
-from utils import split_text_into_chunks, clean_text
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from chunking import SENTENCE_BOUNDARY, SentenceTable
+from patterns import COLON_PATTERN, DEFINITION_PATTERN, FACT_PATTERN, sentence_cues
+from term_index import TOKEN_PATTERN, TermIndex
+import tracing
+from utils import split_text_into_chunks, clean_text, find_page, find_section
 
-def generate_flashcards(text, retriever, num_cards=10):
+# Base score of each kind of flashcard candidate
+CANDIDATE_KIND_SCORES = {
+    "definition": 3.0,
+    "colon": 2.0,
+    "fact": 1.5,
+    "statement": 1.0,
+}
+
+# Documents with fewer sentences than this are mined in-process
+PARALLEL_MINING_THRESHOLD = 5000
+
+@tracing.traced("flashcards")
+def generate_flashcards(text, retriever, num_cards=10, topic=None, pages=None, seed=None):
     """
     Generate flashcards from the provided text using OpenAI API
     
+    When the retriever's store has a flashcard pool (mined at index time), cards
+    are sampled from it; otherwise they are mined from the retrieved chunks.
+    
     Args:
         text (str): The text to generate flashcards from
         retriever: The retriever to use for RAG
         num_cards (int): Number of flashcards to generate
+        topic (str, optional): Only make cards about this topic or section (pool only)
+        pages (tuple, optional): Inclusive (first, last) range of 0-based pages (pool only)
+        seed (int, optional): Seed for a reproducible draw (pool only)
         
     Returns:
         list: List of flashcards, each containing a question and answer
     """
+    # Sample from the candidate pool mined at index time when there is one
+    flashcard_pool = getattr(retriever, 'flashcard_pool', None)
+    if flashcard_pool:
+        tracing.count("cache_hits", cache="flashcard_pool")
+        return sample_flashcards(flashcard_pool, num_cards, topic=topic, pages=pages, seed=seed)
+    tracing.count("cache_misses", cache="flashcard_pool")
+    
     # Generate initial flashcards based on the entire text
     system_prompt = (
         "You are an educational assistant that creates high-quality flashcards for students. "
@@ -38,79 +69,24 @@ def generate_flashcards(text, retriever, num_cards=10):
     
     try:
         # Improved flashcard generation that focuses on clear questions and concise answers
-        sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s', context)
+        sentences = SENTENCE_BOUNDARY.split(context)
         potential_cards = []
         
-        # Look for definition sentences - these make good flashcards
+        # Look for definition, colon and fact sentences - these make good flashcards
         for sentence in sentences:
-            # Skip very short or very long sentences
-            if len(sentence.split()) < 5 or len(sentence.split()) > 30:
-                continue
-                
-            sentence = sentence.strip()
-            
-            # Pattern 1: Explicit definitions with "is defined as", "is", "refers to", etc.
-            definition_match = re.search(r'([A-Z][a-zA-Z\s]+)\s+(is|are|refers to|means|is defined as|can be defined as)\s+([^\.]+)', sentence)
-            if definition_match:
-                term = definition_match.group(1).strip()
-                definition = definition_match.group(3).strip()
-                
-                # Only use if term and definition are reasonable lengths
-                if 2 <= len(term.split()) <= 5 and len(definition) >= 10:
-                    potential_cards.append({
-                        "question": f"What is {term}?",
-                        "answer": definition
-                    })
-                    continue
-            
-            # Pattern 2: Key concepts with colon
-            colon_match = re.search(r'([A-Z][a-zA-Z\s]+):\s+([^\.]+)', sentence)
-            if colon_match:
-                term = colon_match.group(1).strip()
-                explanation = colon_match.group(2).strip()
-                
-                if len(term.split()) <= 5 and len(explanation) >= 10:
-                    potential_cards.append({
-                        "question": f"Explain {term}.",
-                        "answer": explanation
-                    })
-                    continue
-            
-            # Pattern 3: Important facts with numbers/dates
-            if re.search(r'\b(in|on|during)\s+\d{4}\b', sentence) or re.search(r'\b\d+\s+(percent|%)\b', sentence):
-                # Create a factual question by removing key information
-                words = sentence.split()
-                if len(words) >= 7:
-                    # Try to identify the subject of the sentence
-                    subject_end = min(3, len(words) // 3)
-                    subject = ' '.join(words[:subject_end])
-                    remainder = ' '.join(words[subject_end:])
-                    
-                    # Create a question that asks about the factual information
-                    potential_cards.append({
-                        "question": f"What {remainder}?",
-                        "answer": sentence
-                    })
+            candidate = mine_sentence(sentence)
+            if candidate and candidate["kind"] != "statement":
+                potential_cards.append(candidate)
                     
         # If we still don't have enough cards, look for sentences with key educational terms
         if len(potential_cards) < num_cards:
-            important_terms = ["key", "important", "significant", "essential", "fundamental", 
-                               "critical", "vital", "primary", "main", "major", "central"]
-            
             for sentence in sentences:
                 if len(potential_cards) >= num_cards * 2:  # Generate extras for filtering
                     break
-                    
-                # Look for sentences that seem to be stating important concepts
-                if any(term in sentence.lower() for term in important_terms):
-                    # Create a question by removing the last part of the sentence
-                    words = sentence.split()
-                    if len(words) >= 8:
-                        question_part = ' '.join(words[:len(words)//2])
-                        potential_cards.append({
-                            "question": f"Complete this statement: {question_part}...",
-                            "answer": sentence
-                        })
+                
+                candidate = mine_sentence(sentence)
+                if candidate and candidate["kind"] == "statement":
+                    potential_cards.append(candidate)
         
         # Ensure we have unique, quality cards
         unique_cards = []
@@ -126,57 +102,279 @@ def generate_flashcards(text, retriever, num_cards=10):
                 unique_cards.append(card)
         
         # Second pass: Ensure answers are concise (under 150 chars) and questions are clear
-        final_cards = []
-        for card in unique_cards:
-            # Limit answer length for readability
-            if len(card["answer"]) > 150:
-                card["answer"] = card["answer"][:147] + "..."
-                
-            # Ensure question ends with ? or .
-            if not card["question"].endswith("?") and not card["question"].endswith("."):
-                card["question"] += "?"
-                
-            final_cards.append(card)
+        final_cards = [format_flashcard(card) for card in unique_cards]
                 
         return final_cards[:num_cards]  # Return only the requested number of cards
     
     except Exception as e:
         print(f"Error generating flashcards: {e}")
+        tracing.record_error("flashcards", e)
         # Return a simple error flashcard
         return [{"question": "Error", "answer": f"Failed to generate flashcards: {str(e)}"}]
 
-def validate_flashcards(flashcards, text):
+def mine_sentence(sentence):
+    """
+    Turn a sentence into a flashcard candidate if it matches one of the card patterns
+    
+    Args:
+        sentence (str): The sentence to examine
+        
+    Returns:
+        dict or None: Candidate with 'question', 'answer', 'kind' and 'term', and for
+                      definitions and colon explanations the whole 'sentence'
+    """
+    sentence = sentence.strip()
+    words = sentence.split()
+    num_words = len(words)
+    
+    # One pass over the sentence finds every cue phrase
+    cues = sentence_cues(sentence)
+    
+    # Skip very short or very long sentences
+    if 5 <= num_words <= 30:
+        # Pattern 1: Explicit definitions with "is defined as", "is", "refers to", etc.
+        if "definition_verb" in cues:
+            definition_match = DEFINITION_PATTERN.search(sentence)
+            if definition_match:
+                term = definition_match.group(1).strip()
+                definition = definition_match.group(3).strip()
+                
+                # Only use if term and definition are reasonable lengths
+                if 2 <= len(term.split()) <= 5 and len(definition) >= 10:
+                    return {"question": f"What is {term}?", "answer": definition,
+                            "kind": "definition", "term": term, "sentence": sentence}
+        
+        # Pattern 2: Key concepts with colon
+        if ":" in sentence:
+            colon_match = COLON_PATTERN.search(sentence)
+            if colon_match:
+                term = colon_match.group(1).strip()
+                explanation = colon_match.group(2).strip()
+                
+                if len(term.split()) <= 5 and len(explanation) >= 10:
+                    return {"question": f"Explain {term}.", "answer": explanation,
+                            "kind": "colon", "term": term, "sentence": sentence}
+        
+        # Pattern 3: Important facts with numbers/dates
+        if num_words >= 7 and FACT_PATTERN.search(sentence):
+            # Try to identify the subject of the sentence
+            subject_end = min(3, num_words // 3)
+            subject = ' '.join(words[:subject_end])
+            remainder = ' '.join(words[subject_end:])
+            
+            # Create a question that asks about the factual information
+            return {"question": f"What {remainder}?", "answer": sentence,
+                    "kind": "fact", "term": subject}
+    
+    # Pattern 4: Sentences that seem to be stating important concepts
+    if num_words >= 8 and "important" in cues:
+        # Create a question by removing the last part of the sentence
+        question_part = ' '.join(words[:num_words//2])
+        return {"question": f"Complete this statement: {question_part}...", "answer": sentence,
+                "kind": "statement", "term": question_part}
+    
+    return None
+
+def format_flashcard(card):
+    """
+    Make a candidate presentable: concise answer, question ending in ? or .
+    
+    Args:
+        card (dict): Flashcard candidate
+        
+    Returns:
+        dict: Flashcard with 'question' and 'answer'
+    """
+    question = card["question"]
+    answer = card["answer"]
+    
+    # Limit answer length for readability
+    if len(answer) > 150:
+        answer = answer[:147] + "..."
+        
+    # Ensure question ends with ? or .
+    if not question.endswith("?") and not question.endswith("."):
+        question += "?"
+    
+    return {"question": question, "answer": answer}
+
+def score_candidate(candidate):
+    """Score a candidate by pattern strength, preferring short, self-contained answers"""
+    score = CANDIDATE_KIND_SCORES[candidate["kind"]]
+    answer_length = len(candidate["answer"])
+    if answer_length <= 150:
+        score *= 1.5
+    elif answer_length > 250:
+        score *= 0.7
+    return score
+
+def _mine_batch(batch):
+    """Mine (offset, sentence) pairs; run in worker processes"""
+    candidates = []
+    for start, sentence in batch:
+        candidate = mine_sentence(sentence)
+        if candidate:
+            candidate["start"] = start
+            candidate["score"] = score_candidate(candidate)
+            candidates.append(candidate)
+    return candidates
+
+def build_flashcard_pool(text, outline=None, page_offsets=None, workers=None):
+    """
+    Mine flashcard candidates from the whole document
+    
+    Runs once at index time, in parallel for large documents, so that generating
+    or regenerating cards later is just sampling from the pool.
+    
+    Args:
+        text (str): The full cleaned document text
+        outline (list, optional): Document outline, to tag candidates with their section
+        page_offsets (list, optional): Start offset of each page, to tag candidates with their page
+        workers (int, optional): Number of worker processes (defaults to the CPU count)
+        
+    Returns:
+        list: Candidates with 'question', 'answer', 'kind', 'term', 'score', 'start', 'page' and 'section'
+    """
+    table = SentenceTable(text)
+    sentences = [(start, text[start:end]) for start, end in zip(table.starts, table.ends)]
+    
+    if len(sentences) < PARALLEL_MINING_THRESHOLD:
+        pool = _mine_batch(sentences)
+    else:
+        workers = workers or os.cpu_count() or 1
+        batch_size = max(len(sentences) // (workers * 4), 1)
+        batches = [sentences[i:i + batch_size] for i in range(0, len(sentences), batch_size)]
+        pool = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for candidates in executor.map(_mine_batch, batches):
+                pool.extend(candidates)
+    
+    # Record where each candidate came from
+    for candidate in pool:
+        candidate["page"] = find_page(page_offsets, candidate["start"])
+        section = find_section(outline, candidate["start"])
+        candidate["section"] = section["title"] if section else None
+    
+    return pool
+
+def sample_flashcards(pool, num_cards=10, topic=None, pages=None, seed=None):
+    """
+    Draw a varied set of flashcards from a candidate pool
+    
+    Candidates are drawn with probability proportional to their score, weaker
+    "statement" cards only fill in when the stronger kinds run out, and the
+    draw rotates across sections with no repeated questions or terms.
+    
+    Args:
+        pool (list): Candidates from build_flashcard_pool
+        num_cards (int): Number of flashcards to return
+        topic (str, optional): Only use candidates whose section, term or text mentions this
+        pages (tuple, optional): Inclusive (first, last) range of 0-based pages to draw from
+        seed (int, optional): Seed for a reproducible draw
+        
+    Returns:
+        list: List of flashcards, each containing a question and answer
+    """
+    rng = random.Random(seed)
+    
+    candidates = pool
+    if topic:
+        topic_lower = topic.lower()
+        candidates = [c for c in candidates
+                      if topic_lower in (c["section"] or "").lower()
+                      or topic_lower in c["term"].lower()
+                      or topic_lower in c["answer"].lower()]
+    if pages is not None:
+        first_page, last_page = pages
+        candidates = [c for c in candidates
+                      if c["page"] is not None and first_page <= c["page"] <= last_page]
+    
+    # Weighted random order (Efraimidis-Spirakis keys), strong kinds first
+    ordered = sorted(candidates,
+                     key=lambda c: (c["kind"] == "statement", -rng.random() ** (1.0 / c["score"])))
+    
+    # Rotate across sections so one chapter does not take all the cards
+    by_section = {}
+    for candidate in ordered:
+        by_section.setdefault((candidate["kind"] == "statement", candidate["section"]), []).append(candidate)
+    
+    cards = []
+    questions_seen = set()
+    terms_seen = set()
+    for statements in (False, True):
+        queues = [deque(queue) for (is_statement, _), queue in by_section.items() if is_statement == statements]
+        while queues and len(cards) < num_cards:
+            for queue in queues:
+                candidate = queue.popleft()
+                question = candidate["question"].lower()
+                term = candidate["term"].lower()
+                if question in questions_seen or term in terms_seen:
+                    continue
+                questions_seen.add(question)
+                terms_seen.add(term)
+                cards.append(format_flashcard(candidate))
+                if len(cards) >= num_cards:
+                    break
+            queues = [queue for queue in queues if queue]
+    
+    return cards
+
+def validate_flashcards(flashcards, text, term_index=None, min_support=1.0):
     """
     Validate the generated flashcards against the original text
     
+    Every card gets a 'support' score: the fraction of the answer's key words
+    found in the document, averaged with the fraction of its consecutive
+    word pairs found as phrases. Lookups go through the document's term index,
+    so the cost per card does not depend on the document length.
+    
     Args:
         flashcards (list): The flashcards to validate
         text (str): The original text
+        term_index (TermIndex, optional): Prebuilt index of text (built if not given)
+        min_support (float): Minimum fraction of key words that must be found
         
     Returns:
-        list: Validated and possibly corrected flashcards
+        list: Validated flashcards, each with its 'support' score
     """
+    if term_index is None:
+        term_index = TermIndex(text)
+    
     validated_cards = []
     
     for card in flashcards:
-        question = card.get("question", "")
-        answer = card.get("answer", "")
-        
-        # Simple validation: check if key terms from the answer appear in the text
-        answer_words = set(answer.lower().split())
-        text_lower = text.lower()
-        
-        # Remove common words for more meaningful validation
-        common_words = {"the", "a", "an", "in", "on", "at", "of", "for", "with", "by", "to", "and", "or", "but"}
-        key_words = answer_words - common_words
-        
-        valid = True
-        for word in key_words:
-            if len(word) > 3 and word not in text_lower:  # Only check reasonably long words
-                valid = False
-                break
-        
-        if valid:
-            validated_cards.append(card)
+        support = flashcard_support(card.get("answer", ""), term_index)
+        if support["word_support"] >= min_support:
+            validated_cards.append(dict(card, support=support["support"]))
     
     return validated_cards
+
+def flashcard_support(answer, term_index):
+    """
+    Measure how well the document supports a flashcard answer
+    
+    Args:
+        answer (str): The flashcard answer
+        term_index (TermIndex): Index of the document
+        
+    Returns:
+        dict: 'word_support', 'phrase_support' and their average 'support', each in [0, 1]
+    """
+    # Remove common words for more meaningful validation
+    common_words = {"the", "a", "an", "in", "on", "at", "of", "for", "with", "by", "to", "and", "or", "but"}
+    words = TOKEN_PATTERN.findall(answer.lower())
+    
+    # Only check reasonably long words
+    key_words = {word for word in words if len(word) > 3 and word not in common_words}
+    word_support = sum(1 for word in key_words if word in term_index) / len(key_words) if key_words else 1.0
+    
+    # Consecutive word pairs that also appear next to each other in the document
+    pairs = {(words[i], words[i + 1]) for i in range(len(words) - 1)}
+    phrase_support = (sum(1 for pair in pairs if term_index.phrase_positions(pair, limit=1)) / len(pairs)
+                      if pairs else word_support)
+    
+    return {
+        "word_support": word_support,
+        "phrase_support": phrase_support,
+        "support": (word_support + phrase_support) / 2,
+    }
@@ -0,0 +1,155 @@
+# Edits tolerated for a query term, by length: short words have too many
+# close neighbours to correct safely
+MIN_FUZZY_LENGTH = 5
+LONG_TERM_LENGTH = 9
+MAX_EDIT_DISTANCE = 2
+
+def allowed_distance(term, max_distance=MAX_EDIT_DISTANCE):
+    """Edit distance within which a term may be corrected: 0 below MIN_FUZZY_LENGTH, 1, or 2 for long terms"""
+    if len(term) < MIN_FUZZY_LENGTH:
+        return 0
+    if len(term) < LONG_TERM_LENGTH:
+        return min(1, max_distance)
+    return max_distance
+
+def deletions(word, distance):
+    """Every string made by deleting up to `distance` characters from a word, the word included"""
+    variants = {word}
+    previous = variants
+    for _ in range(distance):
+        # One more character deleted from each of the previous round's strings
+        previous = {variant[:i] + variant[i + 1:] for variant in previous if len(variant) > 1
+                    for i in range(len(variant))}
+        variants |= previous
+    return variants
+
+def edit_distance(first, second, limit):
+    """
+    Optimal string alignment distance (insertions, deletions, substitutions
+    and adjacent transpositions), or limit + 1 once it exceeds the limit
+    """
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        current = [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = 0 if first[i - 1] == second[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        # Every later row only grows from this one's minimum
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+def close_words(term, max_distance, words_of):
+    """
+    Find the words of a deletion dictionary close to a term
+    
+    Args:
+        term (str): The (lowercased) term
+        max_distance (int): Largest edit distance
+        words_of (function): Deletion string -> the words stored under it (see FuzzyIndex)
+    
+    Returns:
+        list: (word, distance) pairs, closest first, ties alphabetically
+    """
+    if max_distance <= 0:
+        return []
+    candidates = set()
+    for variant in deletions(term, max_distance):
+        candidates.update(words_of(variant))
+    
+    matches = []
+    for word in candidates:
+        distance = edit_distance(term, word, max_distance)
+        if distance <= max_distance:
+            matches.append((word, distance))
+    matches.sort(key=lambda match: (match[1], match[0]))
+    return matches
+
+class FuzzyIndex:
+    """
+    Deletion dictionary over a vocabulary, for typo-tolerant term lookup
+    
+    As in SymSpell, every word is stored under each string made by deleting up
+    to MAX_EDIT_DISTANCE of its characters. Two words within that many edits
+    share such a string, so the candidates for a misspelled term are found by
+    looking up the term's own deletions, with no scan of the vocabulary; only
+    those few candidates have their edit distance computed.
+    """
+    
+    def __init__(self, words=(), max_distance=MAX_EDIT_DISTANCE):
+        """
+        Args:
+            words (iterable): The vocabulary
+            max_distance (int): Largest edit distance lookups can tolerate
+        """
+        self.max_distance = max_distance
+        self.words = set()
+        self.deletes = {}  # Deletion string -> words it was made from
+        for word in words:
+            self.add(word)
+    
+    def __contains__(self, word):
+        return word in self.words
+    
+    def __len__(self):
+        return len(self.words)
+    
+    def add(self, word):
+        """Add a word to the vocabulary"""
+        if word in self.words:
+            return
+        self.words.add(word)
+        # Words too short to be corrected are only ever matched exactly
+        for variant in deletions(word, allowed_distance(word, self.max_distance) and self.max_distance):
+            self.deletes.setdefault(variant, []).append(word)
+    
+    def lookup(self, term, max_distance=None):
+        """
+        Find vocabulary words close to a term
+        
+        Args:
+            term (str): The (lowercased) term
+            max_distance (int, optional): Largest edit distance (default: allowed_distance(term))
+        
+        Returns:
+            list: (word, distance) pairs, closest first, ties alphabetically
+        """
+        if term in self.words:
+            return [(term, 0)]
+        if max_distance is None:
+            max_distance = allowed_distance(term, self.max_distance)
+        return close_words(term, min(max_distance, self.max_distance), lambda variant: self.deletes.get(variant, ()))
+
+def common_prefix_length(first, second):
+    """Number of leading characters two words share"""
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return length
+
+def best_correction(term, candidates):
+    """
+    Pick the correction of a term among its close words
+    
+    Typos are rarest at the start of a word, so among equally close words the
+    one sharing the longest prefix with the term wins, then the most common.
+    
+    Args:
+        term (str): The misspelled term
+        candidates (dict): Word -> (edit distance, number of chunks containing it)
+    
+    Returns:
+        str or None: The chosen word, or None without candidates
+    """
+    if not candidates:
+        return None
+    return min(candidates, key=lambda word: (candidates[word][0], -common_prefix_length(term, word),
+                                             -candidates[word][1], word))
@@ -0,0 +1,551 @@
+import json
+import mmap
+import os
+import struct
+import tempfile
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from cooccurrence import EXPANSION_CAP, merge_related, top_expansions
+from fuzzy_index import allowed_distance, best_correction, close_words
+from segments import positional_bonus, query_phrase
+from term_index import TermIndex
+
+# Layout of a packed index file (arrays little-endian, every section 4-byte aligned):
+#   header:           magic, chunk, term, posting, token, chunk-term, related-term, flashcard,
+#                     deletion-string, deletion-word and definition counts, byte sizes
+#   ids:              uint32[chunks]        global chunk ids, ascending
+#   tombstones:       uint8[chunks]         1 if deleted
+#   term_offsets:     uint32[terms + 1]     offsets into the term bytes
+#   posting_offsets:  uint32[terms + 1]     offsets into positions/counts
+#   token_offsets:    uint32[terms + 1]     offsets into token_positions
+#   positions:        uint32[postings]      chunk positions, ascending per term
+#   counts:           uint32[postings]      term counts
+#   token_positions:  uint32[tokens]        positions of the term in each chunk, posting after posting
+#   text_offsets:     uint32[chunks + 1]    offsets into the text bytes
+#   metadata_offsets: uint32[chunks + 1]    offsets into the metadata bytes
+#   chunk_terms:      uint32[chunks + 1]    offsets into term_ids/term_counts
+#   term_ids:         uint32[chunk terms]   each chunk's terms, in first-seen order
+#   term_counts:      uint32[chunk terms]
+#   related_offsets:  uint32[terms + 1]     offsets into related_terms/related_weights
+#   related_terms:    uint32[related]       each term's strongest co-occurrence neighbours (term numbers)
+#   related_weights:  float32[related]      their normalized PMI, strongest first
+#   pool_offsets:     uint32[flashcards + 1]  offsets into the flashcard bytes
+#   deletion_offsets: uint32[deletions + 1] offsets into the deletion bytes
+#   deletion_words:   uint32[deletions + 1] offsets into deletion_terms
+#   deletion_terms:   uint32[words]         term numbers of the words stored under each deletion string
+#   definition_key_offsets: uint32[definitions + 1]  offsets into the definition key bytes
+#   definition_offsets:     uint32[definitions + 1]  offsets into the definition bytes
+#   term bytes:       UTF-8 terms, sorted bytewise
+#   text bytes:       UTF-8 chunk texts
+#   metadata bytes:   JSON metadata of each chunk
+#   extras:           JSON of the small snapshot fields (outline, section index, ...)
+#   document bytes:   UTF-8 text of the page-indexed document
+#   flashcard bytes:  JSON of each flashcard candidate
+#   deletion bytes:   UTF-8 deletion strings of the typo-tolerant index (see fuzzy_index.py), sorted bytewise
+#   definition key bytes: UTF-8 definition terms (see definitions.py), sorted bytewise
+#   definition bytes: JSON list of each term's definitions
+PACKED_MAGIC = b'PKI4'
+PACKED_HEADER = struct.Struct('<4s' + 'I' * 19)
+
+def packed_directory():
+    """Directory for temporary packed files: RAM-backed /dev/shm where available"""
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+def _padded(size):
+    """Round a byte size up to a multiple of 4"""
+    return (size + 3) & ~3
+
+def _offsets(parts):
+    """Offsets of consecutive byte strings, with the total at the end"""
+    offsets = np.zeros(len(parts) + 1, dtype=np.uint32)
+    offsets[1:] = np.cumsum([len(part) for part in parts])
+    return offsets
+
+def pack_index(snapshot, path):
+    """
+    Write a snapshot of the index to a packed file
+    
+    The file is written next to path and renamed into place, so processes
+    that open path never see a partly written index.
+    
+    Args:
+        snapshot (IndexSnapshot): The snapshot to pack
+        path (str): File to write
+    """
+    ids = []
+    tombstones = []
+    term_postings = {}
+    texts = []
+    metadata = []
+    chunk_terms = []
+    related = {}  # Term -> its related terms in each segment
+    base = 0
+    for segment in snapshot.segments:
+        ids.append(np.frombuffer(segment.ids, dtype=np.uint32))
+        tombstones.append(np.frombuffer(segment.tombstones, dtype=np.uint8))
+        for term, (positions, counts, token_positions) in segment.postings.items():
+            term_postings.setdefault(term, []).append(
+                (np.frombuffer(positions, dtype=np.uint32) + np.uint32(base),
+                 np.frombuffer(counts, dtype=np.uint32),
+                 np.frombuffer(token_positions, dtype=np.uint32)))
+        for doc, terms in zip(segment.documents, segment.document_terms):
+            texts.append(doc.page_content.encode('utf-8'))
+            metadata.append(json.dumps(doc.metadata).encode('utf-8'))
+            chunk_terms.append(terms)
+        for term, neighbours in segment.related.rows():
+            related.setdefault(term, []).append(neighbours)
+        base += len(segment)
+    
+    # Terms sorted by their UTF-8 bytes, so lookups can bisect the raw table
+    encoded = sorted(term.encode('utf-8') for term in term_postings)
+    term_numbers = {term.decode('utf-8'): i for i, term in enumerate(encoded)}
+    posting_offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    token_offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    positions = []
+    counts = []
+    token_positions = []
+    for i, term in enumerate(encoded):
+        postings = term_postings[term.decode('utf-8')]
+        for term_positions, term_counts, term_tokens in postings:
+            positions.append(term_positions)
+            counts.append(term_counts)
+            token_positions.append(term_tokens)
+        posting_offsets[i + 1] = posting_offsets[i] + sum(len(p) for p, _, _ in postings)
+        token_offsets[i + 1] = token_offsets[i] + sum(len(t) for _, _, t in postings)
+    
+    # Related terms merged across segments, as IndexSnapshot.expand_terms merges them
+    related_offsets = np.zeros(len(encoded) + 1, dtype=np.uint32)
+    related_terms = []
+    related_weights = []
+    for i, term in enumerate(encoded):
+        for word, weight in merge_related(related.get(term.decode('utf-8'), ())):
+            related_terms.append(term_numbers[word])
+            related_weights.append(weight)
+        related_offsets[i + 1] = len(related_terms)
+    
+    # The segments' deletion dictionaries merged: the deletion strings sorted (code point
+    # order is UTF-8 byte order), each with the term numbers of its words, taken from
+    # the (deletion number, term number) pairs sorted and deduplicated
+    variants = sorted({variant for segment in snapshot.segments for variant in segment.fuzzy.deletes})
+    deletion_numbers = {variant: i for i, variant in enumerate(variants)}
+    deletion_keys = [variant.encode('utf-8') for variant in variants]
+    term_total = max(len(encoded), 1)
+    pairs = np.unique(np.fromiter((deletion_numbers[variant] * term_total + term_numbers[word]
+                                   for segment in snapshot.segments
+                                   for variant, words in segment.fuzzy.deletes.items() for word in words),
+                                  dtype=np.int64))
+    deletion_terms = pairs % term_total
+    deletion_word_offsets = np.searchsorted(pairs // term_total, np.arange(len(deletion_keys) + 1))
+    
+    # Definitions by term, so lookups bisect the keys and decode one entry
+    definitions = snapshot.definition_index
+    definition_keys = sorted(key.encode('utf-8') for key in definitions)
+    definition_entries = [json.dumps(definitions[key.decode('utf-8')]).encode('utf-8') for key in definition_keys]
+    flashcards = [json.dumps(candidate).encode('utf-8') for candidate in snapshot.flashcard_pool]
+    
+    # Each chunk's term counts, in the order of its Counter
+    chunk_term_offsets = _offsets(chunk_terms)
+    term_ids = np.fromiter((term_numbers[term] for terms in chunk_terms for term in terms),
+                           dtype=np.uint32, count=int(chunk_term_offsets[-1]))
+    term_counts = np.fromiter((count for terms in chunk_terms for count in terms.values()),
+                              dtype=np.uint32, count=int(chunk_term_offsets[-1]))
+    
+    extras = json.dumps({
+        'outline': snapshot.outline,
+        'section_index': snapshot.section_index,
+        'source_index': snapshot.source_index,
+        'has_text': snapshot.text is not None,
+        'pages': list(snapshot.pages),
+        'pages_source': snapshot.pages_source,
+        'next_id': snapshot.next_id,
+    }).encode('utf-8')
+    
+    empty = np.zeros(0, dtype=np.uint32)
+    ids = np.concatenate(ids) if ids else empty
+    tombstones = np.concatenate(tombstones) if tombstones else np.zeros(0, dtype=np.uint8)
+    positions = np.concatenate(positions) if positions else empty
+    counts = np.concatenate(counts) if counts else empty
+    token_positions = np.concatenate(token_positions) if token_positions else empty
+    
+    arrays = [ids.astype('<u4'), tombstones, _offsets(encoded).astype('<u4'), posting_offsets.astype('<u4'),
+              token_offsets.astype('<u4'), positions.astype('<u4'), counts.astype('<u4'),
+              token_positions.astype('<u4'), _offsets(texts).astype('<u4'),
+              _offsets(metadata).astype('<u4'), chunk_term_offsets.astype('<u4'), term_ids.astype('<u4'),
+              term_counts.astype('<u4'), related_offsets.astype('<u4'),
+              np.array(related_terms, dtype='<u4'), np.array(related_weights, dtype='<f4'),
+              _offsets(flashcards).astype('<u4'), _offsets(deletion_keys).astype('<u4'),
+              deletion_word_offsets.astype('<u4'),
+              deletion_terms.astype('<u4'),
+              _offsets(definition_keys).astype('<u4'), _offsets(definition_entries).astype('<u4')]
+    blobs = [b''.join(encoded), b''.join(texts), b''.join(metadata), extras,
+             (snapshot.text or "").encode('utf-8'), b''.join(flashcards), b''.join(deletion_keys),
+             b''.join(definition_keys), b''.join(definition_entries)]
+    
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, 'wb') as f:
+        f.write(PACKED_HEADER.pack(PACKED_MAGIC, len(ids), len(encoded), len(positions), len(token_positions),
+                                   len(term_ids), len(related_terms), len(flashcards), len(deletion_keys),
+                                   int(deletion_word_offsets[-1]), len(definition_keys),
+                                   *(len(blob) for blob in blobs)))
+        for data in [array.tobytes() for array in arrays] + blobs:
+            f.write(data.ljust(_padded(len(data)), b'\0'))
+    os.replace(temporary_path, path)
+
+class _TermTable:
+    """Sequence view of the sorted term bytes, for bisecting without decoding the table"""
+    
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+    
+    def __len__(self):
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, i):
+        return bytes(self._data[self._offsets[i]:self._offsets[i + 1]])
+    
+    def find(self, key):
+        """Position of a UTF-8 key in the table, or None"""
+        i = bisect_left(self, key)
+        if i < len(self) and self[i] == key:
+            return i
+        return None
+
+class _RecordList(Sequence):
+    """Sequence view of JSON records in the mapping, each decoded when accessed"""
+    
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+    
+    def __len__(self):
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("record index out of range")
+        return json.loads(bytes(self._data[self._offsets[i]:self._offsets[i + 1]]))
+
+class _DefinitionTable(Mapping):
+    """Mapping view of the packed definition index (see definitions.build_definition_index)"""
+    
+    def __init__(self, keys, entries):
+        self._keys = keys
+        self._entries = entries
+    
+    def __len__(self):
+        return len(self._keys)
+    
+    def __iter__(self):
+        for i in range(len(self._keys)):
+            yield self._keys[i].decode('utf-8')
+    
+    def __getitem__(self, key):
+        i = self._keys.find(key.encode('utf-8'))
+        if i is None:
+            raise KeyError(key)
+        return self._entries[i]
+
+class PackedIndex:
+    """
+    Read-only, memory-mapped index with the read interface of IndexSnapshot
+    
+    Every array is a NumPy view straight into the mapping and chunks are
+    decoded only when asked for, so any number of processes can map the same
+    file while the operating system keeps one copy of it in memory. The
+    document text, flashcard candidates, definitions and the typo-tolerant
+    deletion dictionary are likewise read from the mapping when used, and
+    never kept. What a process does keep privately: the small snapshot
+    fields of the extras section (outline, section and source indexes, page
+    records, a few ids per chunk), decoded on first use, and the term index
+    of the text, built only if asked for (flashcard validation).
+    """
+    
+    def __init__(self, path):
+        """
+        Args:
+            path (str): A file written by pack_index
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        (magic, chunk_count, term_count, posting_count, token_count, chunk_term_count, related_count,
+         flashcard_count, deletion_count, deletion_word_count, definition_count, term_bytes, text_bytes,
+         metadata_bytes, extras_bytes, document_bytes, flashcard_bytes, deletion_bytes, definition_key_bytes,
+         definition_bytes) = PACKED_HEADER.unpack_from(self._map, 0)
+        if magic != PACKED_MAGIC:
+            raise ValueError(f"{path} is not a packed index of this version")
+        
+        offset = PACKED_HEADER.size
+        def view(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(self._map, dtype=dtype, count=count, offset=offset)
+            offset += _padded(array.nbytes)
+            return array
+        
+        def raw(size):
+            nonlocal offset
+            data = memoryview(self._map)[offset:offset + size]
+            offset += _padded(size)
+            return data
+        
+        self.ids = view('<u4', chunk_count)
+        self.tombstones = view(np.uint8, chunk_count)
+        term_offsets = view('<u4', term_count + 1)
+        self.posting_offsets = view('<u4', term_count + 1)
+        self.token_offsets = view('<u4', term_count + 1)
+        self.positions = view('<u4', posting_count)
+        self.counts = view('<u4', posting_count)
+        self.token_positions = view('<u4', token_count)
+        self.text_offsets = view('<u4', chunk_count + 1)
+        self.metadata_offsets = view('<u4', chunk_count + 1)
+        self.chunk_terms = view('<u4', chunk_count + 1)
+        self.term_ids = view('<u4', chunk_term_count)
+        self.term_counts = view('<u4', chunk_term_count)
+        self.related_offsets = view('<u4', term_count + 1)
+        self.related_terms = view('<u4', related_count)
+        self.related_weights = view('<f4', related_count)
+        pool_offsets = view('<u4', flashcard_count + 1)
+        deletion_offsets = view('<u4', deletion_count + 1)
+        self.deletion_words = view('<u4', deletion_count + 1)
+        self.deletion_terms = view('<u4', deletion_word_count)
+        definition_key_offsets = view('<u4', definition_count + 1)
+        definition_offsets = view('<u4', definition_count + 1)
+        self.terms = _TermTable(raw(term_bytes), term_offsets)
+        self._text = raw(text_bytes)
+        self._metadata = raw(metadata_bytes)
+        self._extras_bytes = raw(extras_bytes)
+        self._document = raw(document_bytes)
+        self.flashcard_pool = _RecordList(raw(flashcard_bytes), pool_offsets)
+        self.deletions = _TermTable(raw(deletion_bytes), deletion_offsets)
+        self.definition_index = _DefinitionTable(_TermTable(raw(definition_key_bytes), definition_key_offsets),
+                                                 _RecordList(raw(definition_bytes), definition_offsets))
+        self._extras = None
+        self._term_index = None
+    
+    def _extra(self, name):
+        """A snapshot field from the extras section"""
+        if self._extras is None:
+            extras = json.loads(bytes(self._extras_bytes))
+            # JSON turns the indexes' tuples into lists
+            for index in ('section_index', 'source_index'):
+                extras[index] = {key: tuple(ids) for key, ids in extras[index].items()}
+            self._extras = extras
+        return self._extras[name]
+    
+    outline = property(lambda self: self._extra('outline'))
+    section_index = property(lambda self: self._extra('section_index'))
+    source_index = property(lambda self: self._extra('source_index'))
+    pages = property(lambda self: tuple(self._extra('pages')))
+    pages_source = property(lambda self: self._extra('pages_source'))
+    next_id = property(lambda self: self._extra('next_id'))
+    
+    @property
+    def text(self):
+        """Text of the page-indexed document, decoded from the mapping on each use"""
+        if not self._extra('has_text'):
+            return None
+        return str(self._document, 'utf-8')
+    
+    @property
+    def term_index(self):
+        """Positional word index of the text, built on first use"""
+        if self._term_index is None and self.text is not None:
+            self._term_index = TermIndex(self.text)
+        return self._term_index
+    
+    @property
+    def size(self):
+        """Number of chunk slots, deleted ones included"""
+        return len(self.ids)
+    
+    @property
+    def deleted_count(self):
+        """Number of deleted chunks"""
+        return int(np.count_nonzero(self.tombstones))
+    
+    def term_number(self, term):
+        """Position of a term in the term table, or None"""
+        return self.terms.find(term.encode('utf-8'))
+    
+    def correct_terms(self, terms):
+        """
+        Closest indexed word of each term the index does not contain
+        
+        Candidates come from the packed deletion dictionary, as
+        FuzzyIndex.lookup finds them, so nothing is built in memory.
+        
+        Returns:
+            dict: Term -> correction, for the unknown terms that are close to an indexed word
+        """
+        corrections = {}
+        for term in dict.fromkeys(terms):
+            if self.term_number(term) is not None:
+                continue
+            candidates = {}
+            for word, distance in close_words(term, allowed_distance(term), self._deletion_words):
+                i = self.term_number(word)
+                candidates[word] = (distance, int(self.posting_offsets[i + 1] - self.posting_offsets[i]))
+            correction = best_correction(term, candidates)
+            if correction is not None:
+                corrections[term] = correction
+        return corrections
+    
+    def _deletion_words(self, variant):
+        """The words stored under a deletion string in the packed deletion dictionary"""
+        i = self.deletions.find(variant.encode('utf-8'))
+        if i is None:
+            return []
+        return [self.terms[j].decode('utf-8')
+                for j in self.deletion_terms[self.deletion_words[i]:self.deletion_words[i + 1]]]
+    
+    def expand_terms(self, query_terms):
+        """
+        Terms of the material most related to the query terms, to expand the query with
+        
+        Returns:
+            dict: Expansion term -> score per occurrence, as IndexSnapshot.expand_terms
+        """
+        def related(term):
+            i = self.term_number(term)
+            if i is None:
+                return []
+            start, end = self.related_offsets[i], self.related_offsets[i + 1]
+            return [(self.terms[j].decode('utf-8'), float(weight))
+                    for j, weight in zip(self.related_terms[start:end], self.related_weights[start:end])]
+        return top_expansions(query_terms, related)
+    
+    def position(self, doc_id):
+        """Position of a chunk id in the index, or None"""
+        i = int(np.searchsorted(self.ids, doc_id))
+        if i < len(self.ids) and self.ids[i] == doc_id:
+            return i
+        return None
+    
+    def is_live(self, doc_id):
+        """Check whether a chunk is in the index and not deleted"""
+        position = self.position(doc_id)
+        return position is not None and not self.tombstones[position]
+    
+    def live_ids(self):
+        """Yield the ids of all live chunks, in order"""
+        for doc_id in self.ids[self.tombstones == 0]:
+            yield int(doc_id)
+    
+    def document(self, doc_id):
+        """The Document of a chunk, decoded from the mapping"""
+        position = self.position(doc_id)
+        text = self._text[self.text_offsets[position]:self.text_offsets[position + 1]]
+        metadata = self._metadata[self.metadata_offsets[position]:self.metadata_offsets[position + 1]]
+        return Document(page_content=str(text, 'utf-8'), metadata=json.loads(bytes(metadata)))
+    
+    def term_vector(self, doc_id):
+        """The unit term vector of a chunk (see vector_store.unit_term_vector)"""
+        position = self.position(doc_id)
+        first, last = self.chunk_terms[position], self.chunk_terms[position + 1]
+        terms = tuple(self.terms[i].decode('utf-8') for i in self.term_ids[first:last])
+        weights = self.term_counts[first:last].astype(float)
+        norm = np.linalg.norm(weights)
+        if norm > 0:
+            weights /= norm
+        return terms, weights
+    
+    def top_scores(self, query_terms, limit, allowed=None, start=0, end=None, offsets=None, expansions=None):
+        """
+        Score chunks by the counts of the query terms they contain
+        
+        Scores match IndexSnapshot.top_scores, phrase and proximity bonus and expansion terms included.
+        
+        Args:
+            query_terms (list): Query terms (repeated terms count repeatedly)
+            limit (int): Number of results to return
+            allowed (collection, optional): Chunk ids to restrict the search to
+            start (int): First chunk position to score
+            end (int, optional): Chunk position to stop at (default: the last chunk)
+            offsets (list, optional): Token position of each query term in the query
+            expansions (dict, optional): Expansion term -> score per occurrence
+        
+        Returns:
+            tuple: ((id, score) pairs by score descending, ties in id order,
+                   number of chunks with a non-zero score)
+        """
+        end = len(self.ids) if end is None else end
+        phrase = query_phrase(query_terms, offsets)
+        scores = np.zeros(end - start, dtype=np.float64)
+        present = np.zeros(end - start, dtype=np.int64)
+        found = {}  # Query term -> (chunk positions, token start, token end) of its postings in range
+        for term in query_terms:
+            i = self.term_number(term)
+            if i is None:
+                continue
+            positions = self.positions[self.posting_offsets[i]:self.posting_offsets[i + 1]]
+            counts = self.counts[self.posting_offsets[i]:self.posting_offsets[i + 1]]
+            first, last = np.searchsorted(positions, (start, end))
+            # A chunk appears at most once per posting list
+            scores[positions[first:last] - start] += counts[first:last]
+            if phrase and term not in found:
+                # Each posting's token positions follow those of the postings before it
+                token_ends = self.token_offsets[i] + np.cumsum(counts, dtype=np.int64)
+                found[term] = (positions[first:last], token_ends[first:last] - counts[first:last],
+                               token_ends[first:last])
+                present[positions[first:last] - start] += 1
+        credits = np.zeros(end - start, dtype=np.float64)  # Score of the expansion terms, before the cap
+        for term, weight in (expansions or {}).items():
+            i = self.term_number(term)
+            if i is None:
+                continue
+            positions = self.positions[self.posting_offsets[i]:self.posting_offsets[i + 1]]
+            counts = self.counts[self.posting_offsets[i]:self.posting_offsets[i + 1]]
+            first, last = np.searchsorted(positions, (start, end))
+            credits[positions[first:last] - start] += weight * counts[first:last]
+        scores += np.minimum(credits, EXPANSION_CAP)
+        
+        ids = self.ids[start:end]
+        scores[self.tombstones[start:end] != 0] = 0
+        if allowed is not None:
+            scores[~np.isin(ids, np.fromiter(allowed, dtype=np.uint32, count=len(allowed)))] = 0
+        
+        # Phrase and proximity bonus of the chunks holding two or more query terms
+        for position in np.flatnonzero((present > 1) & (scores > 0)):
+            chunk = {}
+            for term, (positions, token_starts, token_ends) in found.items():
+                j = int(np.searchsorted(positions, position + start))
+                if j < len(positions) and positions[j] == position + start:
+                    chunk[term] = self.token_positions[token_starts[j]:token_ends[j]].tolist()
+            scores[position] += positional_bonus(phrase, chunk)
+        
+        candidates = np.flatnonzero(scores)
+        scored_count = len(candidates)
+        if scored_count > limit:
+            # Everything scoring at least the limit-th best score, then an exact sort
+            threshold = np.partition(scores[candidates], scored_count - limit)[scored_count - limit]
+            candidates = candidates[scores[candidates] >= threshold]
+        
+        order = np.lexsort((ids[candidates], -scores[candidates]))[:limit]
+        ranking = [(int(ids[candidates[i]]), float(scores[candidates[i]])) for i in order]
+        return ranking, scored_count
+    
+    def close(self):
+        """Release the mapping (arrays taken from the index must not be used afterwards)"""
+        for name in ('ids', 'tombstones', 'posting_offsets', 'token_offsets', 'positions', 'counts',
+                     'token_positions', 'text_offsets', 'metadata_offsets', 'chunk_terms', 'term_ids',
+                     'term_counts', 'related_offsets', 'related_terms', 'related_weights', 'deletion_words',
+                     'deletion_terms', 'terms', 'deletions', 'flashcard_pool', 'definition_index', '_text',
+                     '_metadata', '_extras_bytes', '_document'):
+            setattr(self, name, None)
+        try:
+            self._map.close()
+        except BufferError:
+            # Views handed out are still alive; the mapping goes away with the last of them
+            pass
@@ -0,0 +1,128 @@
+import re
+from collections import deque
+
+WORD_PATTERN = re.compile(r'\w+')
+
+# Punctuation that str.split() leaves attached to words
+LEADING_PUNCTUATION = '("\'['
+TRAILING_PUNCTUATION = '.,;:!?)"\']'
+
+# Structural cues used by the flashcard and summary heuristics, compiled once.
+# Longer verb phrases come first so "is defined as" is not cut short at "is".
+DEFINITION_PATTERN = re.compile(
+    r'([A-Z][a-zA-Z\s]+)\s+(is defined as|can be defined as|refers to|means|is|are)\s+([^\.]+)')
+COLON_PATTERN = re.compile(r'([A-Z][a-zA-Z\s]+):\s+([^\.]+)')
+FACT_PATTERN = re.compile(r'\b(?:in|on|during)\s+\d{4}\b|\b\d+\s+(?:percent|%)')
+SECTION_NUMBER_PATTERN = re.compile(r'^(\d+\.|\([\d]+\)|\w+\))')
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over words, matching many labelled phrase lists at once
+    
+    The automaton's alphabet is words rather than characters: a sentence is
+    split once and every phrase of every list is found in a single pass over
+    its words. Phrases match on word boundaries. Each edge is also reachable
+    with punctuation attached, so plain str.split() output can be scanned
+    without a regex tokenizer.
+    """
+    
+    def __init__(self, phrases_by_label):
+        """
+        Args:
+            phrases_by_label (dict): Label -> list of phrases
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [frozenset()]
+        
+        # Build the trie of phrases
+        for label, phrases in phrases_by_label.items():
+            for phrase in phrases:
+                state = 0
+                for word in WORD_PATTERN.findall(phrase.lower()):
+                    next_state = self._goto[state].get(word)
+                    if next_state is None:
+                        next_state = len(self._goto)
+                        self._goto[state][word] = next_state
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._output.append(frozenset())
+                    state = next_state
+                self._output[state] = self._output[state] | {label}
+        
+        # Failure links, breadth first, so each state also reports its suffixes' labels
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(word, 0)
+                self._output[next_state] = self._output[next_state] | self._output[self._fail[next_state]]
+        
+        # Let words with attached punctuation ("results.", "(key") follow the same edges
+        for edges in self._goto:
+            for word, next_state in list(edges.items()):
+                for mark in LEADING_PUNCTUATION:
+                    edges.setdefault(mark + word, next_state)
+                for mark in TRAILING_PUNCTUATION:
+                    edges.setdefault(word + mark, next_state)
+    
+    def labels(self, tokens):
+        """
+        Find which phrase lists occur in a token sequence
+        
+        Args:
+            tokens (list): Lowercased words, e.g. sentence.lower().split()
+        
+        Returns:
+            set: Labels of the lists with at least one phrase present
+        """
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        root = goto[0]
+        found = set()
+        state = 0
+        for token in tokens:
+            if state:
+                while state and token not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(token, 0)
+            else:
+                # Most words do not start a phrase: one dictionary miss at the root
+                state = root.get(token, 0)
+                if not state:
+                    continue
+            if output[state]:
+                found |= output[state]
+        return found
+
+# Shared cue phrases for the flashcard and summary heuristics
+CUE_PHRASES = PhraseMatcher({
+    # Words that mark a statement of an important concept
+    "important": ["key", "important", "significant", "essential", "fundamental",
+                  "critical", "vital", "primary", "main", "major", "central"],
+    # Verbs the definition pattern needs; sentences without them skip that regex
+    "definition_verb": ["is", "are", "refers to", "means", "can be defined as"],
+    # Sentences that introduce or wrap up a section
+    "section_marker": ["introduction", "conclusion", "summary", "overview", "background",
+                       "key points", "findings", "results", "analysis", "discussion"],
+    # Phrases that signal an explanation
+    "explanation": ["means", "refers to", "is defined as", "is a", "describes", "explains",
+                    "consists of", "involves", "includes", "represents"],
+})
+
+def sentence_cues(sentence):
+    """
+    Split a sentence once and find all cue phrase labels in it
+    
+    Args:
+        sentence (str): The sentence text
+    
+    Returns:
+        set: Labels from CUE_PHRASES present in the sentence
+    """
+    return CUE_PHRASES.labels(sentence.lower().split())
@@ -1,7 +1,23 @@
+import hashlib
+import io
+import mmap
+import os
 import PyPDF2
 import re
+from contextlib import contextmanager
+from bisect import bisect_right
+from collections import Counter
+import tracing
 from utils import clean_text
 
+# Heading patterns, applied line by line to the raw page text (before cleaning)
+NUMBERED_HEADING_PATTERN = re.compile(r'^\s*(\d+\.[\d\.]*\s+[A-Z][^\n]{0,100})$', re.MULTILINE)
+CAPITALIZED_HEADING_PATTERN = re.compile(r'^\s*([A-Z][A-Z\s]{2,80}[A-Z])\s*$', re.MULTILINE)
+CHAPTER_PATTERN = re.compile(r'\b(?:CHAPTER|Section|Part)\s+\d+', re.IGNORECASE)
+
+# Lines near the top/bottom of a page that are checked for running headers and footers
+BOILERPLATE_LINES = 2
+
 def extract_text_from_pdf(pdf_path):
     """
     Extract text from a PDF file
@@ -12,27 +28,219 @@ def extract_text_from_pdf(pdf_path):
     Returns:
         str: Extracted text from the PDF
     """
-    extracted_text = ""
+    return process_pdf(pdf_path)['text']
+
+@contextmanager
+def open_pdf_buffer(source):
+    """
+    Give PyPDF2 a seekable view of the PDF without copying it to disk
+    
+    Args:
+        source (bytes, str or file-like): Raw PDF bytes, a path, or an open binary file
+    
+    Yields:
+        A binary stream over the PDF contents
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        # BytesIO shares the buffer of an immutable bytes object instead of copying it
+        yield io.BytesIO(source)
+    elif isinstance(source, (str, os.PathLike)):
+        # Memory-map files so pages are read straight from the OS page cache
+        with open(source, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                yield file
+            else:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    yield buffer
+    else:
+        yield source
+
+@tracing.traced("extraction")
+def process_pdf(source, strip_boilerplate=True, previous=None):
+    """
+    Parse a PDF once and extract its text, metadata, outline and page statistics
+    
+    Extraction errors are recorded per page, so one broken page does not lose
+    the rest of the document.
+    
+    Args:
+        source (bytes, str or file-like): Raw PDF bytes (e.g. an upload), a path, or an open binary file
+        strip_boilerplate (bool): Remove running headers and footers repeated across pages
+        previous (dict, optional): Result of processing an earlier revision of the same PDF;
+            pages whose content fingerprint is unchanged reuse its extracted text
+    
+    Returns:
+        dict: 'text', 'pages' (cleaned page texts), 'page_offsets', 'metadata',
+              'outline', 'page_stats', 'errors', 'fingerprints' and 'raw_pages'
+    """
+    raw_pages = []
+    fingerprints = []
+    page_stats = []
+    errors = []
+    metadata = {}
+    bookmarks = []
+    
+    # Extracted text of the previous revision's pages, by content fingerprint
+    known_pages = {}
+    if previous:
+        known_pages = {fingerprint: page_text
+                       for fingerprint, page_text in zip(previous['fingerprints'], previous['raw_pages'])
+                       if fingerprint is not None}
     
     try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            num_pages = len(reader.pages)
+        with open_pdf_buffer(source) as buffer:
+            reader = PyPDF2.PdfReader(buffer)
+            metadata = read_metadata(reader)
+            bookmarks = extract_bookmarks(reader)
             
-            for page_num in range(num_pages):
-                page = reader.pages[page_num]
-                text = page.extract_text()
+            for page_num, page in enumerate(reader.pages):
+                error = None
+                fingerprint = page_fingerprint(page)
+                reused = fingerprint in known_pages
+                if reused:
+                    page_text = known_pages[fingerprint]
+                else:
+                    try:
+                        page_text = page.extract_text() or ""
+                    except Exception as e:
+                        page_text = ""
+                        error = str(e)
+                        errors.append({'page': page_num, 'error': error})
+                        fingerprint = None  # Never reuse a failed extraction
                 
-                if text:
-                    extracted_text += text + "\n\n"
+                raw_pages.append(page_text)
+                fingerprints.append(fingerprint)
+                page_stats.append({'page': page_num, 'chars': len(page_text), 'error': error,
+                                   'reused': reused})
     
     except Exception as e:
         print(f"Error extracting text from PDF: {e}")
-        return ""
+        tracing.record_error("extraction", e)
+        errors.append({'page': None, 'error': str(e)})
+    
+    reused_count = sum(1 for stats in page_stats if stats['reused'])
+    tracing.count("pages_extracted", len(page_stats) - reused_count)
+    tracing.count("cache_hits", reused_count, cache="extracted_pages")
+    tracing.count("cache_misses", len(page_stats) - reused_count, cache="extracted_pages")
+    tracing.count("page_errors", sum(1 for error in errors if error['page'] is not None))
+    
+    extracted_pages = raw_pages
+    if strip_boilerplate:
+        raw_pages, stripped_counts = strip_headers_footers(raw_pages)
+    else:
+        stripped_counts = [0] * len(raw_pages)
+    
+    text, page_offsets, cleaned_pages = join_cleaned_pages(raw_pages)
+    outline = build_outline(raw_pages, cleaned_pages, page_offsets, len(text), bookmarks)
+    
+    for stats, page_text, stripped in zip(page_stats, cleaned_pages, stripped_counts):
+        stats['words'] = len(page_text.split())
+        stats['stripped_lines'] = stripped
+    
+    return {
+        'text': text,
+        'pages': cleaned_pages,
+        'page_offsets': page_offsets,
+        'metadata': metadata,
+        'outline': outline,
+        'page_stats': page_stats,
+        'errors': errors,
+        'fingerprints': fingerprints,
+        'raw_pages': extracted_pages,
+    }
+
+def page_fingerprint(page):
+    """
+    Fingerprint a page by its raw content stream
+    
+    Hashing the decoded content stream is much cheaper than extracting text,
+    so unchanged pages of a revised PDF can be recognised without extraction.
+    
+    Args:
+        page (PyPDF2.PageObject): The page
+    
+    Returns:
+        str or None: Hex digest, or None if the content stream cannot be read
+    """
+    try:
+        contents = page.get_contents()
+        data = contents.get_data() if contents is not None else b''
+    except Exception as e:
+        print(f"Error reading page content stream: {e}")
+        tracing.record_error("extraction", e)
+        return None
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _boilerplate_key(line):
+    """Normalize a line so page numbers and dates don't hide repetition"""
+    return re.sub(r'\d+', '#', line.strip().lower())
+
+def strip_headers_footers(raw_pages, min_ratio=0.5):
+    """
+    Remove running headers and footers repeated across pages
+    
+    A line counts as boilerplate when, with digits normalized, it appears among
+    the first or last few lines of at least min_ratio of the pages.
+    
+    Args:
+        raw_pages (list): Raw text of each page
+        min_ratio (float): Fraction of pages a line must repeat on
+    
+    Returns:
+        tuple: (stripped page texts, number of lines removed from each page)
+    """
+    non_empty = [page for page in raw_pages if page.strip()]
+    if len(non_empty) < 3:
+        return raw_pages, [0] * len(raw_pages)
+    
+    # Count on how many pages each edge line occurs
+    counts = Counter()
+    for page_text in non_empty:
+        lines = [line for line in page_text.splitlines() if line.strip()]
+        edges = lines[:BOILERPLATE_LINES] + lines[-BOILERPLATE_LINES:]
+        counts.update({_boilerplate_key(line) for line in edges})
+    
+    min_pages = max(2, int(len(non_empty) * min_ratio))
+    boilerplate = {key for key, count in counts.items() if count >= min_pages}
+    if not boilerplate:
+        return raw_pages, [0] * len(raw_pages)
+    
+    stripped_pages = []
+    stripped_counts = []
+    for page_text in raw_pages:
+        lines = page_text.splitlines()
+        content = [i for i, line in enumerate(lines) if line.strip()]
+        edge_indexes = set(content[:BOILERPLATE_LINES] + content[-BOILERPLATE_LINES:])
+        removed = {i for i in edge_indexes if _boilerplate_key(lines[i]) in boilerplate}
+        stripped_pages.append("\n".join(line for i, line in enumerate(lines) if i not in removed))
+        stripped_counts.append(len(removed))
+    
+    return stripped_pages, stripped_counts
+
+def join_cleaned_pages(raw_pages):
+    """
+    Clean each page and join them into a single text
+    
+    Args:
+        raw_pages (list): Raw text of each page
+    
+    Returns:
+        tuple: (cleaned text, start offset of each page, cleaned page texts)
+    """
+    cleaned_pages = [clean_text(page) for page in raw_pages]
+    page_offsets = []
+    parts = []
+    position = 0
     
-    # Clean the extracted text
-    cleaned_text = clean_text(extracted_text)
-    return cleaned_text
+    for page_text in cleaned_pages:
+        if page_text and parts:
+            position += 1  # Account for the joining space
+        page_offsets.append(position)
+        if page_text:
+            parts.append(page_text)
+            position += len(page_text)
+    
+    return " ".join(parts), page_offsets, cleaned_pages
 
 def extract_metadata(pdf_path):
     """
@@ -47,58 +255,164 @@ def extract_metadata(pdf_path):
     metadata = {}
     
     try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            metadata_dict = reader.metadata
-            
-            if metadata_dict:
-                for key, value in metadata_dict.items():
-                    # Clean up the key name
-                    clean_key = key.replace('/', '')
-                    metadata[clean_key] = value
+        with open_pdf_buffer(pdf_path) as buffer:
+            metadata = read_metadata(PyPDF2.PdfReader(buffer))
+    
+    except Exception as e:
+        print(f"Error extracting metadata from PDF: {e}")
+        tracing.record_error("extraction", e)
+    
+    return metadata
+
+def read_metadata(reader):
+    """
+    Read the document information dictionary of an open PDF
+    
+    Args:
+        reader (PyPDF2.PdfReader): An open PDF reader
+    
+    Returns:
+        dict: Metadata from the PDF
+    """
+    metadata = {}
     
+    try:
+        metadata_dict = reader.metadata
     except Exception as e:
         print(f"Error extracting metadata from PDF: {e}")
+        tracing.record_error("extraction", e)
+        return metadata
+    
+    if metadata_dict:
+        for key, value in metadata_dict.items():
+            # Clean up the key name
+            clean_key = key.replace('/', '')
+            metadata[clean_key] = str(value)
     
     return metadata
 
-def identify_structure(text):
+def extract_bookmarks(reader):
+    """
+    Flatten the PDF outline (bookmarks) into a list
+    
+    Args:
+        reader (PyPDF2.PdfReader): An open PDF reader
+    
+    Returns:
+        list: (title, level, page number) tuples in document order
+    """
+    bookmarks = []
+    
+    def walk(items, level):
+        for item in items:
+            if isinstance(item, list):
+                walk(item, level + 1)
+                continue
+            try:
+                page_num = reader.get_destination_page_number(item)
+            except Exception:
+                continue
+            title = str(item.title or "").strip()
+            if title and page_num is not None and page_num >= 0:
+                bookmarks.append((title, level, page_num))
+    
+    try:
+        walk(reader.outline, 0)
+    except Exception as e:
+        print(f"Error reading PDF outline: {e}")
+        tracing.record_error("extraction", e)
+        return []
+    
+    return bookmarks
+
+def identify_structure(pages):
     """
     Identify the structure of the document based on headings, etc.
     
+    Headings are anchored on line breaks, so this must run on the raw page
+    text before clean_text collapses the whitespace.
+    
     Args:
-        text (str): The extracted text from the PDF
+        pages (list or str): The raw extracted text of each page (or of a single page)
     
     Returns:
-        dict: Identified structure elements
+        dict: Identified structure elements, each with the page it was found on
     """
+    if isinstance(pages, str):
+        pages = [pages]
+    
     structure = {
         'sections': [],
         'potential_chapters': []
     }
     
-    # Look for numbered headings (e.g., "1. Introduction", "1.1 Background")
-    numbered_headings = re.findall(r'\n\s*(\d+\.[\d\.]*\s+[A-Z][^\n]+)', text)
+    for page_num, page_text in enumerate(pages):
+        if not page_text:
+            continue
+        
+        # Look for numbered headings (e.g., "1. Introduction", "1.1 Background")
+        for match in NUMBERED_HEADING_PATTERN.finditer(page_text):
+            heading = match.group(1).strip()
+            # The depth of the numbering gives the heading level
+            level = len([part for part in heading.split()[0].split('.') if part]) - 1
+            structure['sections'].append({'title': heading, 'level': level, 'page': page_num,
+                                          'position': match.start(1)})
+        
+        # Look for capitalized headings
+        for match in CAPITALIZED_HEADING_PATTERN.finditer(page_text):
+            structure['sections'].append({'title': match.group(1).strip(), 'level': 0, 'page': page_num,
+                                          'position': match.start(1)})
+        
+        # Identify potential chapters
+        for match in CHAPTER_PATTERN.finditer(page_text):
+            structure['potential_chapters'].append({'title': match.group(0), 'page': page_num})
+    
+    # Keep headings in reading order
+    structure['sections'].sort(key=lambda s: (s['page'], s['position']))
+    
+    return structure
+
+def build_outline(raw_pages, cleaned_pages, page_offsets, text_length, bookmarks=None):
+    """
+    Build a document outline mapping each heading to its page and offset range
+    
+    PDF bookmarks are used when the document has them; otherwise headings are
+    detected from the raw page text.
     
-    # Look for capitalized headings
-    capitalized_headings = re.findall(r'\n\s*([A-Z][A-Z\s]+[A-Z])\s*\n', text)
+    Args:
+        raw_pages (list): Raw text of each page
+        cleaned_pages (list): Cleaned text of each page
+        page_offsets (list): Offset of each page in the cleaned text
+        text_length (int): Length of the cleaned text
+        bookmarks (list, optional): (title, level, page) tuples from the PDF outline
     
-    # Combine all identified headings
-    all_headings = numbered_headings + capitalized_headings
+    Returns:
+        list: Sections with 'title', 'level', 'page', 'end_page', 'start' and 'end'
+    """
+    if bookmarks:
+        headings = [(title, level, page_num) for title, level, page_num in bookmarks
+                    if page_num < len(cleaned_pages)]
+    else:
+        structure = identify_structure(raw_pages)
+        headings = [(s['title'], s['level'], s['page']) for s in structure['sections']]
     
-    if all_headings:
-        structure['sections'] = all_headings
+    outline = []
+    for title, level, page_num in headings:
+        # Locate the heading inside its (cleaned) page, falling back to the page start
+        position = cleaned_pages[page_num].find(clean_text(title))
+        start = page_offsets[page_num] + max(position, 0)
+        outline.append({'title': title, 'level': level, 'page': page_num, 'start': start})
     
-    # Identify potential chapters
-    chapter_patterns = [
-        r'\bCHAPTER\s+\d+',
-        r'\bSection\s+\d+',
-        r'\bPart\s+\d+'
-    ]
+    outline.sort(key=lambda s: s['start'])
     
-    for pattern in chapter_patterns:
-        chapters = re.findall(pattern, text, re.IGNORECASE)
-        if chapters:
-            structure['potential_chapters'].extend(chapters)
+    # A section ends where the next section of the same or a higher level starts
+    for i, section in enumerate(outline):
+        end = text_length
+        for following in outline[i + 1:]:
+            if following['level'] <= section['level']:
+                end = following['start']
+                break
+        section['end'] = end
+        section['end_page'] = max(bisect_right(page_offsets, max(end - 1, section['start'])) - 1, section['page'])
     
-    return structure
+    return outline
@@ -0,0 +1,272 @@
+"""
+Opt-in profiling of single requests, with flame-graph output
+
+RequestProfiler wraps one request (an upload, a question, a batch of
+flashcards or summaries) in a stack profiler and, optionally, tracemalloc.
+When the request finishes it writes, under PROFILE_DIR:
+
+- <name>.collapsed: collapsed stacks ("frame;frame;frame value" per line), the
+  input of flamegraph.pl, speedscope or inferno
+- <name>.json: the request (kind, document hash, query, options), its
+  duration, memory peak and top allocation sites, and the replay files
+- <hash>.pdf and index-<hash>.pack: the uploaded PDF and a packed copy of the
+  index (written once per document), so the request can be replayed offline
+  with benchmarks/replay_profile.py against the same index
+
+Profiling is expensive and only meant for catching the odd pathological
+query or PDF; profiled requests run one at a time.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+
+# Where profiles are written unless a directory is given
+PROFILE_DIR = os.environ.get("PROFILE_DIR", ".profiles")
+
+# Sampling interval of the sampling profiler, in seconds
+SAMPLE_INTERVAL = 0.005
+
+# Allocation sites kept in the report, and frames tracemalloc records per allocation
+TOP_ALLOCATIONS = 15
+TRACEMALLOC_FRAMES = 1
+
+PROFILE_MODES = ("sampling", "deterministic")
+
+# tracemalloc and the sampler are process-wide, so profiled requests take turns
+_profile_lock = threading.Lock()
+
+def document_hash(data):
+    """SHA-256 of a document's bytes, identifying it in profiles"""
+    return hashlib.sha256(data).hexdigest()
+
+def frame_label(code):
+    """Flame graph label of a code object, e.g. vector_store.py:get_relevant_documents"""
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class _StackSampler:
+    """Samples the stack of one thread at a fixed interval from a background thread"""
+    
+    def __init__(self, thread_id, root_frame, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.root_frame = root_frame
+        self.interval = interval
+        self.stacks = Counter()  # Stack (outermost first) -> number of samples
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def start(self):
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            # Walk out to the frame that opened the profiler; frames above it are not part of the request
+            while frame is not None and frame is not self.root_frame:
+                stack.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+class _CallTracer:
+    """Times every call of the current thread with sys.setprofile, as self time per stack"""
+    
+    def __init__(self):
+        self.stacks = Counter()  # Stack (outermost first) -> self time in seconds
+        self._path = []
+        self._last = 0.0
+        self._previous = None
+    
+    def start(self):
+        self._previous = sys.getprofile()
+        self._last = time.perf_counter()
+        sys.setprofile(self._event)
+    
+    def stop(self):
+        sys.setprofile(self._previous)
+    
+    def _event(self, frame, event, arg):
+        now = time.perf_counter()
+        if self._path:
+            self.stacks[tuple(self._path)] += now - self._last
+        
+        if event == 'call':
+            self._path.append(frame_label(frame.f_code))
+        elif event == 'c_call':
+            self._path.append(f"<built-in>:{getattr(arg, '__qualname__', getattr(arg, '__name__', 'function'))}")
+        elif event in ('return', 'c_return', 'c_exception') and self._path:
+            # Returns from frames entered before profiling started have nothing to pop
+            self._path.pop()
+        
+        # Leave the profiler's own time out of the next interval
+        self._last = time.perf_counter()
+
+class RequestProfiler:
+    """
+    Profile one request and write its flame graph and report
+    
+    Usage:
+        with RequestProfiler("query", document_hash=digest, query=question, store=store) as profiler:
+            answer = answer_question(question, retriever)
+        profiler.report  # Paths and figures of the written profile
+    
+    The sampling mode (the default) records the request's stack every
+    SAMPLE_INTERVAL seconds, so the collapsed stacks count samples; the
+    deterministic mode times every call, which is exact but several times
+    slower, and counts microseconds. tracemalloc slows allocation-heavy
+    stages (PDF parsing) several times over too; pass memory=False when
+    only the timings matter.
+    """
+    
+    def __init__(self, kind, document_hash=None, query=None, details=None, store=None, source=None,
+                 directory=None, mode="sampling", memory=True, interval=SAMPLE_INTERVAL):
+        """
+        Args:
+            kind (str): Kind of request, e.g. 'upload', 'query', 'flashcards', 'summaries'
+            document_hash (str, optional): Hash of the document the request ran against (see document_hash())
+            query (str, optional): The question or query of the request
+            details (dict, optional): Other options needed to replay the request (JSON-serializable)
+            store (SimpleDocStore, optional): The index the request ran against; can be set
+                inside the with block (e.g. once an upload is indexed)
+            source (bytes, optional): The uploaded PDF
+            directory (str, optional): Where to write the profile (default: PROFILE_DIR)
+            mode (str): "sampling" or "deterministic"
+            memory (bool): Also trace memory allocations with tracemalloc
+            interval (float): Sampling interval in seconds
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}; expected one of {PROFILE_MODES}")
+        self.kind = kind
+        self.document_hash = document_hash
+        self.query = query
+        self.details = details or {}
+        self.store = store
+        self.source = source
+        self.directory = directory or PROFILE_DIR
+        self.mode = mode
+        self.memory = memory
+        self.interval = interval
+        self.report = None
+        self._profiler = None
+        self._started_tracemalloc = False
+        self._memory_start = None
+    
+    def __enter__(self):
+        _profile_lock.acquire()
+        try:
+            if self.memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                    self._started_tracemalloc = True
+                tracemalloc.reset_peak()
+                self._memory_start = tracemalloc.take_snapshot()
+            
+            if self.mode == "sampling":
+                self._profiler = _StackSampler(threading.get_ident(), sys._getframe(1), self.interval)
+            else:
+                self._profiler = _CallTracer()
+            self._started = time.perf_counter()
+            self._profiler.start()
+        except BaseException:
+            _profile_lock.release()
+            raise
+        return self
+    
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            self._profiler.stop()
+            duration = time.perf_counter() - self._started
+            
+            memory = None
+            if self.memory:
+                memory = self._memory_report()
+                if self._started_tracemalloc:
+                    tracemalloc.stop()
+            
+            self.report = self._write(duration, memory, exc)
+        except Exception as e:
+            print(f"Error writing profile: {e}")
+        finally:
+            _profile_lock.release()
+        return False
+    
+    def _memory_report(self):
+        """Peak traced memory and the allocation sites that grew most during the request"""
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        top = snapshot.compare_to(self._memory_start, 'lineno')[:TOP_ALLOCATIONS]
+        return {
+            'peak_kb': round(peak / 1024, 1),
+            'top_allocations': [{'site': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                                 'size_diff_kb': round(stat.size_diff / 1024, 1),
+                                 'count_diff': stat.count_diff} for stat in top],
+        }
+    
+    def _write(self, duration, memory, exc):
+        """Write the collapsed stacks, the replay files and the report"""
+        os.makedirs(self.directory, exist_ok=True)
+        digest = self.document_hash or "unknown"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.kind}-{digest[:12]}-{uuid.uuid4().hex[:6]}"
+        
+        # Sample counts, or microseconds of self time, under the request kind as the root frame
+        scale = 1 if self.mode == "sampling" else 1_000_000
+        collapsed_path = os.path.join(self.directory, f"{name}.collapsed")
+        with open(collapsed_path, 'w') as f:
+            for stack, value in sorted(self._profiler.stacks.items()):
+                weight = round(value * scale)
+                if weight > 0:
+                    f.write(f"{self.kind};{';'.join(stack)} {weight}\n")
+        
+        # Replay files are shared by every profile of the same document
+        pdf_path = None
+        if self.source is not None and self.document_hash:
+            pdf_path = os.path.join(self.directory, f"{self.document_hash}.pdf")
+            if not os.path.exists(pdf_path):
+                with open(pdf_path, 'wb') as f:
+                    f.write(self.source)
+        index_path = None
+        if self.store is not None:
+            index_path = getattr(self.store, 'path', None)  # A packed or SQLite store is its own file
+            if index_path is None and self.document_hash:
+                index_path = os.path.join(self.directory, f"index-{self.document_hash}.pack")
+                if not os.path.exists(index_path):
+                    self.store.save_packed(index_path)
+        
+        report = {
+            'kind': self.kind,
+            'document_hash': self.document_hash,
+            'query': self.query,
+            'details': self.details,
+            'mode': self.mode,
+            'interval_s': self.interval if self.mode == "sampling" else None,
+            'units': "samples" if self.mode == "sampling" else "microseconds",
+            'started': time.time() - duration,
+            'duration_s': round(duration, 6),
+            'error': repr(exc) if exc is not None else None,
+            'memory': memory,
+            # Files in the profile directory are named relative to it, so it can be moved
+            'collapsed_path': os.path.basename(collapsed_path),
+            'pdf_path': os.path.basename(pdf_path) if pdf_path else None,
+            'index_path': (os.path.abspath(index_path) if getattr(self.store, 'path', None)
+                           else os.path.basename(index_path) if index_path else None),
+            'python': sys.version.split()[0],
+        }
+        report_path = os.path.join(self.directory, f"{name}.json")
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        report['report_path'] = report_path
+        report['collapsed_path'] = collapsed_path
+        return report
@@ -2,7 +2,94 @@ import os
 import re
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
+import tracing
+from definitions import definition_key, definition_term
 
+# Definition sentences joined into a direct answer
+DEFINITION_ANSWER_SENTENCES = 2
+
+def correct_keywords(keywords, retriever):
+    """
+    Replace misspelled keywords with the closest word of the indexed material
+    
+    Args:
+        keywords (list): Lowercased question keywords
+        retriever: The retriever; stores without correct_terms() leave the keywords as they are
+    
+    Returns:
+        list: The keywords, misspellings corrected (e.g. "photosythesis" -> "photosynthesis")
+    """
+    correct_terms = getattr(retriever, 'correct_terms', None)
+    if correct_terms is None:
+        return keywords
+    try:
+        corrections = correct_terms(keywords)
+    except Exception as e:
+        print(f"Error correcting keywords: {e}")
+        return keywords
+    return [corrections.get(keyword, keyword) for keyword in keywords]
+
+def expand_keywords(keywords, retriever):
+    """
+    Terms the indexed material uses alongside the keywords
+    
+    Args:
+        keywords (list): Lowercased question keywords
+        retriever: The retriever; stores without expand_terms() add no terms
+    
+    Returns:
+        dict: Related term -> weight of a match relative to a keyword match
+    """
+    expand_terms = getattr(retriever, 'expand_terms', None)
+    if expand_terms is None:
+        return {}
+    try:
+        return expand_terms(keywords)
+    except Exception as e:
+        print(f"Error expanding keywords: {e}")
+        return {}
+
+def lookup_definition(term, retriever, section=None):
+    """
+    Answer "what is X" from the definitions indexed with the material
+    
+    Args:
+        term (str): The term asked about
+        retriever: The retriever; stores without a definition_index find nothing
+        section (str, optional): Only use definitions within this outline section
+    
+    Returns:
+        str or None: The term's definition sentences, or None if none is indexed
+                     (in the section)
+    """
+    try:
+        definitions = getattr(retriever, 'definition_index', None)
+        if not definitions:
+            return None
+        key = definition_key(term)
+        found = definitions.get(key)
+        if not found and key:
+            # Retry with misspelled words corrected ("photosythesis" -> "photosynthesis")
+            found = definitions.get(" ".join(correct_keywords(key.split(), retriever)))
+        if found and section is not None:
+            # Keep to the section being searched, like retrieval does
+            bounds = retriever.get_section(section)
+            if bounds is None:
+                return None
+            found = [definition for definition in found
+                     if bounds['start'] <= definition['start'] < bounds['end']]
+    except Exception as e:
+        print(f"Error looking up definition: {e}")
+        return None
+    if not found:
+        return None
+    sentences = []
+    for definition in found:
+        if definition['sentence'] not in sentences:
+            sentences.append(definition['sentence'])
+    return " ".join(sentences[:DEFINITION_ANSWER_SENTENCES])
+
+@tracing.traced("qa")
 def answer_question(question, retriever):
     """
     Answer a question based on the retrieved documents
@@ -14,6 +101,17 @@ def answer_question(question, retriever):
     Returns:
         str: Answer to the question
     """
+    # Definition questions about an indexed term are answered by a lookup,
+    # without retrieving or scoring anything (within the retriever's section, if it has one)
+    term = definition_term(question)
+    if term is not None:
+        section = (getattr(retriever, 'search_kwargs', None) or {}).get('section')
+        answer = lookup_definition(term, retriever, section)
+        if answer is not None:
+            tracing.count("cache_hits", cache="definition_index")
+            return answer
+        tracing.count("cache_misses", cache="definition_index")
+    
     # Retrieve relevant documents
     retrieved_docs = retriever.get_relevant_documents(question)
     
@@ -103,6 +201,8 @@ def answer_question(question, retriever):
         
         # Filter important keywords
         keywords = [k for k in all_words if k not in common_words and len(k) > 2]
+        keywords = correct_keywords(keywords, retriever)
+        related_keywords = expand_keywords(keywords, retriever)
         
         # If we have too few keywords, include some common question words that might be important
         if len(keywords) < 2:
@@ -130,6 +230,8 @@ def answer_question(question, retriever):
             
             # Basic keyword match count
             keyword_count = sum(1 for k in keywords if k in sentence_lower)
+            # Related terms of the material count for less
+            keyword_count += sum(weight for word, weight in related_keywords.items() if word in sentence_lower)
             
             # Skip sentences with no keyword matches
             if keyword_count == 0:
@@ -166,6 +268,7 @@ def answer_question(question, retriever):
         
         # 3. Select and organize the most relevant sentences
         scored_sentences.sort(key=lambda x: x[1], reverse=True)
+        tracing.count("sentences_scored", len(scored_sentences), stage="qa")
         
         # Get top 3-5 sentences depending on scores
         top_sentences = [s for s, score in scored_sentences[:5] if score > 0.5]
@@ -191,6 +294,7 @@ def answer_question(question, retriever):
     
     except Exception as e:
         print(f"Error answering question: {e}")
+        tracing.record_error("qa", e)
         return f"Sorry, I encountered an error while trying to answer your question: {str(e)}"
 
 def create_qa_chain(retriever):
@@ -286,6 +390,8 @@ def create_qa_chain(retriever):
         
         # Filter important keywords
         keywords = [k for k in all_words if k not in common_words and len(k) > 2]
+        keywords = correct_keywords(keywords, retriever)
+        related_keywords = expand_keywords(keywords, retriever)
         
         # If we have too few keywords, include some common question words that might be important
         if len(keywords) < 2:
@@ -313,6 +419,8 @@ def create_qa_chain(retriever):
             
             # Basic keyword match count
             keyword_count = sum(1 for k in keywords if k in sentence_lower)
+            # Related terms of the material count for less
+            keyword_count += sum(weight for word, weight in related_keywords.items() if word in sentence_lower)
             
             # Skip sentences with no keyword matches
             if keyword_count == 0:
@@ -0,0 +1,772 @@
+import heapq
+import itertools
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from cooccurrence import EXPANSION_CAP, RelatedTerms, merge_related, top_expansions
+from definitions import build_definition_index
+from fuzzy_index import FuzzyIndex, best_correction
+from term_index import TermIndex, phrase_starts
+
+# Tiered merge policy: segments of similar size form a tier, and once
+# MERGE_FANOUT neighbouring segments share a tier they are merged into one
+# segment of the next tier. Segments up to MIN_SEGMENT_SIZE live chunks are
+# all in the lowest tier.
+MERGE_FANOUT = 4
+MIN_SEGMENT_SIZE = 64
+
+# Extra score of a chunk per occurrence of two neighbouring query words in the
+# query's order and spacing, and the most it gains per extra query word for
+# having them close together
+PHRASE_WEIGHT = 2.0
+PROXIMITY_WEIGHT = 1.0
+
+# Queries with at least this many distinct terms are scored with MaxScore
+# pruning (see IndexSnapshot.top_scores); shorter ones, expansion terms or not,
+# are scored faster exhaustively
+PRUNING_MIN_TERMS = 3
+
+# Margin against rounding in summed score bounds: a chunk is only skipped when
+# its bound is at least this far below the current top results
+PRUNING_SLACK = 1e-9
+
+def add_postings(postings, position, term_positions):
+    """Append a chunk's term counts and token positions to an inverted index"""
+    for term, token_positions in term_positions.items():
+        posting = postings.get(term)
+        if posting is None:
+            posting = postings[term] = (array('I'), array('I'), array('I'))
+        posting[0].append(position)
+        posting[1].append(len(token_positions))
+        posting[2].extend(token_positions)
+
+def query_phrase(query_terms, offsets):
+    """
+    First position in the query of each distinct query term
+    
+    Args:
+        query_terms (list): Query terms
+        offsets (list or None): Token position of each term in the query
+    
+    Returns:
+        dict: Term -> position, or an empty dict when there is nothing to match
+              positionally (no offsets, or fewer than two distinct terms)
+    """
+    if offsets is None:
+        return {}
+    phrase = {}
+    for term, offset in zip(query_terms, offsets):
+        phrase.setdefault(term, offset)
+    return phrase if len(phrase) > 1 else {}
+
+def shortest_window(lists):
+    """Fewest tokens between the first and last word of a stretch holding one occurrence of every list's word"""
+    events = sorted((position, i) for i, positions in enumerate(lists) for position in positions)
+    counts = [0] * len(lists)
+    covered = 0
+    best = None
+    left = 0
+    for position, i in events:
+        if counts[i] == 0:
+            covered += 1
+        counts[i] += 1
+        # Shrink from the left while every word is still in the window
+        while covered == len(lists):
+            left_position, left_word = events[left]
+            if best is None or position - left_position < best:
+                best = position - left_position
+            counts[left_word] -= 1
+            if counts[left_word] == 0:
+                covered -= 1
+            left += 1
+    return best
+
+def positional_bonus(phrase, found):
+    """
+    Extra score of a chunk for where the query words occur in it
+    
+    Every occurrence of two neighbouring query words in the query's order and
+    spacing earns PHRASE_WEIGHT, so the exact phrase earns it once per pair
+    and a partial phrase ("theory of mind" in "explain theory of mind") still
+    counts. Any chunk with two or more query words also gets up to
+    PROXIMITY_WEIGHT per extra word, shrinking with every token its closest
+    group of them is wider than in the query.
+    
+    Args:
+        phrase (dict): Query term -> position in the query (see query_phrase)
+        found (dict): Query term -> sorted token positions in the chunk, for the terms it contains
+    
+    Returns:
+        float: The bonus (0 for fewer than two query words)
+    """
+    terms = [term for term in phrase if term in found]
+    if len(terms) < 2:
+        return 0.0
+    lists = [found[term] for term in terms]
+    offsets = [phrase[term] for term in terms]
+    
+    bonus = 0.0
+    words = list(phrase)
+    for first, second in zip(words, words[1:]):
+        if first in found and second in found:
+            matches = phrase_starts([found[first], found[second]], [phrase[first], phrase[second]])
+            bonus += PHRASE_WEIGHT * len(matches)
+    slack = max(0, shortest_window(lists) - (max(offsets) - min(offsets)))
+    bonus += PROXIMITY_WEIGHT * (len(terms) - 1) / (1 + slack)
+    return bonus
+
+def extend_index(index, additions):
+    """
+    Copy-on-write update of a key -> ids index
+    
+    Args:
+        index (dict): Key -> tuple of ids; left untouched
+        additions (dict): Key -> list of ids to append (ids already present are skipped)
+    
+    Returns:
+        dict: The updated index
+    """
+    if not additions:
+        return index
+    index = dict(index)
+    for key, ids in additions.items():
+        existing = index.get(key, ())
+        present = set(existing)
+        index[key] = existing + tuple(i for i in dict.fromkeys(ids) if i not in present)
+    return index
+
+class Segment:
+    """
+    An immutable block of indexed chunks with its own postings
+    
+    Chunks keep the global ids they were added with; postings refer to
+    positions within the segment. Deleting or replacing chunks produces a
+    new Segment that shares everything else with the old one, so a reader
+    holding the old one is never affected.
+    """
+    
+    _keys = itertools.count()
+    
+    def __init__(self, ids, documents, document_terms, term_vectors, term_positions, postings=None,
+                 tombstones=None, key=None, fuzzy=None, related=None):
+        """
+        Args:
+            ids (array): Global ids of the chunks, ascending
+            documents (list): The chunks (Document objects)
+            document_terms (list): Term Counter of each chunk
+            term_vectors (list): Unit term vector of each chunk
+            term_positions (list): Term -> token positions (array) of each chunk
+            postings (dict, optional): Term -> (positions, counts, token positions), the token
+                positions of each posting following each other in posting order; built if not given
+            tombstones (bytes, optional): One byte per chunk, 1 if deleted
+            key (int, optional): Identity shared by all versions of the segment
+            fuzzy (FuzzyIndex, optional): Typo-tolerant index of the postings' terms; built if not given
+            related (RelatedTerms, optional): Co-occurrence neighbours of the chunks' terms; built if not given
+        """
+        self.key = next(Segment._keys) if key is None else key
+        self.ids = ids
+        self.documents = documents
+        self.document_terms = document_terms
+        self.term_vectors = term_vectors
+        self.term_positions = term_positions
+        
+        if postings is None:
+            postings = {}
+            for position, terms in enumerate(term_positions):
+                add_postings(postings, position, terms)
+        self.postings = postings
+        self.fuzzy = fuzzy if fuzzy is not None else FuzzyIndex(postings)
+        self.related = related if related is not None else RelatedTerms(term_positions)
+        
+        self.tombstones = tombstones if tombstones is not None else bytes(len(ids))
+        self.deleted_count = self.tombstones.count(1)
+        self._max_counts = {}
+    
+    def __len__(self):
+        return len(self.ids)
+    
+    @property
+    def live_count(self):
+        """Number of chunks that are not deleted"""
+        return len(self.ids) - self.deleted_count
+    
+    def max_count(self, term):
+        """Highest count of a term in any chunk of the segment (deleted ones included), cached"""
+        count = self._max_counts.get(term)
+        if count is None:
+            posting = self.postings.get(term)
+            count = self._max_counts[term] = max(posting[1]) if posting is not None else 0
+        return count
+    
+    def position(self, doc_id):
+        """Position of a chunk id in the segment, or None"""
+        i = bisect_left(self.ids, doc_id)
+        if i < len(self.ids) and self.ids[i] == doc_id:
+            return i
+        return None
+    
+    def with_deletions(self, positions):
+        """New version of the segment with the chunks at these positions tombstoned"""
+        tombstones = bytearray(self.tombstones)
+        for position in positions:
+            tombstones[position] = 1
+        return Segment(self.ids, self.documents, self.document_terms, self.term_vectors,
+                       self.term_positions, self.postings, bytes(tombstones), self.key, self.fuzzy,
+                       self.related)
+    
+    def with_documents(self, replacements):
+        """New version of the segment with some chunks' Document objects replaced (same text)"""
+        documents = list(self.documents)
+        for position, doc in replacements.items():
+            documents[position] = doc
+        return Segment(self.ids, documents, self.document_terms, self.term_vectors,
+                       self.term_positions, self.postings, self.tombstones, self.key, self.fuzzy,
+                       self.related)
+    
+    def refreshed(self, sources):
+        """
+        Bring a merged segment up to date with newer versions of its inputs
+        
+        Chunks replaced or deleted in the inputs while the merge ran are
+        replaced or tombstoned in the result.
+        
+        Args:
+            sources (list): Current versions of the segments that were merged
+        
+        Returns:
+            Segment: The up-to-date merged segment
+        """
+        documents = list(self.documents)
+        tombstones = bytearray(self.tombstones)
+        for source in sources:
+            for position, doc_id in enumerate(source.ids):
+                merged_position = self.position(doc_id)
+                if merged_position is None:
+                    continue
+                documents[merged_position] = source.documents[position]
+                if source.tombstones[position]:
+                    tombstones[merged_position] = 1
+        return Segment(self.ids, documents, self.document_terms, self.term_vectors,
+                       self.term_positions, self.postings, bytes(tombstones), self.key, self.fuzzy,
+                       self.related)
+
+def merge_segments(segments):
+    """
+    Merge consecutive segments into one, dropping deleted chunks
+    
+    Args:
+        segments (list): Segments in id order
+    
+    Returns:
+        Segment or None: The merged segment, or None if no chunk survives
+    """
+    ids = array('I')
+    documents = []
+    document_terms = []
+    term_vectors = []
+    term_positions = []
+    for segment in segments:
+        for position, doc_id in enumerate(segment.ids):
+            if segment.tombstones[position]:
+                continue
+            ids.append(doc_id)
+            documents.append(segment.documents[position])
+            document_terms.append(segment.document_terms[position])
+            term_vectors.append(segment.term_vectors[position])
+            term_positions.append(segment.term_positions[position])
+    
+    if not ids:
+        return None
+    return Segment(ids, documents, document_terms, term_vectors, term_positions)
+
+def segment_tier(segment, fanout=MERGE_FANOUT, min_size=MIN_SEGMENT_SIZE):
+    """Size tier of a segment: 0 up to min_size live chunks, then one tier per factor of fanout"""
+    if segment.live_count <= min_size:
+        return 0
+    return int(math.log(segment.live_count / min_size, fanout)) + 1
+
+def plan_merge(segments, fanout=MERGE_FANOUT, min_size=MIN_SEGMENT_SIZE, deleted_ratio=0.25):
+    """
+    Pick the next run of neighbouring segments to merge
+    
+    New segments are appended at the end, so sizes mostly shrink from the
+    oldest segment to the newest and equal-tier segments sit next to each
+    other. The lowest tier with fanout neighbours is merged first, which keeps
+    merges small and frequent for fresh uploads and rare for the big
+    segments. A segment with more than deleted_ratio of its chunks deleted is
+    rewritten on its own.
+    
+    Args:
+        segments (tuple): Segments in id order
+        fanout (int): Number of same-tier neighbours that triggers a merge
+        min_size (int): Live chunks up to which a segment is in the lowest tier
+        deleted_ratio (float): Share of deleted chunks that triggers a rewrite
+    
+    Returns:
+        tuple or None: (first, last) index range of segments to merge, or None
+    """
+    best = None
+    run_start = 0
+    for i in range(1, len(segments) + 1):
+        if i < len(segments) and segment_tier(segments[i], fanout, min_size) == \
+                segment_tier(segments[run_start], fanout, min_size):
+            continue
+        if i - run_start >= fanout:
+            tier = segment_tier(segments[run_start], fanout, min_size)
+            if best is None or tier < best[0]:
+                best = (tier, run_start, run_start + fanout)
+        run_start = i
+    if best is not None:
+        return best[1], best[2]
+    
+    for i, segment in enumerate(segments):
+        if segment.deleted_count > deleted_ratio * len(segment):
+            return i, i + 1
+    return None
+
+class IndexSnapshot:
+    """
+    Immutable view of the whole index
+    
+    Readers query one snapshot from start to finish without locking; writers
+    derive a new snapshot and publish it with a single assignment.
+    """
+    
+    def __init__(self, segments=(), section_index=None, source_index=None, outline=None,
+                 flashcard_pool=None, text=None, pages=(), pages_source=None, next_id=0,
+                 term_index=None, definition_index=None):
+        """
+        Args:
+            segments (tuple): Segments ordered by id range
+            section_index (dict): Section title -> tuple of chunk ids
+            source_index (dict): Source name -> tuple of chunk ids
+            outline (list): Document outline
+            flashcard_pool (list): Flashcard candidates of the page-indexed document
+            text (str): Text of the page-indexed document
+            pages (tuple): Per-page records of the page-indexed document
+            pages_source (str): Source of the page-indexed document
+            next_id (int): Id the next added chunk gets
+            term_index (TermIndex, optional): Index of text, built on first use if not given
+            definition_index (dict, optional): Definitions in flashcard_pool by term, built on first use if not given
+        """
+        self.segments = tuple(segments)
+        self.section_index = section_index or {}
+        self.source_index = source_index or {}
+        self.outline = outline or []
+        self.flashcard_pool = flashcard_pool or []
+        self.text = text
+        self.pages = tuple(pages)
+        self.pages_source = pages_source
+        self.next_id = next_id
+        self._term_index = term_index
+        self._definition_index = definition_index
+        self._firsts = [segment.ids[0] for segment in self.segments]
+    
+    def replace(self, **changes):
+        """New snapshot with some fields changed"""
+        fields = {
+            'segments': self.segments,
+            'section_index': self.section_index,
+            'source_index': self.source_index,
+            'outline': self.outline,
+            'flashcard_pool': self.flashcard_pool,
+            'text': self.text,
+            'pages': self.pages,
+            'pages_source': self.pages_source,
+            'next_id': self.next_id,
+            # The term index only stays valid while the text is unchanged
+            'term_index': self._term_index if 'text' not in changes else None,
+            # Likewise the definition index while the flashcard pool is
+            'definition_index': self._definition_index if 'flashcard_pool' not in changes else None,
+        }
+        fields.update(changes)
+        return IndexSnapshot(**fields)
+    
+    @property
+    def term_index(self):
+        """Positional word index of the text, built on first use"""
+        if self._term_index is None and self.text is not None:
+            self._term_index = TermIndex(self.text)
+        return self._term_index
+    
+    @property
+    def definition_index(self):
+        """Definition sentences of the flashcard pool by term, built on first use"""
+        if self._definition_index is None:
+            self._definition_index = build_definition_index(self.flashcard_pool)
+        return self._definition_index
+    
+    @property
+    def size(self):
+        """Number of chunk slots, deleted ones included"""
+        return sum(len(segment) for segment in self.segments)
+    
+    @property
+    def deleted_count(self):
+        """Number of deleted chunks not yet compacted away"""
+        return sum(segment.deleted_count for segment in self.segments)
+    
+    def locate(self, doc_id):
+        """
+        Find a chunk
+        
+        Returns:
+            tuple or None: (segment, position), or None if the id is not in the index
+        """
+        i = bisect_right(self._firsts, doc_id) - 1
+        if i < 0:
+            return None
+        position = self.segments[i].position(doc_id)
+        if position is None:
+            return None
+        return self.segments[i], position
+    
+    def is_live(self, doc_id):
+        """Check whether a chunk is in the index and not deleted"""
+        found = self.locate(doc_id)
+        return found is not None and not found[0].tombstones[found[1]]
+    
+    def document(self, doc_id):
+        """The Document of a chunk"""
+        segment, position = self.locate(doc_id)
+        return segment.documents[position]
+    
+    def term_vector(self, doc_id):
+        """The unit term vector of a chunk"""
+        segment, position = self.locate(doc_id)
+        return segment.term_vectors[position]
+    
+    def live_ids(self):
+        """Yield the ids of all live chunks, in order"""
+        for segment in self.segments:
+            tombstones = segment.tombstones
+            for position, doc_id in enumerate(segment.ids):
+                if not tombstones[position]:
+                    yield doc_id
+    
+    def correct_terms(self, terms):
+        """
+        Closest indexed word of each term that no segment contains
+        
+        Args:
+            terms (list): Query terms
+        
+        Returns:
+            dict: Term -> correction, for the unknown terms that are close to an
+                  indexed word (see fuzzy_index.FuzzyIndex)
+        """
+        corrections = {}
+        for term in dict.fromkeys(terms):
+            if any(term in segment.postings for segment in self.segments):
+                continue
+            candidates = {}  # Word -> (distance, chunks containing it)
+            for segment in self.segments:
+                for word, distance in segment.fuzzy.lookup(term):
+                    chunks = len(segment.postings[word][0]) + candidates.get(word, (0, 0))[1]
+                    candidates[word] = (distance, chunks)
+            correction = best_correction(term, candidates)
+            if correction is not None:
+                corrections[term] = correction
+        return corrections
+    
+    def expand_terms(self, query_terms):
+        """
+        Terms of the material most related to the query terms, to expand the query with
+        
+        Each segment keeps its terms' strongest co-occurrence neighbours (see
+        cooccurrence.RelatedTerms); a term's neighbours in every segment are
+        merged, keeping each word's highest weight.
+        
+        Args:
+            query_terms (list): Query terms
+        
+        Returns:
+            dict: Expansion term -> score per occurrence (see cooccurrence.top_expansions)
+        """
+        def related(term):
+            return merge_related(segment.related.lookup(term) for segment in self.segments)
+        return top_expansions(query_terms, related)
+    
+    def top_scores(self, query_terms, limit, allowed=None, offsets=None, prune=True, expansions=None):
+        """
+        Score chunks by the counts of the query terms they contain
+        
+        Each segment scores the chunks in its postings of the query terms
+        (skipping deleted ones) and keeps its own top results, which are then
+        merged. With the terms' positions in the query, chunks holding two or
+        more of them also get a phrase and proximity bonus (see
+        positional_bonus), worked out from the postings' token positions.
+        Expansion terms (see expand_terms) score their weight per occurrence,
+        at most EXPANSION_CAP per chunk all together, and take no part in the
+        positional bonus.
+        
+        Queries of PRUNING_MIN_TERMS or more distinct terms are scored with
+        MaxScore pruning instead (see _pruned_top_scores), which returns the
+        same ranking while skipping most chunks.
+        
+        Args:
+            query_terms (list): Query terms (repeated terms count repeatedly)
+            limit (int): Number of results to return
+            allowed (set, optional): Chunk ids to restrict the search to
+            offsets (list, optional): Token position of each query term in the query
+            prune (bool): Allow MaxScore pruning; False always scores exhaustively
+            expansions (dict, optional): Expansion term -> score per occurrence
+        
+        Returns:
+            tuple: ((id, score) pairs by score descending, ties in id order,
+                   number of chunks scored: every chunk with a non-zero score,
+                   or with pruning the ones that were not skipped)
+        """
+        phrase = query_phrase(query_terms, offsets)
+        expansions = expansions or {}
+        if prune and len(set(query_terms)) >= PRUNING_MIN_TERMS:
+            return self._pruned_top_scores(query_terms, limit, allowed, phrase, expansions)
+        
+        # Query terms count once per repeat, expansion terms at their weight
+        weighted = [(term, 1) for term in query_terms] + list(expansions.items())
+        segment_tops = []
+        scored_count = 0
+        for segment in self.segments:
+            ids = segment.ids
+            tombstones = segment.tombstones
+            scores = {}
+            credits = {}  # Chunk id -> score of its expansion terms, before the cap
+            found = {}  # Chunk id -> query term -> token positions
+            for index, (term, weight) in enumerate(weighted):
+                # Expansion terms come after the query terms
+                totals = credits if index >= len(query_terms) else scores
+                posting = segment.postings.get(term)
+                if posting is None:
+                    continue
+                positions, counts, token_positions = posting
+                end = 0
+                for position, count in zip(positions, counts):
+                    # This posting's token positions follow the previous posting's
+                    start = end
+                    end += count
+                    if tombstones[position]:
+                        continue
+                    doc_id = ids[position]
+                    if allowed is not None and doc_id not in allowed:
+                        continue
+                    totals[doc_id] = totals.get(doc_id, 0) + weight * count
+                    if term in phrase:
+                        found.setdefault(doc_id, {})[term] = token_positions[start:end]
+            for doc_id, credit in credits.items():
+                scores[doc_id] = scores.get(doc_id, 0) + min(credit, EXPANSION_CAP)
+            for doc_id, terms in found.items():
+                if len(terms) > 1:
+                    scores[doc_id] += positional_bonus(phrase, terms)
+            scored_count += len(scores)
+            segment_tops.append(heapq.nsmallest(limit, ((-score, doc_id) for doc_id, score in scores.items())))
+        
+        # Merge the segments' top results
+        ranking = [(doc_id, -negative_score)
+                   for negative_score, doc_id in itertools.islice(heapq.merge(*segment_tops), limit)]
+        return ranking, scored_count
+    
+    def _pruned_top_scores(self, query_terms, limit, allowed, phrase, expansions):
+        """
+        top_scores with MaxScore dynamic pruning
+        
+        Every query term gets an upper bound on what it can add to a chunk's
+        score in a segment: its highest count there (times its repeats in the
+        query), plus the most it can add to the positional bonus. Terms are
+        sorted by bound; once the top results are full, the cheapest terms
+        whose bounds together cannot beat the worst of them are
+        non-essential. Candidates then come only from the essential terms'
+        postings, and the non-essential ones are looked up by binary search,
+        most promising first, giving up on a chunk as soon as its bound drops
+        to the worst top score. An expansion term's bound is its highest
+        weighted count, but no more than EXPANSION_CAP, the most all of them
+        together add to a chunk. Chunks are visited in id order, so a chunk
+        that can at best tie the worst top result would lose the tie and is
+        rightly skipped: the ranking is exactly the exhaustive one.
+        
+        Args:
+            query_terms (list): Query terms (repeated terms count repeatedly)
+            limit (int): Number of results to return
+            allowed (set, optional): Chunk ids to restrict the search to
+            phrase (dict): Query term -> position in the query (see query_phrase)
+            expansions (dict): Expansion term -> score per occurrence
+        
+        Returns:
+            tuple: ((id, score) pairs by score descending, ties in id order,
+                   number of chunks fully scored)
+        """
+        # Score per occurrence of each term: its repeats, or an expansion term's weight
+        repeats = Counter(query_terms)
+        for term, weight in expansions.items():
+            repeats[term] += weight
+        # Neighbouring query words, whose occurrences as a pair earn the phrase bonus
+        words = list(phrase)
+        pairs = list(zip(words, words[1:]))
+        
+        top = []  # Min-heap of (score, -id): the worst of the current top results first
+        scored_count = 0
+        for segment in self.segments:
+            # Share of the positional bonus charged to each term: a proximity step, and
+            # the phrase pairs it starts (a pair occurs no more often than its rarer word)
+            extras = {term: PROXIMITY_WEIGHT for term in phrase}
+            for first, second in pairs:
+                extras[first] += PHRASE_WEIGHT * min(segment.max_count(first), segment.max_count(second))
+            
+            lists = []
+            for term, repeat in repeats.items():
+                posting = segment.postings.get(term)
+                if posting is None:
+                    continue
+                extra = extras.get(term, 0.0)
+                term_bound = repeat * segment.max_count(term) + extra
+                if term in expansions:
+                    term_bound = min(term_bound, EXPANSION_CAP)
+                lists.append((term_bound, extra, term, repeat, posting[0], posting[1]))
+            if not lists:
+                continue
+            lists.sort(key=lambda item: item[0])
+            # bounds[i]: the most terms 0..i together can add to a chunk's score
+            bounds = list(itertools.accumulate(item[0] for item in lists))
+            
+            ids = segment.ids
+            tombstones = segment.tombstones
+            term_positions = segment.term_positions
+            cursors = [0] * len(lists)
+            
+            threshold = top[0][0] if len(top) >= limit else 0
+            essential = 0
+            while essential < len(lists) and bounds[essential] + PRUNING_SLACK <= threshold:
+                essential += 1
+            # Whether a phrase term is among the non-essential ones, which candidates may still hold
+            optional_phrase = any(lists[i][2] in phrase for i in range(essential))
+            # Next unvisited chunk position of each essential term
+            frontier = [(lists[i][4][0], i) for i in range(essential, len(lists))]
+            heapq.heapify(frontier)
+            
+            while frontier:
+                # Count the essential terms of the next candidate
+                position = frontier[0][0]
+                score = 0
+                credit = 0.0  # Score of the expansion terms, before the cap
+                extra_bound = 0.0
+                present = {}  # Phrase term -> count in the chunk
+                while frontier and frontier[0][0] == position:
+                    _, i = heapq.heappop(frontier)
+                    _, extra, term, repeat, positions, counts = lists[i]
+                    if term in expansions:
+                        credit += repeat * counts[cursors[i]]
+                    else:
+                        score += repeat * counts[cursors[i]]
+                    extra_bound += extra
+                    if term in phrase:
+                        present[term] = counts[cursors[i]]
+                    cursors[i] += 1
+                    if cursors[i] < len(positions):
+                        heapq.heappush(frontier, (positions[cursors[i]], i))
+                
+                doc_id = ids[position]
+                if tombstones[position] or (allowed is not None and doc_id not in allowed):
+                    continue
+                
+                # The positional bonus takes two phrase terms; without a second one in reach it is out
+                if len(present) < 2 and not optional_phrase:
+                    extra_bound = 0.0
+                
+                # Look up the non-essential terms, best bound first, while the chunk can still make it
+                full = len(top) >= limit
+                bound = score + min(credit, EXPANSION_CAP) + extra_bound + (bounds[essential - 1] if essential else 0.0)
+                pruned = False
+                for i in range(essential - 1, -1, -1):
+                    if full and bound + PRUNING_SLACK <= threshold:
+                        pruned = True
+                        break
+                    _, extra, term, repeat, positions, counts = lists[i]
+                    j = cursors[i] = bisect_left(positions, position, cursors[i])
+                    if j < len(positions) and positions[j] == position:
+                        if term in expansions:
+                            credit += repeat * counts[j]
+                        else:
+                            score += repeat * counts[j]
+                        if term in phrase:
+                            present[term] = counts[j]
+                        extra_bound += extra
+                    bound = score + min(credit, EXPANSION_CAP) + extra_bound + (bounds[i - 1] if i else 0.0)
+                if pruned:
+                    continue
+                score += min(credit, EXPANSION_CAP)
+                
+                if phrase and len(present) > 1:
+                    # The bonus is the costly part; bound it by the chunk's own counts first
+                    if full:
+                        bonus_bound = PROXIMITY_WEIGHT * (len(present) - 1)
+                        for first, second in pairs:
+                            if first in present and second in present:
+                                bonus_bound += PHRASE_WEIGHT * min(present[first], present[second])
+                        if score + bonus_bound + PRUNING_SLACK <= threshold:
+                            continue
+                    chunk_positions = term_positions[position]
+                    score += positional_bonus(phrase, {term: chunk_positions[term] for term in present})
+                scored_count += 1
+                
+                if not full:
+                    heapq.heappush(top, (score, -doc_id))
+                elif score > threshold:
+                    heapq.heapreplace(top, (score, -doc_id))
+                else:
+                    continue
+                
+                # A better worst top result can make more terms non-essential
+                if len(top) >= limit and top[0][0] != threshold:
+                    threshold = top[0][0]
+                    demoted = essential
+                    while essential < len(lists) and bounds[essential] + PRUNING_SLACK <= threshold:
+                        essential += 1
+                    if essential != demoted:
+                        optional_phrase = any(lists[i][2] in phrase for i in range(essential))
+                        frontier = [entry for entry in frontier if entry[1] >= essential]
+                        heapq.heapify(frontier)
+        
+        ranking = [(-negative_id, score) for score, negative_id in sorted(top, key=lambda item: (-item[0], -item[1]))]
+        return ranking, scored_count
+    
+    def with_deletions(self, doc_ids):
+        """
+        New snapshot with chunks tombstoned
+        
+        Returns:
+            tuple: (snapshot, ids that were live and are now deleted)
+        """
+        positions = {}
+        deleted = []
+        for doc_id in doc_ids:
+            found = self.locate(doc_id)
+            if found is None or found[0].tombstones[found[1]]:
+                continue
+            segment_positions = positions.setdefault(found[0].key, set())
+            if found[1] not in segment_positions:
+                segment_positions.add(found[1])
+                deleted.append(doc_id)
+        
+        if not deleted:
+            return self, deleted
+        segments = tuple(segment.with_deletions(positions[segment.key]) if segment.key in positions else segment
+                         for segment in self.segments)
+        return self.replace(segments=segments), deleted
+    
+    def with_documents(self, replacements):
+        """
+        New snapshot with chunks' Document objects replaced
+        
+        Args:
+            replacements (dict): Chunk id -> new Document (same text, updated metadata)
+        """
+        by_segment = {}
+        for doc_id, doc in replacements.items():
+            segment, position = self.locate(doc_id)
+            by_segment.setdefault(segment.key, {})[position] = doc
+        
+        if not by_segment:
+            return self
+        segments = tuple(segment.with_documents(by_segment[segment.key]) if segment.key in by_segment else segment
+                         for segment in self.segments)
+        return self.replace(segments=segments)
@@ -0,0 +1,201 @@
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+import uuid
+import weakref
+
+from packed_index import PackedIndex, pack_index, packed_directory
+import tracing
+
+def _worker_main(connection):
+    """Serve queries against one shard of a packed index until told to stop"""
+    index = None
+    start = end = 0
+    while True:
+        message = connection.recv()
+        command = message[0]
+        if command == 'stop':
+            break
+        try:
+            if command == 'attach':
+                _, path, start, end = message
+                if index is not None:
+                    index.close()
+                index = PackedIndex(path)
+                connection.send(('ok', end - start))
+            elif command == 'query':
+                _, query_terms, limit, allowed, offsets, expansions = message
+                if index is None:
+                    connection.send(('ok', ([], 0)))
+                else:
+                    connection.send(('ok', index.top_scores(query_terms, limit, allowed, start, end, offsets,
+                                                            expansions)))
+        except Exception as e:
+            connection.send(('error', repr(e)))
+    if index is not None:
+        index.close()
+    connection.close()
+
+def _shut_down(connections, processes, files):
+    """Stop an executor's workers and delete its packed files (on close, or once it is garbage collected)"""
+    for connection in connections:
+        try:
+            connection.send(('stop',))
+            connection.close()
+        except OSError:
+            pass
+    for process in processes:
+        process.join(timeout=5)
+    for path in files:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error removing packed index {path}: {e}")
+    del connections[:], processes[:], files[:]
+
+def shard_ranges(size, shard_count):
+    """Split chunk positions 0..size into contiguous ranges of similar size"""
+    bounds = [size * shard // shard_count for shard in range(shard_count + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+class ShardedQueryExecutor:
+    """
+    Score queries in parallel worker processes, one shard of the index each
+    
+    A snapshot is packed once into a memory-mapped index file (see
+    packed_index.py) that every worker maps read-only, so the corpus is in
+    memory once however many workers there are. Each worker scores its own
+    contiguous range of chunk positions; queries are broadcast to all
+    workers, each returns its shard's top results, and the per-shard lists
+    are merged. Rankings are identical to in-process scoring.
+    
+    Attach it to a store with SimpleDocStore.query_executor. The index is
+    re-packed when a query sees a newer snapshot, which costs one pass over
+    the postings, so it pays off for large libraries that change rarely
+    compared with how often they are queried. A store opened from a packed
+    file is used as it is. Queries are scored one at a time, so give each
+    user session its own executor rather than sharing one. Workers are
+    spawned, so a script that creates an executor needs the usual
+    `if __name__ == '__main__':` guard; they are stopped by close(), or
+    when the executor is garbage collected.
+    """
+    
+    def __init__(self, workers=None, directory=None):
+        """
+        Args:
+            workers (int, optional): Number of worker processes (default: number of CPUs)
+            directory (str, optional): Where packed files are written (default: packed_directory())
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.directory = directory or packed_directory()
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._files = []  # Packed file this executor wrote that the workers map, if any
+        
+        # Spawned workers do not inherit the parent's threads or open files
+        context = multiprocessing.get_context('spawn')
+        self._connections = []
+        self._processes = []
+        for _ in range(self.workers):
+            parent_end, child_end = context.Pipe()
+            process = context.Process(target=_worker_main, args=(child_end,), daemon=True)
+            process.start()
+            child_end.close()
+            self._connections.append(parent_end)
+            self._processes.append(process)
+        self._finalizer = weakref.finalize(self, _shut_down, self._connections, self._processes, self._files)
+    
+    def _receive_all(self):
+        """
+        Read one reply from every worker, raising the first error if any failed
+        
+        Every reply is read before raising, so that no stale reply is left in
+        a pipe to be taken for the answer to the next request.
+        """
+        replies = []
+        errors = []
+        for connection in self._connections:
+            try:
+                status, value = connection.recv()
+            except (EOFError, OSError) as e:
+                errors.append(repr(e))
+                continue
+            if status == 'ok':
+                replies.append(value)
+            else:
+                errors.append(value)
+        if errors:
+            raise RuntimeError(f"Shard worker failed: {errors[0]}")
+        return replies
+    
+    def _sync(self, snapshot):
+        """Point the workers at a packed copy of the snapshot (callers hold the lock)"""
+        if isinstance(snapshot, PackedIndex):
+            path = snapshot.path
+            owned = False
+        else:
+            path = os.path.join(self.directory, f"index-{os.getpid()}-{uuid.uuid4().hex}.pack")
+            pack_index(snapshot, path)
+            owned = True
+        
+        for connection, (start, end) in zip(self._connections, shard_ranges(snapshot.size, self.workers)):
+            connection.send(('attach', path, start, end))
+        try:
+            self._receive_all()
+        except Exception:
+            # Workers may now map different files; attach them all again next time
+            self._snapshot = None
+            if owned:
+                self._remove(path)
+            raise
+        
+        # Every worker has mapped the new file; the old one is no longer needed
+        for old_path in self._files:
+            self._remove(old_path)
+        self._files[:] = [path] if owned else []
+        self._snapshot = snapshot
+    
+    def _remove(self, path):
+        """Delete a packed file this executor wrote"""
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error removing packed index {path}: {e}")
+    
+    def top_scores(self, snapshot, query_terms, limit, allowed=None, offsets=None, expansions=None):
+        """
+        Score a query across all shards
+        
+        Args:
+            snapshot (IndexSnapshot or PackedIndex): The snapshot to search
+            query_terms (list): Query terms
+            limit (int): Number of results to return
+            allowed (set, optional): Chunk ids to restrict the search to
+            offsets (list, optional): Token position of each query term in the query
+            expansions (dict, optional): Expansion term -> score per occurrence
+        
+        Returns:
+            tuple: ((id, score) pairs by score descending, ties in id order,
+                   number of chunks with a non-zero score)
+        """
+        with self._lock:
+            if snapshot is not self._snapshot:
+                tracing.count("cache_misses", cache="packed_snapshot")
+                self._sync(snapshot)
+            else:
+                tracing.count("cache_hits", cache="packed_snapshot")
+            for connection in self._connections:
+                connection.send(('query', query_terms, limit, allowed, offsets, expansions))
+            replies = self._receive_all()
+        
+        scored_count = sum(count for _, count in replies)
+        merged = heapq.merge(*(ranking for ranking, _ in replies), key=lambda item: (-item[1], item[0]))
+        return list(itertools.islice(merged, limit)), scored_count
+    
+    def close(self):
+        """Stop the workers and delete the packed file"""
+        with self._lock:
+            self._finalizer()
+            self._snapshot = None
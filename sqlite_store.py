@@ -0,0 +1,680 @@
+import json
+import re
+import sqlite3
+import threading
+import uuid
+from collections import Counter, deque
+from langchain.docstore.document import Document
+import tracing
+from definitions import build_definition_index
+from flashcard_generator import build_flashcard_pool
+from fuzzy_index import FuzzyIndex, best_correction
+from term_index import TermIndex
+from utils import find_section, page_spans
+from vector_store import (STOPWORDS, DocStoreRetriever, assign_sections, max_marginal_relevance,
+                          page_content_fingerprint, positioned_terms, split_page_into_documents,
+                          unit_term_vector)
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    source TEXT,
+    page INTEGER,
+    start INTEGER,
+    "end" INTEGER
+);
+CREATE INDEX IF NOT EXISTS chunks_source ON chunks(source);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(content, content='chunks', content_rowid='id');
+
+-- Keep the full-text index in step with the chunks (it stores no copy of the text)
+CREATE TRIGGER IF NOT EXISTS chunks_insert AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_delete AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_update AFTER UPDATE OF content ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    INSERT INTO chunks_fts(rowid, content) VALUES (new.id, new.content);
+END;
+
+-- Indexed words and the number of chunks containing each, for typo correction
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_vocab USING fts5vocab(chunks_fts, row);
+
+CREATE TABLE IF NOT EXISTS chunk_sections (
+    section TEXT NOT NULL,
+    chunk_id INTEGER NOT NULL,
+    PRIMARY KEY (section, chunk_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS chunk_sections_chunk ON chunk_sections(chunk_id);
+
+-- Page records of the page-indexed document (see SimpleDocStore.index_pages)
+CREATE TABLE IF NOT EXISTS pages (
+    number INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    "end" INTEGER NOT NULL,
+    chunk_ids TEXT NOT NULL
+);
+
+-- Document-level fields (outline, flashcard pool, text, ...) as JSON
+CREATE TABLE IF NOT EXISTS store (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def is_sqlite_file(path):
+    """Whether a file is an SQLite database (as opposed to a packed index)"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError:
+        return False
+
+def query_terms(text):
+    """Search terms of a query or chunk, as SimpleDocStore extracts them"""
+    return [term for term in re.findall(r'\b\w+\b', text.lower()) if term not in STOPWORDS and len(term) > 2]
+
+def query_phrase_words(text):
+    """
+    Words of a query from its first to its last search term, stopwords included
+    
+    Returns:
+        list: The words, or an empty list if the query has fewer than two distinct search terms
+    """
+    positioned = positioned_terms(text)
+    if len({term for term, _ in positioned}) < 2:
+        return []
+    return re.findall(r'\b\w+\b', text.lower())[positioned[0][1]:positioned[-1][1] + 1]
+
+def match_expression(terms, phrase_words=None):
+    """
+    FTS5 query matching any of the terms (each quoted, so none is read as an operator)
+    
+    With phrase words, the whole phrase is one more alternative: BM25 adds up
+    the scores of the alternatives a chunk matches, so chunks holding the exact
+    phrase rank above chunks with the same words apart.
+    """
+    alternatives = [f'"{term}"' for term in dict.fromkeys(terms)]
+    if phrase_words:
+        alternatives.append('"' + " ".join(phrase_words) + '"')
+    return " OR ".join(alternatives)
+
+class SQLiteDocStore:
+    """
+    Document store on disk, in an SQLite database with an FTS5 full-text index
+    
+    Chunks, their metadata and page provenance live in tables and are ranked
+    with FTS5's BM25, so nothing but the pages SQLite reads is held in memory:
+    opening a store is instant, and a library can be much larger than RAM.
+    The database runs in WAL mode, so any number of threads and processes
+    read while one writes; every update is one transaction, and readers see
+    either all of it or none of it.
+    
+    It has the interface of SimpleDocStore (get_relevant_documents with
+    sections and MMR, page-by-page revisions, sources, the outline and
+    flashcard pool), so create_vector_store(path=...) returns one and the
+    rest of the app does not change. Rankings differ from SimpleDocStore's,
+    which scores raw term counts, and near duplicates are not skipped.
+    """
+    
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Database file; created if it does not exist
+        """
+        self.path = path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        # (document_version, index) of the indexes derived from the text and flashcard pool
+        self._term_index = None
+        self._definition_index = None
+        self._fuzzy = None
+        # Kept for interface compatibility; the database does its own scoring (see sharded_search.py)
+        self.query_executor = None
+        
+        with self._write_lock, self._connection() as connection:
+            connection.executescript(SCHEMA)
+    
+    def _connection(self):
+        """This thread's connection (sqlite3 connections are not shared between threads)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+    
+    def close(self):
+        """Close every connection of this store"""
+        with self._connections_lock:
+            for connection in self._connections:
+                try:
+                    connection.close()
+                except sqlite3.ProgrammingError:
+                    pass  # Owned by another thread that is gone
+            self._connections = []
+        self._local = threading.local()
+    
+    # Document-level fields
+    
+    def _get_field(self, key, default):
+        row = self._connection().execute("SELECT value FROM store WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+    
+    def _set_fields(self, connection, **fields):
+        connection.executemany("INSERT OR REPLACE INTO store (key, value) VALUES (?, ?)",
+                               [(key, json.dumps(value)) for key, value in fields.items()])
+    
+    def _update(self, **fields):
+        with self._write_lock, self._connection() as connection:
+            self._set_fields(connection, **fields)
+    
+    @property
+    def outline(self):
+        return self._get_field('outline', [])
+    
+    @outline.setter
+    def outline(self, outline):
+        self._update(outline=outline or [])
+    
+    @property
+    def flashcard_pool(self):
+        """Flashcard candidates mined from the whole document at index time"""
+        return self._get_field('flashcard_pool', [])
+    
+    @flashcard_pool.setter
+    def flashcard_pool(self, flashcard_pool):
+        with self._write_lock, self._connection() as connection:
+            self._set_fields(connection, flashcard_pool=flashcard_pool)
+            self._document_changed(connection)
+    
+    @property
+    def text(self):
+        return self._get_field('text', "")
+    
+    @text.setter
+    def text(self, text):
+        with self._write_lock, self._connection() as connection:
+            self._set_fields(connection, text=text)
+            self._document_changed(connection)
+    
+    def _document_changed(self, connection):
+        """
+        Record that the text or flashcard pool changed, so every process rebuilds the indexes of them
+        
+        Returns:
+            str: The new document version
+        """
+        version = uuid.uuid4().hex
+        self._set_fields(connection, document_version=version)
+        return version
+    
+    @property
+    def term_index(self):
+        """Positional word index of the whole text (see term_index.TermIndex), rebuilt after changes"""
+        # The version is read first, so a change made meanwhile only causes another rebuild
+        version = self._get_field('document_version', None)
+        cached = self._term_index
+        if cached is None or cached[0] != version:
+            cached = self._term_index = (version, TermIndex(self.text))
+        return cached[1]
+    
+    @term_index.setter
+    def term_index(self, term_index):
+        self._term_index = (self._get_field('document_version', None), term_index)
+    
+    @property
+    def definition_index(self):
+        """Definition sentences of the flashcard pool by term (see definitions.py), rebuilt after changes"""
+        version = self._get_field('document_version', None)
+        cached = self._definition_index
+        if cached is None or cached[0] != version:
+            cached = self._definition_index = (version, build_definition_index(self.flashcard_pool))
+        return cached[1]
+    
+    @definition_index.setter
+    def definition_index(self, definition_index):
+        self._definition_index = (self._get_field('document_version', None), definition_index)
+    
+    @property
+    def pages(self):
+        """Per-page records of the page-indexed document: fingerprint, offsets and chunk ids"""
+        rows = self._connection().execute(
+            'SELECT fingerprint, start, "end", chunk_ids FROM pages ORDER BY number').fetchall()
+        return tuple({'fingerprint': fingerprint, 'start': start, 'end': end, 'doc_ids': json.loads(chunk_ids)}
+                     for fingerprint, start, end, chunk_ids in rows)
+    
+    @property
+    def pages_source(self):
+        return self._get_field('pages_source', None)
+    
+    @property
+    def section_index(self):
+        """Section title -> ids of the chunks that overlap it"""
+        sections = {}
+        for title, doc_id in self._connection().execute(
+                "SELECT section, chunk_id FROM chunk_sections ORDER BY section, chunk_id"):
+            sections.setdefault(title, []).append(doc_id)
+        return {title: tuple(ids) for title, ids in sections.items()}
+    
+    @property
+    def source_index(self):
+        """Source name -> ids of its chunks"""
+        sources = {}
+        for source, doc_id in self._connection().execute(
+                "SELECT source, id FROM chunks WHERE source IS NOT NULL ORDER BY id"):
+            sources.setdefault(source, []).append(doc_id)
+        return {source: tuple(ids) for source, ids in sources.items()}
+    
+    @property
+    def documents(self):
+        """The chunks, in id order"""
+        return [self._document(row) for row in self._connection().execute(
+            "SELECT id, content, metadata FROM chunks ORDER BY id")]
+    
+    @property
+    def deleted_count(self):
+        # Deleted rows are removed at once; FTS5 merges its own segments
+        return 0
+    
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+    
+    def _document(self, row):
+        """Document of a (id, content, metadata) row"""
+        _, content, metadata = row
+        return Document(page_content=content, metadata=json.loads(metadata))
+    
+    def as_retriever(self, search_kwargs=None):
+        """Return a retriever-like object bound to the given search parameters"""
+        return DocStoreRetriever(self, search_kwargs)
+    
+    def get_section(self, title):
+        """
+        Look up a section of the document outline by title
+        
+        Args:
+            title (str): The section title
+        
+        Returns:
+            dict or None: The outline entry with its page and offset range
+        """
+        for section in self.outline:
+            if section['title'] == title:
+                return section
+        return None
+    
+    def get_section_documents(self, title):
+        """
+        Get the chunks that belong to a section, in document order
+        
+        Args:
+            title (str): The section title
+        
+        Returns:
+            List[Document]: The section's chunks
+        """
+        return [self._document(row) for row in self._connection().execute(
+            "SELECT chunks.id, content, metadata FROM chunk_sections JOIN chunks ON chunks.id = chunk_id "
+            "WHERE section = ? ORDER BY chunks.id", (title,))]
+    
+    @tracing.traced("retrieval")
+    def get_relevant_documents(self, query, k=4, section=None, search_type="similarity",
+                               fetch_k=20, lambda_mult=0.5):
+        """
+        Retrieve relevant documents for the query, ranked by BM25
+        
+        Args:
+            query (str): The query text
+            k (int): Number of documents to retrieve
+            section (str, optional): Only search chunks of this outline section
+            search_type (str): "similarity", or "mmr" to re-rank for diversity
+            fetch_k (int): Number of candidates to re-rank when search_type is "mmr"
+            lambda_mult (float): Trade-off between relevance (1) and diversity (0) for "mmr"
+        
+        Returns:
+            List[Document]: List of relevant documents
+        """
+        terms = query_terms(query)
+        phrase_words = query_phrase_words(query)
+        wanted = max(fetch_k, k) if search_type == "mmr" else k
+        
+        # Misspelled terms are searched as the closest indexed word
+        corrections = self.correct_terms(terms)
+        if corrections:
+            tracing.count("query_terms_corrected", len(corrections))
+            terms = [corrections.get(term, term) for term in terms]
+            phrase_words = [corrections.get(word, word) for word in phrase_words]
+        
+        # One read transaction, so the ranking and the padding see the same version
+        connection = self._connection()
+        began = not connection.in_transaction
+        if began:
+            connection.execute("BEGIN")
+        try:
+            section_join = "JOIN chunk_sections ON chunk_id = chunks.id AND section = ? " if section is not None else ""
+            section_args = (section,) if section is not None else ()
+            
+            ranking = []
+            if terms:
+                # bm25() is lower for better matches; ties rank in id order like SimpleDocStore
+                ranking = [(row[:3], -row[3]) for row in connection.execute(
+                    "SELECT chunks.id, chunks.content, chunks.metadata, bm25(chunks_fts) AS rank "
+                    "FROM chunks_fts JOIN chunks ON chunks.id = chunks_fts.rowid " + section_join +
+                    "WHERE chunks_fts MATCH ? ORDER BY rank, chunks.id LIMIT ?",
+                    section_args + (match_expression(terms, phrase_words), wanted))]
+            
+            # Chunks without any query term rank last, in document order
+            if len(ranking) < wanted:
+                scored = [row[0] for row, _ in ranking]
+                placeholders = ",".join("?" * len(scored))
+                ranking.extend((row, 0.0) for row in connection.execute(
+                    "SELECT chunks.id, chunks.content, chunks.metadata FROM chunks " + section_join +
+                    f"WHERE chunks.id NOT IN ({placeholders}) ORDER BY chunks.id LIMIT ?",
+                    section_args + tuple(scored) + (wanted - len(ranking),)))
+        finally:
+            if began:
+                connection.execute("COMMIT")
+        
+        # Over-fetch candidates and pick a diverse top k among them
+        if search_type == "mmr" and len(ranking) > k:
+            vectors = [unit_term_vector(Counter(query_terms(row[1]))) for row, _ in ranking]
+            selected = max_marginal_relevance(vectors, [score for _, score in ranking], k, lambda_mult)
+            return [self._document(ranking[i][0]) for i in selected]
+        
+        return [self._document(row) for row, _ in ranking[:k]]
+    
+    def similarity_search(self, query, k=4):
+        return self.get_relevant_documents(query, k=k)
+    
+    # Updates
+    
+    def _insert(self, connection, documents):
+        """Insert chunks and their section tags; returns their ids"""
+        ids = []
+        for doc in documents:
+            metadata = doc.metadata
+            cursor = connection.execute(
+                'INSERT INTO chunks (content, metadata, source, page, start, "end") VALUES (?, ?, ?, ?, ?, ?)',
+                (doc.page_content, json.dumps(metadata), metadata.get('source'), metadata.get('page'),
+                 metadata.get('start'), metadata.get('end')))
+            ids.append(cursor.lastrowid)
+            connection.executemany("INSERT OR IGNORE INTO chunk_sections (section, chunk_id) VALUES (?, ?)",
+                                   [(title, cursor.lastrowid) for title in metadata.get('sections', ())])
+        if ids:
+            self._vocabulary_changed(connection)
+        return ids
+    
+    def _delete(self, connection, doc_ids):
+        """Delete chunks and their section tags; returns the number deleted"""
+        deleted = 0
+        for doc_id in doc_ids:
+            connection.execute("DELETE FROM chunk_sections WHERE chunk_id = ?", (doc_id,))
+            deleted += connection.execute("DELETE FROM chunks WHERE id = ?", (doc_id,)).rowcount
+        if deleted:
+            self._vocabulary_changed(connection)
+            self._prune_pages(connection, doc_ids)
+        return deleted
+    
+    def _prune_pages(self, connection, doc_ids):
+        """
+        Drop deleted chunks from the page records
+        
+        A page that lost chunks has its fingerprint cleared, so it no longer
+        matches its content and index_pages chunks it again.
+        """
+        doc_ids = set(doc_ids)
+        for number, chunk_ids in connection.execute("SELECT number, chunk_ids FROM pages").fetchall():
+            chunk_ids = json.loads(chunk_ids)
+            remaining = [doc_id for doc_id in chunk_ids if doc_id not in doc_ids]
+            if len(remaining) != len(chunk_ids):
+                connection.execute("UPDATE pages SET fingerprint = '', chunk_ids = ? WHERE number = ?",
+                                   (json.dumps(remaining), number))
+    
+    def _all_present(self, connection, doc_ids):
+        """Check whether every one of some chunk ids is still in the store"""
+        doc_ids = set(doc_ids)
+        if not doc_ids:
+            return True
+        placeholders = ", ".join("?" * len(doc_ids))
+        found = connection.execute(f"SELECT COUNT(*) FROM chunks WHERE id IN ({placeholders})",
+                                   list(doc_ids)).fetchone()[0]
+        return found == len(doc_ids)
+    
+    def _vocabulary_changed(self, connection):
+        """Record that the indexed words changed, so every process rebuilds its typo-tolerant index"""
+        self._set_fields(connection, vocabulary_version=uuid.uuid4().hex)
+    
+    def _vocabulary(self):
+        """
+        Typo-tolerant index of the indexed words, rebuilt from the FTS vocabulary after changes
+        
+        Returns:
+            tuple: (FuzzyIndex, word -> number of chunks containing it)
+        """
+        version = self._get_field('vocabulary_version', None)
+        cached = self._fuzzy
+        if cached is None or cached[0] != version:
+            # The same words SimpleDocStore indexes
+            frequencies = {term: chunks for term, chunks in self._connection().execute(
+                "SELECT term, doc FROM chunks_vocab") if term not in STOPWORDS and len(term) > 2}
+            cached = self._fuzzy = (version, FuzzyIndex(frequencies), frequencies)
+        return cached[1], cached[2]
+    
+    def correct_terms(self, terms):
+        """
+        Closest indexed word of each term the index does not contain
+        
+        Args:
+            terms (list): Lowercased query terms
+        
+        Returns:
+            dict: Term -> correction, for the unknown terms close to an indexed word
+        """
+        fuzzy, frequencies = self._vocabulary()
+        corrections = {}
+        for term in dict.fromkeys(terms):
+            if term in frequencies:
+                continue
+            correction = best_correction(term, {word: (distance, frequencies[word])
+                                                for word, distance in fuzzy.lookup(term)})
+            if correction is not None:
+                corrections[term] = correction
+        return corrections
+    
+    def add_documents(self, documents):
+        """
+        Add new documents to the store
+        
+        Args:
+            documents (List[Document]): Documents to add
+        
+        Returns:
+            list: The ids of the added chunks
+        """
+        with self._write_lock, self._connection() as connection:
+            return self._insert(connection, documents)
+    
+    def delete_documents(self, doc_ids):
+        """
+        Delete chunks by id
+        
+        Args:
+            doc_ids (list): Ids of the chunks to delete
+        
+        Returns:
+            int: Number of chunks deleted
+        """
+        with self._write_lock, self._connection() as connection:
+            return self._delete(connection, doc_ids)
+    
+    def delete_source(self, source):
+        """
+        Delete every chunk added with a source
+        
+        Args:
+            source (str): The source name
+        
+        Returns:
+            int: Number of chunks deleted
+        """
+        with self._write_lock, self._connection() as connection:
+            doc_ids = [row[0] for row in connection.execute("SELECT id FROM chunks WHERE source = ?", (source,))]
+            deleted = self._delete(connection, doc_ids)
+            # The page-indexed document carries the text, flashcards and outline too
+            if source is not None and source == self._get_field('pages_source', None):
+                connection.execute("DELETE FROM pages")
+                connection.execute("DELETE FROM store WHERE key IN "
+                                   "('flashcard_pool', 'outline', 'text', 'pages_source')")
+                self._document_changed(connection)
+        return deleted
+    
+    def clear(self):
+        """Delete every chunk and field"""
+        with self._write_lock, self._connection() as connection:
+            for table in ("chunk_sections", "chunks", "pages", "store"):
+                connection.execute(f"DELETE FROM {table}")
+            self._vocabulary_changed(connection)
+            self._document_changed(connection)
+    
+    def compact(self):
+        """Merge the full-text index's segments into one and return the freed pages to the file system"""
+        with self._write_lock:
+            connection = self._connection()
+            with connection:
+                connection.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('optimize')")
+            connection.execute("VACUUM")
+    
+    def index_pages(self, text, page_offsets, outline=None, strategy="sliding", max_tokens=150,
+                    overlap_tokens=30, source=None):
+        """
+        Index a (revised) document page by page, re-chunking only pages that changed
+        
+        Works like SimpleDocStore.index_pages: unchanged pages keep their
+        chunks (with their offsets moved), chunks of changed or removed pages
+        are deleted, and new or changed pages are chunked and inserted, all in
+        one transaction.
+        
+        Args:
+            text (str): The full cleaned document text
+            page_offsets (list): Start offset of each page in text
+            outline (list, optional): Document outline with offsets into text
+            strategy (str): Chunking strategy (see chunking.CHUNKING_STRATEGIES)
+            max_tokens (int): Token budget of each chunk
+            overlap_tokens (int): Token overlap between neighbouring chunks
+            source (str, optional): Source recorded on the chunks (see delete_source)
+        
+        Returns:
+            dict: Numbers of 'reused', 'reindexed' and 'removed' pages
+        """
+        spans = page_spans(text, page_offsets)
+        fingerprints = [page_content_fingerprint(text[start:end]) for start, end in spans]
+        outline = outline or []
+        
+        with self._write_lock, self._connection() as connection:
+            old_records = self.pages
+            
+            # Pair new pages with old pages of identical content, in page order
+            # (pages that lost chunks to deletion are indexed again)
+            old_pages = {}
+            for number, page in enumerate(old_records):
+                if self._all_present(connection, page['doc_ids']):
+                    old_pages.setdefault(page['fingerprint'], deque()).append(number)
+            matches = []
+            for fingerprint in fingerprints:
+                candidates = old_pages.get(fingerprint)
+                matches.append(candidates.popleft() if candidates else None)
+            kept = {old: new for new, old in enumerate(matches) if old is not None}
+            
+            self._delete(connection, [doc_id for number, page in enumerate(old_records) if number not in kept
+                                      for doc_id in page['doc_ids']])
+            
+            # Chunk the new and changed pages; move the chunks of unchanged pages
+            new_docs = []
+            moved = {}
+            changed = []
+            for number, ((start, end), match) in enumerate(zip(spans, matches)):
+                if match is None:
+                    docs = split_page_into_documents(text, start, end, number, strategy, max_tokens,
+                                                     overlap_tokens, outline)
+                    if source is not None:
+                        for doc in docs:
+                            doc.metadata['source'] = source
+                    new_docs.extend(docs)
+                    changed.append(number)
+                else:
+                    shift = start - old_records[match]['start']
+                    for doc_id in old_records[match]['doc_ids']:
+                        content, metadata = connection.execute(
+                            "SELECT content, metadata FROM chunks WHERE id = ?", (doc_id,)).fetchone()
+                        metadata = {key: value for key, value in json.loads(metadata).items()
+                                    if key not in ('sections', 'section')}
+                        metadata['start'] += shift
+                        metadata['end'] += shift
+                        metadata['page'] = number
+                        moved[doc_id] = Document(page_content=content, metadata=metadata)
+            
+            # Tag all of the document's chunks with the new outline
+            assign_sections(sorted(new_docs + list(moved.values()), key=lambda doc: doc.metadata['start']),
+                            outline)
+            for doc_id, doc in moved.items():
+                connection.execute('UPDATE chunks SET metadata = ?, page = ?, start = ?, "end" = ? WHERE id = ?',
+                                   (json.dumps(doc.metadata), doc.metadata['page'], doc.metadata['start'],
+                                    doc.metadata['end'], doc_id))
+                connection.execute("DELETE FROM chunk_sections WHERE chunk_id = ?", (doc_id,))
+                connection.executemany("INSERT OR IGNORE INTO chunk_sections (section, chunk_id) VALUES (?, ?)",
+                                       [(title, doc_id) for title in doc.metadata.get('sections', ())])
+            new_ids = {}
+            for doc, doc_id in zip(new_docs, self._insert(connection, new_docs)):
+                new_ids.setdefault(doc.metadata['page'], []).append(doc_id)
+            
+            # Page records, with the ids of each page's chunks
+            connection.execute("DELETE FROM pages")
+            connection.executemany(
+                'INSERT INTO pages (number, fingerprint, start, "end", chunk_ids) VALUES (?, ?, ?, ?, ?)',
+                [(number, fingerprint, start, end,
+                  json.dumps(new_ids.get(number, []) if match is None else old_records[match]['doc_ids']))
+                 for number, ((start, end), fingerprint, match) in enumerate(zip(spans, fingerprints, matches))])
+            
+            # Flashcard candidates: keep those of unchanged pages, mine the rest
+            if not kept:
+                pool = build_flashcard_pool(text, outline, page_offsets)
+            else:
+                pool = []
+                for candidate in self.flashcard_pool:
+                    old = candidate['page']
+                    if old in kept:
+                        candidate['start'] += spans[kept[old]][0] - old_records[old]['start']
+                        candidate['page'] = kept[old]
+                        pool.append(candidate)
+                for number in changed:
+                    start, end = spans[number]
+                    for candidate in build_flashcard_pool(text[start:end]):
+                        candidate['start'] += start
+                        candidate['page'] = number
+                        pool.append(candidate)
+                for candidate in pool:
+                    section = find_section(outline, candidate['start'])
+                    candidate['section'] = section['title'] if section else None
+            
+            self._set_fields(connection, outline=outline, flashcard_pool=pool, text=text, pages_source=source)
+            # Word positions shift with any change, so the term index is rebuilt on
+            # demand, while the definitions are indexed now along with the new pool
+            version = self._document_changed(connection)
+            self._definition_index = (version, build_definition_index(pool))
+        
+        tracing.count("cache_hits", len(kept), cache="indexed_pages")
+        tracing.count("cache_misses", len(changed), cache="indexed_pages")
+        return {'reused': len(kept), 'reindexed': len(changed), 'removed': len(old_records) - len(kept)}
@@ -0,0 +1,385 @@
+import bisect
+import hashlib
+import heapq
+import json
+import os
+import struct
+import threading
+import time
+
+# Log layout: a magic header followed by tagged records
+LOG_MAGIC = b'SRL1'
+CARD_RECORD = b'C'    # card_id, payload length, UTF-8 JSON {deck, question, answer}
+REVIEW_RECORD = b'R'  # card_id, timestamp, grade
+STATE_RECORD = b'S'   # card_id, ease, interval, repetitions, lapses, due, last review (written by compact)
+
+CARD_HEADER = struct.Struct('<QI')
+REVIEW = struct.Struct('<QdB')
+STATE = struct.Struct('<QddHHdd')
+
+# Grades of the review buttons (SM-2 quality scale 0-5)
+GRADES = {"again": 1, "hard": 3, "good": 4, "easy": 5}
+
+DAY_SECONDS = 86400
+RELEARN_SECONDS = 600  # Failed cards come back after ten minutes
+
+# The log is compacted on startup once its reviews outnumber the cards by this
+# factor (and the minimum), so replay stays proportional to the number of cards
+COMPACT_REVIEWS_PER_CARD = 4
+COMPACT_MIN_REVIEWS = 1000
+
+def card_id_for(deck, question, answer):
+    """Stable 64-bit id of a flashcard within a deck"""
+    digest = hashlib.blake2b(f"{deck}\x00{question}\x00{answer}".encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+class CardState:
+    """SM-2 scheduling state of one card"""
+    
+    __slots__ = ('card_id', 'deck', 'question', 'answer', 'ease', 'interval', 'repetitions',
+                 'lapses', 'due', 'last_review')
+    
+    def __init__(self, card_id, deck, question, answer, due):
+        self.card_id = card_id
+        self.deck = deck
+        self.question = question
+        self.answer = answer
+        self.ease = 2.5
+        self.interval = 0.0  # days
+        self.repetitions = 0
+        self.lapses = 0
+        self.due = due
+        self.last_review = 0.0
+    
+    def apply_review(self, grade, timestamp):
+        """
+        Update the state with one review (SM-2)
+        
+        Args:
+            grade (int): Recall quality from 0 (blackout) to 5 (perfect)
+            timestamp (float): Time of the review, in seconds since the epoch
+        """
+        if grade < 3:
+            self.repetitions = 0
+            self.lapses += 1
+            self.interval = 0.0
+            self.due = timestamp + RELEARN_SECONDS
+        else:
+            if self.repetitions == 0:
+                self.interval = 1.0
+            elif self.repetitions == 1:
+                self.interval = 6.0
+            else:
+                self.interval = self.interval * self.ease
+            self.repetitions += 1
+            self.due = timestamp + self.interval * DAY_SECONDS
+        
+        self.ease = max(1.3, self.ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+        self.last_review = timestamp
+    
+    def to_dict(self):
+        """Card fields for display"""
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+class StudyScheduler:
+    """
+    Spaced-repetition scheduler with an append-only review log
+    
+    Card definitions and review events are appended to a compact binary log
+    and replayed on startup to rebuild every card's SM-2 state. Due dates are
+    kept in heaps (one overall, one per deck) with lazy invalidation, so
+    fetching the next due cards costs O(log n) per card. Card counts and the
+    sorted due dates of reviewed cards are kept up to date as cards and
+    reviews come in, so stats() never scans the cards. A log dominated by
+    reviews is compacted when it is opened.
+    """
+    
+    def __init__(self, path):
+        """
+        Args:
+            path (str): Location of the review log (created if missing)
+        """
+        self.path = path
+        self.cards = {}
+        self._heap = []
+        self._deck_heaps = {}
+        self._counts = {}  # Deck (None for all decks) -> {'total': n, 'new': n}
+        self._review_dues = {}  # Deck (None for all decks) -> sorted due dates of reviewed cards
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        reviews = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            reviews = self._replay()
+        else:
+            with open(path, 'wb') as log:
+                log.write(LOG_MAGIC)
+        
+        self._rebuild_heaps()
+        self._rebuild_counts()
+        
+        if reviews > max(COMPACT_REVIEWS_PER_CARD * len(self.cards), COMPACT_MIN_REVIEWS):
+            try:
+                self.compact()
+            except OSError as e:
+                # The uncompacted log is still complete, just slower to replay
+                print(f"Error compacting study log {path}: {e}")
+    
+    def _replay(self):
+        """
+        Rebuild card states from the log
+        
+        Returns:
+            int: Number of review records replayed
+        """
+        with open(self.path, 'rb') as log:
+            data = log.read()
+        
+        if data[:len(LOG_MAGIC)] != LOG_MAGIC:
+            raise ValueError(f"{self.path} is not a study log")
+        
+        position = len(LOG_MAGIC)
+        end = len(data)
+        cards = self.cards
+        reviews = 0
+        while position < end:
+            record_start = position
+            tag = data[position:position + 1]
+            position += 1
+            try:
+                if tag == REVIEW_RECORD:
+                    card_id, timestamp, grade = REVIEW.unpack_from(data, position)
+                    position += REVIEW.size
+                    reviews += 1
+                    state = cards.get(card_id)
+                    if state is not None:
+                        state.apply_review(grade, timestamp)
+                elif tag == CARD_RECORD:
+                    card_id, length = CARD_HEADER.unpack_from(data, position)
+                    position += CARD_HEADER.size
+                    if position + length > end:
+                        raise struct.error("truncated card record")
+                    payload = json.loads(data[position:position + length].decode('utf-8'))
+                    position += length
+                    if card_id not in cards:
+                        cards[card_id] = CardState(card_id, payload['deck'], payload['question'],
+                                                   payload['answer'], payload.get('created', 0.0))
+                elif tag == STATE_RECORD:
+                    (card_id, ease, interval, repetitions, lapses, due,
+                     last_review) = STATE.unpack_from(data, position)
+                    position += STATE.size
+                    state = cards.get(card_id)
+                    if state is not None:
+                        state.ease, state.interval = ease, interval
+                        state.repetitions, state.lapses = repetitions, lapses
+                        state.due, state.last_review = due, last_review
+                else:
+                    raise ValueError(f"unknown record tag {tag!r}")
+            except (struct.error, ValueError) as e:
+                # Only a record cut short by the end of the log (struct.error), or the
+                # zeros a crash can leave there, is a torn write; anything else is
+                # corruption, and truncating would throw away every later record
+                if not isinstance(e, struct.error) and data[record_start:].strip(b'\x00'):
+                    raise ValueError(f"Corrupt record in study log {self.path} at byte {record_start} "
+                                     f"(the log was left unchanged): {e}") from e
+                # Drop the torn write so new records stay readable
+                print(f"Error replaying study log at byte {record_start}: {e}")
+                with open(self.path, 'r+b') as log:
+                    log.truncate(record_start)
+                break
+        
+        return reviews
+    
+    def _rebuild_heaps(self):
+        """Heapify the due dates of all cards"""
+        self._heap = [(state.due, card_id) for card_id, state in self.cards.items()]
+        heapq.heapify(self._heap)
+        self._deck_heaps = {}
+        for card_id, state in self.cards.items():
+            self._deck_heaps.setdefault(state.deck, []).append((state.due, card_id))
+        for heap in self._deck_heaps.values():
+            heapq.heapify(heap)
+    
+    def _rebuild_counts(self):
+        """Count the cards of every deck and sort the due dates of the reviewed ones"""
+        self._counts = {}
+        self._review_dues = {}
+        for state in self.cards.values():
+            for key in (None, state.deck):
+                counts = self._counts.setdefault(key, {'total': 0, 'new': 0})
+                counts['total'] += 1
+                if state.last_review == 0:
+                    counts['new'] += 1
+                else:
+                    self._review_dues.setdefault(key, []).append(state.due)
+        for dues in self._review_dues.values():
+            dues.sort()
+    
+    def _push(self, state):
+        """Schedule a card at its current due date (older heap entries become stale)"""
+        heapq.heappush(self._heap, (state.due, state.card_id))
+        heapq.heappush(self._deck_heaps.setdefault(state.deck, []), (state.due, state.card_id))
+        
+        # Drop stale entries once they outnumber live ones
+        if len(self._heap) > 2 * len(self.cards) + 64:
+            self._rebuild_heaps()
+    
+    def _append(self, records):
+        """Append encoded records to the log with a single write"""
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, b''.join(records))
+        finally:
+            os.close(fd)
+    
+    def add_cards(self, deck, flashcards, now=None):
+        """
+        Register flashcards for study, skipping ones already known
+        
+        Args:
+            deck (str): Name of the deck (e.g. the PDF the cards came from)
+            flashcards (list): Flashcards with 'question' and 'answer'
+            now (float, optional): Creation time; new cards are due immediately
+        
+        Returns:
+            list: Ids of the cards, in the order given
+        """
+        now = time.time() if now is None else now
+        card_ids = []
+        records = []
+        
+        with self._lock:
+            for card in flashcards:
+                card_id = card_id_for(deck, card['question'], card['answer'])
+                card_ids.append(card_id)
+                if card_id in self.cards:
+                    continue
+                
+                state = CardState(card_id, deck, card['question'], card['answer'], now)
+                self.cards[card_id] = state
+                self._push(state)
+                for key in (None, deck):
+                    counts = self._counts.setdefault(key, {'total': 0, 'new': 0})
+                    counts['total'] += 1
+                    counts['new'] += 1
+                
+                payload = json.dumps({'deck': deck, 'question': card['question'],
+                                      'answer': card['answer'], 'created': now}).encode('utf-8')
+                records.append(CARD_RECORD + CARD_HEADER.pack(card_id, len(payload)) + payload)
+            
+            if records:
+                self._append(records)
+        
+        return card_ids
+    
+    def review(self, card_id, grade, now=None):
+        """
+        Record a review and reschedule the card
+        
+        Args:
+            card_id (int): The reviewed card
+            grade (int or str): SM-2 quality 0-5, or one of GRADES ("again", "hard", "good", "easy")
+            now (float, optional): Time of the review
+        
+        Returns:
+            dict: The card's updated state
+        """
+        if isinstance(grade, str):
+            grade = GRADES[grade]
+        now = time.time() if now is None else now
+        
+        with self._lock:
+            state = self.cards[card_id]
+            for key in (None, state.deck):
+                dues = self._review_dues.setdefault(key, [])
+                if state.last_review == 0:
+                    self._counts[key]['new'] -= 1
+                else:
+                    del dues[bisect.bisect_left(dues, state.due)]
+            state.apply_review(grade, now)
+            for key in (None, state.deck):
+                bisect.insort(self._review_dues[key], state.due)
+            self._push(state)
+            self._append([REVIEW_RECORD + REVIEW.pack(card_id, now, grade)])
+        
+        return state.to_dict()
+    
+    def due_cards(self, limit=10, deck=None, now=None):
+        """
+        Get the cards that are due, most overdue first
+        
+        Args:
+            limit (int): Maximum number of cards to return
+            deck (str, optional): Only cards from this deck
+            now (float, optional): Reference time
+        
+        Returns:
+            list: Card dicts (see CardState.to_dict)
+        """
+        now = time.time() if now is None else now
+        
+        with self._lock:
+            heap = self._heap if deck is None else self._deck_heaps.get(deck, [])
+            due = []
+            popped = []
+            while heap and len(due) < limit and heap[0][0] <= now:
+                entry = heapq.heappop(heap)
+                state = self.cards.get(entry[1])
+                # Skip stale entries left behind by rescheduling
+                if state is None or state.due != entry[0]:
+                    continue
+                popped.append(entry)
+                due.append(state.to_dict())
+            
+            for entry in popped:
+                heapq.heappush(heap, entry)
+        
+        return due
+    
+    def stats(self, deck=None, now=None):
+        """
+        Count cards by study status
+        
+        Reads the counts kept up to date by add_cards and review, and finds
+        the due cards among the reviewed ones by binary search.
+        
+        Args:
+            deck (str, optional): Only cards from this deck
+            now (float, optional): Reference time
+        
+        Returns:
+            dict: Numbers of 'total', 'new', 'due' and 'learned' cards
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            counts = dict(self._counts.get(deck, {'total': 0, 'new': 0}))
+            dues = self._review_dues.get(deck, [])
+            counts['due'] = bisect.bisect_right(dues, now)
+            counts['learned'] = len(dues) - counts['due']
+        return counts
+    
+    def compact(self):
+        """
+        Rewrite the log as one card and one state record per card
+        
+        Replay then costs O(cards) instead of O(reviews). The new log is
+        written next to the old one and swapped in atomically.
+        """
+        with self._lock:
+            records = [LOG_MAGIC]
+            for card_id, state in self.cards.items():
+                payload = json.dumps({'deck': state.deck, 'question': state.question,
+                                      'answer': state.answer, 'created': state.due}).encode('utf-8')
+                records.append(CARD_RECORD + CARD_HEADER.pack(card_id, len(payload)) + payload)
+                if state.last_review:
+                    records.append(STATE_RECORD + STATE.pack(card_id, state.ease, state.interval,
+                                                             state.repetitions, state.lapses,
+                                                             state.due, state.last_review))
+            
+            temporary_path = self.path + '.compact'
+            with open(temporary_path, 'wb') as log:
+                log.write(b''.join(records))
+                log.flush()
+                os.fsync(log.fileno())
+            os.replace(temporary_path, self.path)
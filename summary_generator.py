@@ -2,6 +2,9 @@ import os
 import re
 from collections import Counter
 from utils import extract_topics, split_text_into_chunks
+from chunking import SENTENCE_BOUNDARY
+from patterns import CUE_PHRASES, SECTION_NUMBER_PATTERN
+import tracing
 
 # Define common stopwords (for text analysis)
 STOPWORDS = {
@@ -92,6 +95,7 @@ def identify_topics(text, retriever):
     
     except Exception as e:
         print(f"Error identifying topics: {e}")
+        tracing.record_error("summaries", e)
         # Fallback to basic topic extraction
         return extract_topics(text)
 
@@ -124,23 +128,27 @@ def generate_summary_for_topic(topic, retriever):
         # Enhanced text-based approach to generate a more coherent summary
         
         # Break the topic into words
-        topic_words = set(topic.lower().split())
+        topic_lower = topic.lower()
+        topic_words = set(topic_lower.split()) - STOPWORDS
         
         # Split context into sentences
-        sentences = re.split(r'(?<!\w\.\w.)(?<![A-Z][a-z]\.)(?<=\.|\?)\s', context)
+        sentences = SENTENCE_BOUNDARY.split(context)
         
         # Score each sentence based on multiple relevance factors
         scored_sentences = []
         position_weight = {}  # Track sentence position importance
+        sentence_info = []  # (lowercased sentence, word count, cue labels) per sentence
         
         # First pass: identify important sentences by position (intro/conclusion)
-        section_marker_terms = ["introduction", "conclusion", "summary", "overview", "background", 
-                               "key points", "findings", "results", "analysis", "discussion"]
-        
         # Mark sentences that appear to introduce sections
         for i, sentence in enumerate(sentences):
             sentence_lower = sentence.lower()
             
+            # One pass over the sentence's words finds every cue phrase (see patterns.CUE_PHRASES)
+            words = sentence_lower.split()
+            cues = CUE_PHRASES.labels(words)
+            sentence_info.append((sentence_lower, len(words), cues))
+            
             # Higher importance for first/last sentences of the context (likely intro/conclusion)
             if i < 3:  # First few sentences likely introduce the topic
                 position_weight[i] = 2
@@ -150,20 +158,20 @@ def generate_summary_for_topic(topic, retriever):
                 position_weight[i] = 1
                 
             # Check if sentence appears to be a section header or intro
-            if any(marker in sentence_lower for marker in section_marker_terms):
+            if "section_marker" in cues:
                 position_weight[i] = 2.5
                 
             # Check for sentences that have section numbering
-            if re.match(r'^(\d+\.|\([\d]+\)|\w+\))', sentence.strip()):
+            if SECTION_NUMBER_PATTERN.match(sentence.strip()):
                 position_weight[i] = 2
             
         # Second pass: score sentences based on topic relevance and position
         for i, sentence in enumerate(sentences):
+            sentence_lower, length, cues = sentence_info[i]
+            
             # Skip very short or very long sentences
-            if len(sentence.split()) < 5 or len(sentence.split()) > 40:
+            if length < 5 or length > 40:
                 continue
-                
-            sentence_lower = sentence.lower()
             
             # Multiple scoring factors:
             # 1. Topic word matches
@@ -174,11 +182,11 @@ def generate_summary_for_topic(topic, retriever):
             # Base score: topic word matches
             base_score = 0
             for word in topic_words:
-                if word in sentence_lower and word not in STOPWORDS:
+                if word in sentence_lower:
                     base_score += 1
                     
             # Bonus for exact topic phrase
-            if topic.lower() in sentence_lower:
+            if topic_lower in sentence_lower:
                 base_score += 3
                 
             # No matches to topic, skip unless it's an important position
@@ -189,7 +197,6 @@ def generate_summary_for_topic(topic, retriever):
             position_factor = position_weight.get(i, 1)
             
             # Prefer medium-length sentences (not too short, not too long)
-            length = len(sentence.split())
             length_factor = 1.0
             if 10 <= length <= 25:  # Ideal length
                 length_factor = 1.2
@@ -197,9 +204,7 @@ def generate_summary_for_topic(topic, retriever):
                 length_factor = 0.8
                 
             # Bonus for explanatory phrases
-            explanation_phrases = ["means", "refers to", "is defined as", "is a", "describes", "explains", 
-                                  "consists of", "involves", "includes", "represents"]
-            if any(phrase in sentence_lower for phrase in explanation_phrases):
+            if "explanation" in cues:
                 explanation_bonus = 1.5
             else:
                 explanation_bonus = 1.0
@@ -212,6 +217,7 @@ def generate_summary_for_topic(topic, retriever):
                 
         # Sort sentences by score (primary) and position (secondary) 
         scored_sentences.sort(key=lambda x: (x[2], -x[1]), reverse=True)
+        tracing.count("sentences_scored", len(scored_sentences), stage="summaries")
         
         # Take top 5-7 sentences based on score
         top_sentences = scored_sentences[:7]
@@ -239,8 +245,10 @@ def generate_summary_for_topic(topic, retriever):
     
     except Exception as e:
         print(f"Error generating summary for topic '{topic}': {e}")
+        tracing.record_error("summaries", e)
         return f"Failed to generate summary for this topic. Error: {str(e)}"
 
+@tracing.traced("summaries")
 def generate_summaries(text, retriever):
     """
     Generate topic-wise summaries from the provided text
@@ -0,0 +1,101 @@
+import re
+from array import array
+from bisect import bisect_left
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def _has_position(positions, position):
+    """Binary search a sorted position list"""
+    i = bisect_left(positions, position)
+    return i < len(positions) and positions[i] == position
+
+def phrase_starts(lists, offsets, limit=None):
+    """
+    Intersect position lists into the places where words occur at fixed offsets
+    
+    Args:
+        lists (list): Sorted token positions of each word
+        offsets (list): Offset of each word from the start of the phrase
+        limit (int, optional): Stop after this many matches
+    
+    Returns:
+        list: Token positions where the phrase starts
+    """
+    # Start from the rarest word and binary-search the other words' position lists
+    rarest = min(range(len(lists)), key=lambda i: len(lists[i]))
+    others = [(offsets[i] - offsets[rarest], lists[i]) for i in range(len(lists)) if i != rarest]
+    starts = []
+    for position in lists[rarest]:
+        if all(_has_position(positions, position + offset) for offset, positions in others):
+            starts.append(position - offsets[rarest])
+            if limit is not None and len(starts) >= limit:
+                break
+    return starts
+
+class TermIndex:
+    """
+    Positional index of every word in a document
+    
+    Maps each lowercased word to the (sorted) token positions where it occurs,
+    so word membership is a dictionary lookup and phrase lookup is an
+    intersection of position lists rather than a scan of the text.
+    """
+    
+    def __init__(self, text):
+        """
+        Args:
+            text (str): The document text
+        """
+        self.postings = {}
+        self.num_tokens = 0
+        
+        for position, match in enumerate(TOKEN_PATTERN.finditer(text.lower())):
+            positions = self.postings.get(match.group())
+            if positions is None:
+                positions = self.postings[match.group()] = array('I')
+            positions.append(position)
+            self.num_tokens = position + 1
+    
+    def __contains__(self, term):
+        return term in self.postings
+    
+    def frequency(self, term):
+        """Number of occurrences of a word in the document"""
+        positions = self.postings.get(term)
+        return len(positions) if positions is not None else 0
+    
+    def phrase_positions(self, terms, limit=None):
+        """
+        Find where a sequence of words occurs consecutively
+        
+        Args:
+            terms (list): Lowercased words of the phrase
+            limit (int, optional): Stop after this many matches
+        
+        Returns:
+            list: Token positions where the phrase starts
+        """
+        if not terms:
+            return []
+        
+        lists = []
+        for term in terms:
+            positions = self.postings.get(term)
+            if positions is None:
+                return []
+            lists.append(positions)
+        
+        return phrase_starts(lists, range(len(terms)), limit)
+    
+    def contains_phrase(self, phrase):
+        """
+        Check whether a phrase occurs in the document
+        
+        Args:
+            phrase (str): The phrase text
+        
+        Returns:
+            bool: True if all of its words occur consecutively somewhere
+        """
+        terms = TOKEN_PATTERN.findall(phrase.lower())
+        return bool(terms) and bool(self.phrase_positions(terms, limit=1))
@@ -0,0 +1,319 @@
+"""
+Lightweight tracing and metrics for the pipeline stages
+
+Stages (extraction, indexing, retrieval, QA, flashcards, summaries) are timed
+with span() or @traced into a duration histogram per stage, and nested spans
+are kept as recent traces, so a slow answer can be broken down into the time
+spent retrieving and the time spent scoring sentences. count() adds to
+counters such as chunks scored or cache hits, and record_error() keeps the
+errors that are otherwise only printed. Everything can be exported as
+Prometheus text or JSON.
+
+Tracing is off unless the TRACING environment variable is set (or enable()
+is called). When it is off every entry point returns straight away, so the
+instrumented code pays one flag check per call.
+"""
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Upper bounds (in seconds) of the duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Finished traces and errors kept for inspection, and child spans kept per span
+RECENT_TRACES = 50
+RECENT_ERRORS = 50
+MAX_CHILD_SPANS = 100
+
+# Prefix of the exported Prometheus metric names
+METRIC_PREFIX = "assistant_"
+
+_enabled = os.environ.get("TRACING", "").lower() in ("1", "true", "yes", "on")
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> {'buckets': [count per bucket], 'sum', 'count', 'max'}
+_traces = deque(maxlen=RECENT_TRACES)
+_errors = deque(maxlen=RECENT_ERRORS)
+
+# Open spans of each thread, innermost last
+_local = threading.local()
+
+# Shared stand-in for span() while tracing is off
+_NO_SPAN = contextlib.nullcontext()
+
+def enable():
+    """Start collecting spans and metrics"""
+    global _enabled
+    _enabled = True
+
+def disable():
+    """Stop collecting; what was collected so far is kept until reset()"""
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    """Whether spans and metrics are being collected"""
+    return _enabled
+
+def reset():
+    """Forget all collected metrics, traces and errors"""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+        _traces.clear()
+        _errors.clear()
+
+def _key(name, labels):
+    """Metric key: the name and its labels in a fixed order"""
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def count(name, value=1, **labels):
+    """
+    Add to a counter
+    
+    Args:
+        name (str): Counter name, e.g. 'chunks_scored' (exported as assistant_chunks_scored_total)
+        value (int): Amount to add
+        **labels: Labels of the counter, e.g. cache='extracted_pages'
+    """
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name, value, buckets=DURATION_BUCKETS, **labels):
+    """
+    Record a value in a histogram
+    
+    Args:
+        name (str): Histogram name
+        value (float): The observed value
+        buckets (tuple): Bucket upper bounds, used when the histogram is first created
+        **labels: Labels of the histogram
+    """
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = {'bounds': tuple(buckets), 'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0,
+                         'max': 0.0}
+            _histograms[key] = histogram
+        # Counts per bucket; exports make them cumulative
+        for i, bound in enumerate(histogram['bounds']):
+            if value <= bound:
+                histogram['buckets'][i] += 1
+                break
+        histogram['sum'] += value
+        histogram['count'] += 1
+        histogram['max'] = max(histogram['max'], value)
+
+def record(stage, seconds, **labels):
+    """Record the duration of a stage that was timed without a span (e.g. a Streamlit script run)"""
+    observe("stage_duration_seconds", seconds, stage=stage, **labels)
+
+def record_error(stage, error):
+    """
+    Count an error of a stage and keep it with the recent errors
+    
+    Args:
+        stage (str): The stage that failed, e.g. 'qa'
+        error (Exception or str): The error
+    """
+    if not _enabled:
+        return
+    count("errors", stage=stage)
+    kind = type(error).__name__ if isinstance(error, BaseException) else None
+    with _lock:
+        _errors.append({'stage': stage, 'error': str(error), 'type': kind, 'time': time.time()})
+
+class _Span:
+    """A timed stage; records its duration and joins the enclosing span's trace"""
+    
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+        self.record = None
+        self.started = None
+    
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.record = {'stage': self.stage, 'labels': self.labels, 'start': time.time(), 'duration_s': None,
+                       'error': None, 'children': []}
+        if stack:
+            parent = stack[-1].record
+            if len(parent['children']) < MAX_CHILD_SPANS:
+                parent['children'].append(self.record)
+            else:
+                parent['dropped_children'] = parent.get('dropped_children', 0) + 1
+        stack.append(self)
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.started
+        self.record['duration_s'] = round(duration, 6)
+        
+        # Unwind to this span, in case an inner span was never closed
+        stack = _local.stack
+        while stack and stack.pop() is not self:
+            pass
+        
+        record(self.stage, duration, **self.labels)
+        if exc is not None:
+            self.record['error'] = repr(exc)
+            record_error(self.stage, exc)
+        if not stack:
+            with _lock:
+                _traces.append(self.record)
+        return False
+
+def span(stage, **labels):
+    """
+    Time a block of code as a pipeline stage
+    
+    Usage:
+        with tracing.span("retrieval"):
+            ...
+    
+    Args:
+        stage (str): Stage name, recorded as the 'stage' label of the duration histogram
+        **labels: Extra labels of the duration histogram
+    
+    Returns:
+        A context manager (a shared no-op one while tracing is off)
+    """
+    if not _enabled:
+        return _NO_SPAN
+    return _Span(stage, labels)
+
+def traced(stage):
+    """Decorator that runs every call of a function in a span(stage)"""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Span(stage, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def snapshot():
+    """
+    Copy of everything collected, in a JSON-serializable form
+    
+    Returns:
+        dict: 'enabled', 'counters', 'histograms' (with cumulative bucket counts),
+              'traces' (most recent last) and 'errors'
+    """
+    with _lock:
+        counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(_counters.items())]
+        histograms = []
+        for (name, labels), histogram in sorted(_histograms.items()):
+            cumulative = []
+            total = 0
+            for bound, bucket in zip(histogram['bounds'], histogram['buckets']):
+                total += bucket
+                cumulative.append([bound, total])
+            histograms.append({'name': name, 'labels': dict(labels), 'buckets': cumulative,
+                               'sum': round(histogram['sum'], 6), 'count': histogram['count'],
+                               'max': round(histogram['max'], 6)})
+        # Traces are finished, so a shallow copy of the list is enough
+        return {'enabled': _enabled, 'counters': counters, 'histograms': histograms,
+                'traces': list(_traces), 'errors': list(_errors)}
+
+def stage_summary():
+    """
+    Per-stage call counts and timings
+    
+    Returns:
+        list: One dict per stage (and label set) with 'stage', 'labels', 'calls',
+              'total_s', 'mean_ms' and 'max_ms', slowest total first
+    """
+    rows = []
+    for histogram in snapshot()['histograms']:
+        if histogram['name'] != "stage_duration_seconds":
+            continue
+        labels = dict(histogram['labels'])
+        stage = labels.pop('stage', None)
+        rows.append({'stage': stage, 'labels': labels, 'calls': histogram['count'],
+                     'total_s': histogram['sum'],
+                     'mean_ms': round(histogram['sum'] * 1000 / max(histogram['count'], 1), 3),
+                     'max_ms': round(histogram['max'] * 1000, 3)})
+    rows.sort(key=lambda row: row['total_s'], reverse=True)
+    return rows
+
+def export_json(indent=2):
+    """Everything collected, as a JSON string (see snapshot())"""
+    return json.dumps(snapshot(), indent=indent)
+
+def _format_labels(labels, extra=()):
+    """Prometheus label set, e.g. {stage="qa",le="0.5"}"""
+    pairs = list(labels.items()) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for key, value in pairs]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+def export_prometheus():
+    """
+    Counters and histograms in the Prometheus text exposition format
+    
+    Returns:
+        str: The metrics, e.g. for a textfile collector or a /metrics handler
+    """
+    data = snapshot()
+    lines = []
+    
+    typed = set()
+    for counter in data['counters']:
+        name = f"{METRIC_PREFIX}{counter['name']}_total"
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{name}{_format_labels(counter['labels'])} {counter['value']}")
+    
+    for histogram in data['histograms']:
+        name = f"{METRIC_PREFIX}{histogram['name']}"
+        if name not in typed:
+            lines.append(f"# TYPE {name} histogram")
+            typed.add(name)
+        labels = histogram['labels']
+        for bound, total in histogram['buckets']:
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', repr(float(bound)))])} {total}")
+        lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    
+    return "\n".join(lines) + "\n"
+
+def write_metrics(path):
+    """
+    Write the metrics to a file, replacing it atomically so readers never see a partial file
+    
+    Args:
+        path (str): Destination; a .json path gets export_json(), anything else export_prometheus()
+    """
+    content = export_json() if path.endswith('.json') else export_prometheus()
+    temporary = f"{path}.{os.getpid()}.tmp"
+    try:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(temporary, 'w') as f:
+            f.write(content)
+        os.replace(temporary, path)
+    except OSError as e:
+        print(f"Error writing metrics to {path}: {e}")
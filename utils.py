@@ -1,7 +1,9 @@
 import re
+from bisect import bisect_right
 import nltk
-from nltk.tokenize import sent_tokenize, word_tokenize
+from nltk.tokenize import word_tokenize
 from nltk.corpus import stopwords
+from chunking import chunk_text
 
 # Download NLTK resources if they're not already available
 try:
@@ -25,20 +27,9 @@ def clean_text(text):
     return text.strip()
 
 def split_text_into_chunks(text, chunk_size=1000, overlap=200):
-    """Split text into overlapping chunks for processing"""
-    words = word_tokenize(text)
-    chunks = []
-    
-    i = 0
-    while i < len(words):
-        # Get chunk with specified size
-        chunk = ' '.join(words[i:i + chunk_size])
-        chunks.append(chunk)
-        
-        # Move forward with overlap
-        i += chunk_size - overlap
-    
-    return chunks
+    """Split text into overlapping chunks of about chunk_size words, on sentence boundaries"""
+    spans = chunk_text(text, "sliding", max_tokens=chunk_size, overlap_tokens=overlap)
+    return [text[start:end] for start, end in spans]
 
 def extract_topics(text):
     """Extract potential topics from the text"""
@@ -69,23 +60,46 @@ def extract_topics(text):
 
 def chunk_for_embeddings(text, chunk_size=500):
     """Split text into chunks appropriate for embedding"""
-    sentences = sent_tokenize(text)
-    chunks = []
-    current_chunk = []
-    current_size = 0
+    # Pack whole sentences up to chunk_size characters
+    spans = chunk_text(text, "sentence", max_tokens=chunk_size, measure="chars")
+    return [text[start:end] for start, end in spans]
+
+def find_page(page_offsets, offset):
+    """Find the page containing a text offset, given the start offset of each page"""
+    if not page_offsets:
+        return None
+    return max(bisect_right(page_offsets, offset) - 1, 0)
+
+def page_spans(text, page_offsets):
+    """
+    Get the (start, end) span of each page in text joined by join_cleaned_pages
     
-    for sentence in sentences:
-        sentence_size = len(sentence)
-        
-        if current_size + sentence_size <= chunk_size:
-            current_chunk.append(sentence)
-            current_size += sentence_size
-        else:
-            chunks.append(' '.join(current_chunk))
-            current_chunk = [sentence]
-            current_size = sentence_size
+    Args:
+        text (str): The joined document text
+        page_offsets (list): Start offset of each page
     
-    if current_chunk:
-        chunks.append(' '.join(current_chunk))
+    Returns:
+        list: (start, end) offsets of each page's text; empty pages have start == end
+    """
+    spans = []
+    for page, start in enumerate(page_offsets):
+        end = page_offsets[page + 1] if page + 1 < len(page_offsets) else len(text)
+        # Drop the space that joins the page to the next one
+        while end > start and text[end - 1] == ' ':
+            end -= 1
+        spans.append((start, end))
+    return spans
+
+def find_section(outline, offset):
+    """Find the innermost outline section containing a text offset"""
+    if not outline:
+        return None
     
-    return chunks
+    # Of the sections containing the offset, the innermost one starts last
+    position = bisect_right([section['start'] for section in outline], offset) - 1
+    while position >= 0:
+        section = outline[position]
+        if section['start'] <= offset < section['end']:
+            return section
+        position -= 1
+    return None
@@ -1,9 +1,21 @@
+import hashlib
 import os
 import re
-from collections import Counter
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
+import numpy as np
+import tracing
 from langchain.docstore.document import Document
-from utils import chunk_for_embeddings
+from chunking import SentenceTable, chunk_text
+from dedup import MinHashLSH
+from segments import MERGE_FANOUT, IndexSnapshot, Segment, extend_index, merge_segments, plan_merge
+from packed_index import PackedIndex, pack_index
+from flashcard_generator import build_flashcard_pool
+from definitions import build_definition_index
+from term_index import TermIndex
+from utils import find_page, find_section, page_spans
 
 # Define common stopwords
 STOPWORDS = {
@@ -16,112 +28,943 @@ STOPWORDS = {
     'only', 'own', 'same', 'so', 'than', 'too', 'very', 'you', 'your'
 }
 
+# Rewrite a segment once this fraction of its chunks are tombstoned
+COMPACTION_RATIO = 0.25
+
 # Simple document store class
 class SimpleDocStore:
-    """A simple document store with basic text-based retrieval"""
-
-    def __init__(self, documents):
+    """
+    A simple document store with basic text-based retrieval
+    
+    The index is published as an immutable IndexSnapshot (see segments.py).
+    Queries read the current snapshot without locking; updates build new
+    segments under a write lock and publish a new snapshot in one assignment,
+    so a query never blocks on indexing and never sees a half-applied update.
+    """
+    
+    def __init__(self, documents, outline=None, dedup=True, background_compaction=True,
+                 merge_fanout=MERGE_FANOUT, query_expansion=True):
         """
         Initialize with a list of Document objects
         
         Args:
             documents (List[Document]): List of Document objects
+            outline (list, optional): Document outline (see pdf_processor.build_outline)
+            dedup (bool): Skip chunks that are near duplicates of already indexed ones
+            background_compaction (bool): Merge segments in a background thread instead of inline
+            merge_fanout (int): Number of same-tier neighbouring segments that get merged; below 2 never merges
+            query_expansion (bool): Also score terms that co-occur with the query terms, at a reduced weight
         """
-        self.documents = documents
+        self._snapshot = IndexSnapshot(outline=outline)
+        self._write_lock = threading.RLock()
+        self.background_compaction = background_compaction
+        self.merge_fanout = merge_fanout
+        self.query_expansion = query_expansion
+        # Optional scorer running outside this process (see sharded_search.py)
+        self.query_executor = None
+        self._merge_thread = None
+        self._merging = False
         
-        # Create an index of word frequencies for each document
-        self.document_terms = []
-        for doc in documents:
-            # Tokenize and clean each document
-            text = doc.page_content.lower()
-            # Split on non-alphanumeric chars and filter out stopwords
-            terms = [term for term in re.findall(r'\b\w+\b', text) 
-                     if term not in STOPWORDS and len(term) > 2]
-            # Count term frequencies
-            term_counter = Counter(terms)
-            self.document_terms.append(term_counter)
-            
+        # Near-duplicate detection (repeated boilerplate, slide templates, ...);
+        # only writers use it
+        self.deduplicator = MinHashLSH() if dedup else None
+        self.duplicates_skipped = 0
+        # Kept chunk id -> pages whose chunks were skipped as its duplicates
+        self.duplicate_pages = {}
+        
+        self.add_documents(documents)
+    
+    def snapshot(self):
+        """The current immutable view of the index"""
+        return self._snapshot
+    
+    def _publish(self, snapshot):
+        """Make a new snapshot visible to readers (callers hold the write lock)"""
+        self._snapshot = snapshot
+    
+    def _update(self, **changes):
+        """Publish the current snapshot with some fields changed"""
+        with self._write_lock:
+            self._publish(self._snapshot.replace(**changes))
+    
+    # Fields of the current snapshot
+    
+    @property
+    def outline(self):
+        return self._snapshot.outline
+    
+    @outline.setter
+    def outline(self, outline):
+        self._update(outline=outline or [])
+    
+    @property
+    def flashcard_pool(self):
+        """Flashcard candidates mined from the whole document at index time"""
+        return self._snapshot.flashcard_pool
+    
+    @flashcard_pool.setter
+    def flashcard_pool(self, flashcard_pool):
+        self._update(flashcard_pool=flashcard_pool)
+    
+    @property
+    def text(self):
+        return self._snapshot.text
+    
+    @text.setter
+    def text(self, text):
+        self._update(text=text)
+    
+    @property
+    def term_index(self):
+        """Positional word index of the whole text (see term_index.TermIndex), built on first use"""
+        return self._snapshot.term_index
+    
+    @term_index.setter
+    def term_index(self, term_index):
+        self._update(term_index=term_index)
+    
+    @property
+    def definition_index(self):
+        """Definition sentences of the flashcard pool by term (see definitions.py), built on first use"""
+        return self._snapshot.definition_index
+    
+    @definition_index.setter
+    def definition_index(self, definition_index):
+        self._update(definition_index=definition_index)
+    
+    @property
+    def pages(self):
+        """Per-page records of the page-indexed document: fingerprint, offsets and chunk ids"""
+        return self._snapshot.pages
+    
+    @property
+    def pages_source(self):
+        return self._snapshot.pages_source
+    
+    @property
+    def section_index(self):
+        """Section title -> ids of the chunks that overlap it"""
+        return self._snapshot.section_index
+    
+    @property
+    def source_index(self):
+        """Source name -> ids of its chunks"""
+        return self._snapshot.source_index
+    
+    @property
+    def documents(self):
+        """The live chunks, in id order"""
+        snapshot = self._snapshot
+        return [snapshot.document(doc_id) for doc_id in snapshot.live_ids()]
+    
+    @property
+    def deleted_count(self):
+        return self._snapshot.deleted_count
+    
     def as_retriever(self, search_kwargs=None):
-        """Return self as a retriever-like object"""
-        return self
+        """Return a retriever-like object bound to the given search parameters"""
+        return DocStoreRetriever(self, search_kwargs)
+    
+    def get_section(self, title):
+        """
+        Look up a section of the document outline by title
+        
+        Args:
+            title (str): The section title
+        
+        Returns:
+            dict or None: The outline entry with its page and offset range
+        """
+        for section in self.outline:
+            if section['title'] == title:
+                return section
+        return None
+    
+    def get_section_documents(self, title):
+        """
+        Get the chunks that belong to a section, in document order
+        
+        Args:
+            title (str): The section title
+        
+        Returns:
+            List[Document]: The section's chunks
+        """
+        snapshot = self._snapshot
+        return [snapshot.document(i) for i in snapshot.section_index.get(title, ()) if snapshot.is_live(i)]
     
-    def get_relevant_documents(self, query, k=4):
+    @tracing.traced("retrieval")
+    def get_relevant_documents(self, query, k=4, section=None, search_type="similarity",
+                               fetch_k=20, lambda_mult=0.5):
         """
         Retrieve relevant documents for the query
         
         Args:
             query (str): The query text
             k (int): Number of documents to retrieve
-            
+            section (str, optional): Only search chunks of this outline section
+            search_type (str): "similarity", or "mmr" to re-rank for diversity
+            fetch_k (int): Number of candidates to re-rank when search_type is "mmr"
+            lambda_mult (float): Trade-off between relevance (1) and diversity (0) for "mmr"
+        
         Returns:
             List[Document]: List of relevant documents
         """
-        # Extract terms from query
-        query_terms = [term for term in re.findall(r'\b\w+\b', query.lower()) 
-                     if term not in STOPWORDS and len(term) > 2]
+        # Extract terms from query, with their positions for phrase and proximity matching
+        positioned = positioned_terms(query)
+        query_terms = [term for term, _ in positioned]
+        offsets = [position for _, position in positioned]
+        
+        # One snapshot for the whole query
+        snapshot = self._snapshot
         
-        # Calculate similarity score for each document
-        scores = []
-        for i, doc_terms in enumerate(self.document_terms):
-            # Count matching terms
-            score = sum(doc_terms[term] for term in query_terms if term in doc_terms)
-            scores.append((i, score))
+        # Misspelled terms are searched as the closest indexed word, in the same place
+        corrections = snapshot.correct_terms(query_terms)
+        if corrections:
+            tracing.count("query_terms_corrected", len(corrections))
+            query_terms = [corrections.get(term, term) for term in query_terms]
         
-        # Sort by score descending
-        scores.sort(key=lambda x: x[1], reverse=True)
+        # Terms the material uses alongside the query terms, at a reduced weight
+        expansions = snapshot.expand_terms(query_terms) if self.query_expansion else {}
+        if expansions:
+            tracing.count("query_terms_expanded", len(expansions))
+        
+        # Restrict the candidates to the requested section
+        allowed = set(snapshot.section_index.get(section, ())) if section is not None else None
+        
+        wanted = max(fetch_k, k) if search_type == "mmr" else k
+        if self.query_executor is not None:
+            ranking, scored_count = self.query_executor.top_scores(snapshot, query_terms, wanted + 1, allowed,
+                                                                   offsets=offsets, expansions=expansions)
+        else:
+            ranking, scored_count = snapshot.top_scores(query_terms, wanted + 1, allowed, offsets=offsets,
+                                                        expansions=expansions)
+        tracing.count("chunks_scored", scored_count)
+        
+        # Chunks without any query term rank last, in document order
+        if scored_count <= wanted:
+            scored = {doc_id for doc_id, _ in ranking}
+            candidate_ids = sorted(allowed) if allowed is not None else snapshot.live_ids()
+            for doc_id in candidate_ids:
+                if len(ranking) > wanted:
+                    break
+                if doc_id not in scored and snapshot.is_live(doc_id):
+                    ranking.append((doc_id, 0))
+        
+        # Over-fetch candidates and pick a diverse top k among them
+        if search_type == "mmr" and len(ranking) > k:
+            candidates = ranking[:max(fetch_k, k)]
+            selected = self._max_marginal_relevance(snapshot, candidates, k, lambda_mult)
+            return [snapshot.document(candidates[i][0]) for i in selected]
         
         # Return top k documents
-        top_docs = [self.documents[i] for i, _ in scores[:k]]
+        top_docs = [snapshot.document(i) for i, _ in ranking[:k]]
         return top_docs
     
+    def correct_terms(self, terms):
+        """
+        Closest indexed word of each term the index does not contain
+        
+        Args:
+            terms (list): Lowercased query terms
+        
+        Returns:
+            dict: Term -> correction, for the unknown terms close to an indexed word
+        """
+        return self._snapshot.correct_terms(terms)
+    
+    def expand_terms(self, terms):
+        """
+        Terms of the material most related to some query terms
+        
+        Args:
+            terms (list): Lowercased query terms
+        
+        Returns:
+            dict: Related term -> score per occurrence relative to a query term
+                  (empty with query_expansion off)
+        """
+        if not self.query_expansion:
+            return {}
+        return self._snapshot.expand_terms(terms)
+    
+    def _max_marginal_relevance(self, snapshot, candidates, k, lambda_mult):
+        """
+        Select k diverse candidates by maximal marginal relevance
+        
+        Args:
+            snapshot (IndexSnapshot): The snapshot the candidates come from
+            candidates (list): (document id, score) pairs sorted by score
+            k (int): Number of candidates to select
+            lambda_mult (float): Trade-off between relevance (1) and diversity (0)
+        
+        Returns:
+            list: Positions of the selected candidates, in selection order
+        """
+        # The cached unit term vectors of the candidates
+        vectors = [snapshot.term_vector(doc_id) for doc_id, _ in candidates]
+        return max_marginal_relevance(vectors, [score for _, score in candidates], k, lambda_mult)
+    
+    def _build_segment(self, documents, next_id):
+        """
+        Index documents into a new segment (callers hold the write lock)
+        
+        Near duplicates of chunks already indexed are skipped.
+        
+        Args:
+            documents (List[Document]): The documents to index
+            next_id (int): Id of the first new chunk
+        
+        Returns:
+            tuple: (Segment or None, id of each document or None if skipped,
+                    section additions, source additions, next free id)
+        """
+        ids = array('I')
+        docs = []
+        document_terms = []
+        term_vectors = []
+        term_positions = []
+        assigned = []
+        sections = {}
+        sources = {}
+        
+        for doc in documents:
+            doc_id = next_id
+            
+            # Skip near duplicates, pointing their sections at the chunk that was kept
+            if self.deduplicator is not None:
+                signature = self.deduplicator.signature(doc.page_content)
+                duplicate_id = self.deduplicator.find_duplicate(signature)
+                if duplicate_id is not None:
+                    for title in doc.metadata.get('sections', ()):
+                        sections.setdefault(title, []).append(duplicate_id)
+                    self.duplicates_skipped += 1
+                    if doc.metadata.get('page') is not None:
+                        self.duplicate_pages.setdefault(duplicate_id, set()).add(doc.metadata['page'])
+                    assigned.append(None)
+                    continue
+                self.deduplicator.insert(doc_id, signature)
+            
+            # Add the document
+            next_id += 1
+            for title in doc.metadata.get('sections', ()):
+                sections.setdefault(title, []).append(doc_id)
+            if doc.metadata.get('source') is not None:
+                sources.setdefault(doc.metadata['source'], []).append(doc_id)
+            ids.append(doc_id)
+            docs.append(doc)
+            assigned.append(doc_id)
+            
+            # Update the index: split on non-alphanumeric chars and filter out stopwords
+            positions = {}
+            for term, position in positioned_terms(doc.page_content):
+                token_positions = positions.get(term)
+                if token_positions is None:
+                    token_positions = positions[term] = array('I')
+                token_positions.append(position)
+            term_counter = Counter({term: len(token_positions) for term, token_positions in positions.items()})
+            document_terms.append(term_counter)
+            term_vectors.append(unit_term_vector(term_counter))
+            term_positions.append(positions)
+        
+        segment = Segment(ids, docs, document_terms, term_vectors, term_positions) if docs else None
+        return segment, assigned, sections, sources, next_id
+    
     def add_documents(self, documents):
         """
         Add new documents to the store
         
+        Near duplicates of chunks already in the store are not added.
+        
         Args:
             documents (List[Document]): List of Document objects to add
+        
+        Returns:
+            list: Ids of the documents that were added
         """
-        # Add the documents
-        self.documents.extend(documents)
+        with self._write_lock:
+            snapshot = self._snapshot
+            segment, assigned, sections, sources, next_id = self._build_segment(documents, snapshot.next_id)
+            self._publish(snapshot.replace(
+                segments=snapshot.segments + ((segment,) if segment else ()),
+                section_index=extend_index(snapshot.section_index, sections),
+                source_index=extend_index(snapshot.source_index, sources),
+                next_id=next_id))
+            self._maybe_merge()
         
-        # Update the index for the new documents
-        for doc in documents:
-            text = doc.page_content.lower()
-            terms = [term for term in re.findall(r'\b\w+\b', text) 
-                     if term not in STOPWORDS and len(term) > 2]
-            term_counter = Counter(terms)
-            self.document_terms.append(term_counter)
+        return [doc_id for doc_id in assigned if doc_id is not None]
+    
+    def delete_documents(self, doc_ids):
+        """
+        Tombstone documents so they are no longer retrieved
+        
+        The documents' slots are reclaimed when their segment is merged or
+        rewritten, which happens once its share of deleted documents passes
+        COMPACTION_RATIO.
+        
+        Args:
+            doc_ids (iterable): Ids of the documents to delete
+        
+        Returns:
+            int: Number of documents deleted
+        """
+        with self._write_lock:
+            snapshot, deleted = self._snapshot.with_deletions(doc_ids)
+            self._forget(deleted)
+            self._publish(snapshot)
+            self._maybe_merge()
+        return len(deleted)
+    
+    def _forget(self, doc_ids):
+        """Drop writer-side state of deleted chunks"""
+        for doc_id in doc_ids:
+            self.duplicate_pages.pop(doc_id, None)
+            # New chunks must not be dropped as duplicates of a deleted one
+            if self.deduplicator is not None:
+                self.deduplicator.remove(doc_id)
+    
+    def delete_source(self, source):
+        """
+        Delete every chunk that came from a source
+        
+        Args:
+            source (str): The source the chunks were added with (metadata 'source')
+        
+        Returns:
+            int: Number of documents deleted
+        """
+        with self._write_lock:
+            snapshot, deleted = self._snapshot.with_deletions(self._snapshot.source_index.get(source, ()))
+            source_index = dict(snapshot.source_index)
+            source_index.pop(source, None)
+            changes = {'source_index': source_index}
+            # The page-indexed document carries the text, flashcards and outline too
+            if source is not None and source == snapshot.pages_source:
+                changes.update(pages=(), pages_source=None, flashcard_pool=[], outline=[], text=None)
+            self._forget(deleted)
+            self._publish(snapshot.replace(**changes))
+            self._maybe_merge()
+        return len(deleted)
+    
+    def _maybe_merge(self):
+        """Start merging segments if the merge policy asks for it (callers hold the write lock)"""
+        if self.merge_fanout < 2 or self._merging or self._plan_merge(self._snapshot.segments) is None:
+            return
+        if not self.background_compaction:
+            self._run_merges()
+            return
+        self._merging = True
+        self._merge_thread = threading.Thread(target=self._run_merges, daemon=True)
+        self._merge_thread.start()
+    
+    def _plan_merge(self, segments):
+        """Next range of segments to merge under this store's policy, or None"""
+        return plan_merge(segments, fanout=self.merge_fanout, deleted_ratio=COMPACTION_RATIO)
+    
+    def _run_merges(self):
+        """Carry out planned merges one at a time until the policy is satisfied"""
+        while True:
+            with self._write_lock:
+                segments = self._snapshot.segments
+                plan = self._plan_merge(segments)
+                if plan is None:
+                    self._merging = False
+                    return
+            self._merge(segments[plan[0]:plan[1]])
+    
+    def _merge(self, inputs):
+        """
+        Replace neighbouring segments with one merged segment
+        
+        Ids do not change. The merged segment and its postings are built
+        without holding the write lock, so queries and updates carry on;
+        documents deleted or re-tagged meanwhile are folded in when the result
+        is published.
+        
+        Args:
+            inputs (list): Neighbouring segments of the current snapshot
+        """
+        merged = merge_segments(inputs)
+        keys = {segment.key for segment in inputs}
+        
+        with self._write_lock:
+            current = self._snapshot
+            current_inputs = [segment for segment in current.segments if segment.key in keys]
+            segments = []
+            for segment in current.segments:
+                if segment.key not in keys:
+                    segments.append(segment)
+                elif segment is current_inputs[0] and merged is not None:
+                    segments.append(merged.refreshed(current_inputs))
+            self._publish(current.replace(segments=segments))
+    
+    def compact(self):
+        """
+        Merge all segments into one, dropping deleted documents and their ids
+        from the section and source indexes
+        """
+        self._merge(self._snapshot.segments)
+        
+        with self._write_lock:
+            current = self._snapshot
+            live = set(current.live_ids())
+            section_index = {title: tuple(i for i in ids if i in live)
+                             for title, ids in current.section_index.items()}
+            source_index = {source: tuple(i for i in ids if i in live)
+                            for source, ids in current.source_index.items()}
+            self._publish(current.replace(
+                section_index={title: ids for title, ids in section_index.items() if ids},
+                source_index={source: ids for source, ids in source_index.items() if ids}))
+    
+    def index_pages(self, text, page_offsets, outline=None, strategy="sliding", max_tokens=150,
+                    overlap_tokens=30, source=None):
+        """
+        Index a (revised) document page by page, re-chunking only pages that changed
+        
+        Pages are matched to the previously indexed ones by content fingerprint.
+        Unchanged pages keep their chunks (only their offsets move); chunks of
+        changed or removed pages are tombstoned, and new or changed pages are
+        chunked and indexed. On an empty store this indexes every page. The
+        whole revision is published as one snapshot.
+        
+        Args:
+            text (str): The full cleaned document text
+            page_offsets (list): Start offset of each page in text
+            outline (list, optional): Document outline with offsets into text
+            strategy (str): Chunking strategy (see chunking.CHUNKING_STRATEGIES)
+            max_tokens (int): Token budget of each chunk
+            overlap_tokens (int): Token overlap between neighbouring chunks
+            source (str, optional): Source recorded on the chunks (see delete_source)
+        
+        Returns:
+            dict: Numbers of 'reused', 'reindexed' and 'removed' pages
+        """
+        spans = page_spans(text, page_offsets)
+        fingerprints = [page_content_fingerprint(text[start:end]) for start, end in spans]
+        outline = outline or []
+        
+        with self._write_lock:
+            snapshot = self._snapshot
+            old_records = snapshot.pages
+            
+            # Pair new pages with old pages of identical content, in page order
+            # (pages that lost chunks to deletion are indexed again)
+            old_pages = {}
+            for number, page in enumerate(old_records):
+                if all(snapshot.is_live(doc_id) for doc_id in page['doc_ids']):
+                    old_pages.setdefault(page['fingerprint'], deque()).append(number)
+            matches = []
+            for fingerprint in fingerprints:
+                candidates = old_pages.get(fingerprint)
+                matches.append(candidates.popleft() if candidates else None)
+            
+            # Pages whose chunks were deduplicated against a doomed chunk must be re-chunked too
+            kept = {old: new for new, old in enumerate(matches) if old is not None}
+            doomed = [doc_id for number, page in enumerate(old_records) if number not in kept
+                      for doc_id in page['doc_ids']]
+            for doc_id in doomed:
+                for number in self.duplicate_pages.get(doc_id, ()):
+                    if number in kept:
+                        matches[kept.pop(number)] = None
+            doomed = [doc_id for number, page in enumerate(old_records) if number not in kept
+                      for doc_id in page['doc_ids']]
+            snapshot, deleted = snapshot.with_deletions(doomed)
+            self._forget(deleted)
+            
+            # Renumber the duplicate references of the pages that survive
+            self.duplicate_pages = {doc_id: {kept[number] for number in numbers if number in kept}
+                                    for doc_id, numbers in self.duplicate_pages.items()}
+            
+            # Chunk the new and changed pages; copy the chunks of unchanged pages
+            # with their offsets moved to the page's new position
+            new_docs = []
+            moved = {}
+            changed = []
+            for number, ((start, end), match) in enumerate(zip(spans, matches)):
+                if match is None:
+                    docs = split_page_into_documents(text, start, end, number, strategy, max_tokens,
+                                                     overlap_tokens, outline)
+                    if source is not None:
+                        for doc in docs:
+                            doc.metadata['source'] = source
+                    new_docs.extend(docs)
+                    changed.append(number)
+                else:
+                    shift = start - old_records[match]['start']
+                    for doc_id in old_records[match]['doc_ids']:
+                        doc = snapshot.document(doc_id)
+                        metadata = {key: value for key, value in doc.metadata.items()
+                                    if key not in ('sections', 'section')}
+                        metadata['start'] += shift
+                        metadata['end'] += shift
+                        metadata['page'] = number
+                        moved[doc_id] = Document(page_content=doc.page_content, metadata=metadata)
+            
+            # Tag all of the document's chunks with the new outline
+            assign_sections(sorted(new_docs + list(moved.values()), key=lambda doc: doc.metadata['start']),
+                            outline)
+            
+            segment, assigned, _, sources, next_id = self._build_segment(new_docs, snapshot.next_id)
+            
+            # Only chunks whose metadata changed need a new Document in their segment
+            replacements = {doc_id: doc for doc_id, doc in moved.items()
+                            if doc.metadata != snapshot.document(doc_id).metadata}
+            snapshot = snapshot.with_documents(replacements)
+            if segment is not None:
+                snapshot = snapshot.replace(segments=snapshot.segments + (segment,), next_id=next_id)
+            
+            # Page records, with the ids of each page's chunks
+            new_ids = {}
+            for doc, doc_id in zip(new_docs, assigned):
+                if doc_id is not None:
+                    new_ids.setdefault(doc.metadata['page'], []).append(doc_id)
+            pages = []
+            for number, ((start, end), fingerprint, match) in enumerate(zip(spans, fingerprints, matches)):
+                doc_ids = new_ids.get(number, []) if match is None else old_records[match]['doc_ids']
+                pages.append({'fingerprint': fingerprint, 'start': start, 'end': end, 'doc_ids': doc_ids})
+            
+            # Flashcard candidates: keep those of unchanged pages, mine the rest
+            if not kept:
+                pool = build_flashcard_pool(text, outline, page_offsets)
+            else:
+                pool = []
+                for candidate in snapshot.flashcard_pool:
+                    old = candidate['page']
+                    if old in kept:
+                        candidate = dict(candidate)
+                        candidate['start'] += spans[kept[old]][0] - old_records[old]['start']
+                        candidate['page'] = kept[old]
+                        pool.append(candidate)
+                for number in changed:
+                    start, end = spans[number]
+                    for candidate in build_flashcard_pool(text[start:end]):
+                        candidate['start'] += start
+                        candidate['page'] = number
+                        pool.append(candidate)
+                for candidate in pool:
+                    section = find_section(outline, candidate['start'])
+                    candidate['section'] = section['title'] if section else None
+            
+            # Rebuild the section index from the live chunks' tags
+            sections = {}
+            for doc_id in snapshot.live_ids():
+                for title in snapshot.document(doc_id).metadata.get('sections', ()):
+                    sections.setdefault(title, []).append(doc_id)
             
+            # Publish the whole revision at once; word positions shift with any
+            # change, so the term index is rebuilt on demand, while the
+            # definitions are indexed now along with the new pool
+            self._publish(snapshot.replace(
+                section_index={title: tuple(ids) for title, ids in sections.items()},
+                source_index=extend_index(snapshot.source_index, sources),
+                outline=outline, flashcard_pool=pool, text=text, pages=tuple(pages),
+                pages_source=source, definition_index=build_definition_index(pool)))
+            
+            self._maybe_merge()
+        
+        tracing.count("cache_hits", len(kept), cache="indexed_pages")
+        tracing.count("cache_misses", len(changed), cache="indexed_pages")
+        return {'reused': len(kept), 'reindexed': len(changed), 'removed': len(old_records) - len(kept)}
+    
     def similarity_search(self, query, k=4):
         """
         Alias for get_relevant_documents
         """
         return self.get_relevant_documents(query, k)
+    
+    def save_packed(self, path):
+        """
+        Write the current snapshot to a packed index file (see PackedDocStore)
+        
+        Args:
+            path (str): File to write; replaced atomically if it exists
+        """
+        pack_index(self._snapshot, path)
+
+class PackedDocStore(SimpleDocStore):
+    """
+    Read-only document store over a packed index file
+    
+    The index is memory-mapped rather than loaded (see packed_index.py), so
+    any number of processes can open the same file and the operating system
+    keeps one copy of it in memory: each extra Streamlit server or worker
+    adds almost nothing to the memory used, whatever the library's size.
+    Queries behave exactly as on the SimpleDocStore the file was saved from.
+    """
+    
+    def __init__(self, path):
+        """
+        Args:
+            path (str): A file written by SimpleDocStore.save_packed
+        """
+        self.path = path
+        self._snapshot = PackedIndex(path)
+        self._stat = os.stat(path)
+        self._write_lock = threading.RLock()
+        self.query_expansion = True
+        self.query_executor = None
+        self.deduplicator = None
+        self.duplicates_skipped = 0
+        self.duplicate_pages = {}
+    
+    def reload(self):
+        """
+        Map the file again if it has been replaced by a newer save
+        
+        Returns:
+            bool: True if a new version was loaded
+        """
+        stat = os.stat(self.path)
+        if (stat.st_ino, stat.st_mtime_ns) == (self._stat.st_ino, self._stat.st_mtime_ns):
+            return False
+        with self._write_lock:
+            # Queries still running on the old mapping keep it alive until they finish
+            self._publish(PackedIndex(self.path))
+            self._stat = stat
+        return True
+    
+    def _read_only(self, *args, **kwargs):
+        raise ValueError("A packed document store is read-only; update the store it was saved from "
+                         "and save it again")
+    
+    add_documents = delete_documents = delete_source = index_pages = compact = _update = _read_only
+
+def positioned_terms(text):
+    """
+    Index terms of a text with their token positions
+    
+    Words are split on non-alphanumeric characters; stopwords and words of up
+    to two letters are dropped but still counted, so "theory of mind" gives
+    theory at 0 and mind at 2.
+    
+    Args:
+        text (str): A chunk or query
+    
+    Returns:
+        list: (term, position) pairs in text order
+    """
+    return [(term, position) for position, term in enumerate(re.findall(r'\b\w+\b', text.lower()))
+            if term not in STOPWORDS and len(term) > 2]
+
+def unit_term_vector(term_counter):
+    """
+    Convert term counts into a unit-length vector
+    
+    Args:
+        term_counter (Counter): Term frequencies of a chunk
+    
+    Returns:
+        tuple: (terms, numpy array of weights with L2 norm 1)
+    """
+    terms = tuple(term_counter)
+    weights = np.fromiter(term_counter.values(), dtype=float, count=len(terms))
+    norm = np.linalg.norm(weights)
+    if norm > 0:
+        weights /= norm
+    return terms, weights
+
+def max_marginal_relevance(vectors, scores, k, lambda_mult):
+    """
+    Select k diverse candidates by maximal marginal relevance
+    
+    Args:
+        vectors (list): Unit term vector of each candidate (see unit_term_vector)
+        scores (list): Relevance score of each candidate, best first
+        k (int): Number of candidates to select
+        lambda_mult (float): Trade-off between relevance (1) and diversity (0)
+    
+    Returns:
+        list: Positions of the selected candidates, in selection order
+    """
+    # Dense matrix of the unit term vectors over the candidates' vocabulary
+    vocabulary = {}
+    for terms, _ in vectors:
+        for term in terms:
+            vocabulary.setdefault(term, len(vocabulary))
+    
+    matrix = np.zeros((len(vectors), max(len(vocabulary), 1)))
+    for row, (terms, weights) in enumerate(vectors):
+        matrix[row, [vocabulary[term] for term in terms]] = weights
+    similarity = matrix @ matrix.T
+    
+    # Scale relevance to [0, 1] so it is comparable with cosine similarity
+    relevance = np.array(scores, dtype=float)
+    if relevance[0] > 0:
+        relevance /= relevance[0]
+    
+    # Greedy selection, tracking each candidate's similarity to the selected set
+    selected = [0]
+    max_similarity = similarity[0].copy()
+    for _ in range(1, k):
+        marginal = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        marginal[selected] = -np.inf
+        best = int(np.argmax(marginal))
+        selected.append(best)
+        np.maximum(max_similarity, similarity[best], out=max_similarity)
+    
+    return selected
+
+class DocStoreRetriever:
+    """Retriever-like wrapper that applies fixed search parameters to a document store"""
+    
+    def __init__(self, store, search_kwargs=None):
+        """
+        Args:
+            store (SimpleDocStore): The store to retrieve from
+            search_kwargs (dict, optional): Default parameters for get_relevant_documents
+        """
+        self.store = store
+        self.search_kwargs = dict(search_kwargs or {})
+    
+    def get_relevant_documents(self, query, **kwargs):
+        """Retrieve documents, with keyword arguments overriding the bound search parameters"""
+        params = dict(self.search_kwargs)
+        params.update(kwargs)
+        return self.store.get_relevant_documents(query, **params)
+    
+    def __getattr__(self, name):
+        # Expose the rest of the store (outline, sections, ...) through the retriever
+        return getattr(self.store, name)
 
-def create_vector_store(text):
+def assign_sections(docs, outline):
+    """
+    Tag chunks with the outline sections they overlap
+    
+    Chunks and sections are both ordered by offset, so the chunks of each
+    section are found with two binary searches.
+    
+    Args:
+        docs (List[Document]): Chunks with 'start' and 'end' metadata, in text order
+        outline (list): Document outline
+    """
+    starts = [doc.metadata['start'] for doc in docs]
+    ends = [doc.metadata['end'] for doc in docs]
+    
+    for section in outline:
+        first = bisect_right(ends, section['start'])
+        last = bisect_left(starts, section['end'])
+        for doc in docs[first:last]:
+            doc.metadata.setdefault('sections', []).append(section['title'])
+            # Sections are ordered outermost first, so the last one is the innermost
+            if section['start'] <= doc.metadata['start'] < section['end']:
+                doc.metadata['section'] = section['title']
+
+def page_content_fingerprint(page_text):
+    """Fingerprint the cleaned text of a page"""
+    return hashlib.blake2b(page_text.encode('utf-8'), digest_size=16).hexdigest()
+
+def split_page_into_documents(text, start, end, page, strategy="sliding", max_tokens=150,
+                              overlap_tokens=30, outline=None):
+    """
+    Chunk one page of the text, so that no chunk crosses into another page
+    
+    Args:
+        text (str): The full document text
+        start (int): Offset of the page in text
+        end (int): End offset of the page in text
+        page (int): Page number
+        strategy (str): Chunking strategy (see chunking.CHUNKING_STRATEGIES)
+        max_tokens (int): Token budget of each chunk
+        overlap_tokens (int): Token overlap between neighbouring chunks
+        outline (list, optional): Document outline with offsets into text
+    
+    Returns:
+        List[Document]: The page's chunks, with offsets into the full text
+    """
+    page_text = text[start:end]
+    # Section boundaries that fall inside the page, relative to the page
+    page_outline = [{'start': section['start'] - start} for section in outline or ()
+                    if start < section['start'] < end]
+    spans = chunk_text(page_text, strategy, max_tokens, overlap_tokens, outline=page_outline)
+    return [Document(page_content=page_text[chunk_start:chunk_end],
+                     metadata={'start': start + chunk_start, 'end': start + chunk_end, 'page': page})
+            for chunk_start, chunk_end in spans]
+
+def split_into_documents(text, outline=None, strategy="sliding", max_tokens=150, overlap_tokens=30,
+                         page_offsets=None):
+    """
+    Chunk text into Document objects that carry their offsets in the text
+    
+    Args:
+        text (str): The text to chunk
+        outline (list, optional): Document outline with offsets into text
+        strategy (str): Chunking strategy (see chunking.CHUNKING_STRATEGIES)
+        max_tokens (int): Token budget of each chunk
+        overlap_tokens (int): Token overlap between neighbouring chunks
+        page_offsets (list, optional): Start offset of each page, to record the page of each chunk
+    
+    Returns:
+        List[Document]: The chunks, in text order
+    """
+    spans = chunk_text(text, strategy, max_tokens, overlap_tokens, outline=outline,
+                       sentences=SentenceTable(text))
+    
+    docs = [Document(page_content=text[start:end], metadata={'start': start, 'end': end})
+            for start, end in spans]
+    
+    if page_offsets:
+        for doc in docs:
+            doc.metadata['page'] = find_page(page_offsets, doc.metadata['start'])
+    
+    if outline:
+        assign_sections(docs, outline)
+    
+    return docs
+
+@tracing.traced("indexing")
+def create_vector_store(text, outline=None, strategy="sliding", max_tokens=150, overlap_tokens=30,
+                        page_offsets=None, source=None, path=None):
     """
     Create a document store from the provided text
     
     Args:
         text (str): The text to create a document store from
-        
+        outline (list, optional): Document outline with offsets into text
+        strategy (str): Chunking strategy (see chunking.CHUNKING_STRATEGIES)
+        max_tokens (int): Token budget of each chunk
+        overlap_tokens (int): Token overlap between neighbouring chunks
+        page_offsets (list, optional): Start offset of each page in text
+        source (str, optional): Name of the document, recorded on its chunks (see delete_from_vector_store)
+        path (str, optional): Keep the store on disk in this SQLite database (see sqlite_store.py),
+            replacing what it held, instead of in memory
+    
     Returns:
-        SimpleDocStore: The created document store
+        SimpleDocStore or SQLiteDocStore: The created document store
     """
-    # Split text into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
-    )
+    if path is not None:
+        # Imported here, since sqlite_store builds on this module
+        from sqlite_store import SQLiteDocStore
+        doc_store = SQLiteDocStore(path)
+        doc_store.clear()
+        doc_store.outline = outline
     
-    chunks = text_splitter.split_text(text)
+    if page_offsets:
+        # Chunk page by page, so a revised upload can be re-indexed incrementally
+        if path is None:
+            doc_store = SimpleDocStore([], outline=outline)
+        doc_store.index_pages(text, page_offsets, outline, strategy, max_tokens, overlap_tokens, source)
+    else:
+        # Split text into chunks
+        docs = split_into_documents(text, outline, strategy, max_tokens, overlap_tokens)
+        if source is not None:
+            for doc in docs:
+                doc.metadata['source'] = source
+        
+        # Create the document store
+        if path is None:
+            doc_store = SimpleDocStore(docs, outline=outline)
+        else:
+            doc_store.add_documents(docs)
+        
+        # Mine flashcard candidates once, while indexing
+        doc_store.flashcard_pool = build_flashcard_pool(text, outline)
+        doc_store.text = text
     
-    # Convert chunks to documents
-    docs = [Document(page_content=chunk, metadata={}) for chunk in chunks]
+    # Index the document's words once, while indexing
+    doc_store.term_index = TermIndex(text)
     
-    # Create the document store
-    doc_store = SimpleDocStore(docs)
+    # Likewise its definitions, so "what is X" questions are a lookup
+    doc_store.definition_index = build_definition_index(doc_store.flashcard_pool)
     
     return doc_store
 
@@ -132,13 +975,13 @@ def get_retriever(vector_store, search_kwargs=None):
     Args:
         vector_store: The vector store to get a retriever from
         search_kwargs (dict, optional): Search parameters for the retriever
-        
+    
     Returns:
         Retriever: The retriever
     """
     if search_kwargs is None:
         search_kwargs = {"k": 4}  # Default to retrieving 4 documents
-        
+    
     retriever = vector_store.as_retriever(search_kwargs=search_kwargs)
     
     return retriever
@@ -151,37 +994,69 @@ def similarity_search(vector_store, query, k=4):
         vector_store: The vector store to search in
         query (str): The query to search for
         k (int): Number of results to return
-        
+    
     Returns:
         list: List of similar documents
     """
     results = vector_store.similarity_search(query, k=k)
     return results
 
-def update_vector_store(vector_store, new_text):
+@tracing.traced("indexing")
+def update_vector_store(vector_store, new_text, strategy="sliding", max_tokens=150, overlap_tokens=30,
+                        outline=None, page_offsets=None, source=None):
     """
     Update the document store with new text
     
+    With page_offsets, new_text is a revision of the document (from the same
+    source) already indexed page by page: only pages whose content changed are
+    re-chunked and re-indexed, and chunks of removed pages are tombstoned.
+    Otherwise new_text is added to the store.
+    
     Args:
         vector_store: The document store to update
         new_text (str): The new text to add to the document store
-        
+        strategy (str): Chunking strategy (see chunking.CHUNKING_STRATEGIES)
+        max_tokens (int): Token budget of each chunk
+        overlap_tokens (int): Token overlap between neighbouring chunks
+        outline (list, optional): Outline of the revised document
+        page_offsets (list, optional): Start offset of each page of the revised document
+        source (str, optional): Name of the document, recorded on its chunks
+    
     Returns:
         SimpleDocStore: The updated document store
     """
-    # Split new text into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len,
-    )
-    
-    chunks = text_splitter.split_text(new_text)
+    if page_offsets and vector_store.pages and source == vector_store.pages_source:
+        vector_store.index_pages(new_text, page_offsets, outline, strategy, max_tokens, overlap_tokens, source)
+        return vector_store
     
-    # Convert chunks to documents
-    docs = [Document(page_content=chunk, metadata={}) for chunk in chunks]
+    # Split new text into chunks
+    docs = split_into_documents(new_text, None, strategy, max_tokens, overlap_tokens)
+    if source is not None:
+        for doc in docs:
+            doc.metadata['source'] = source
     
     # Add documents to the document store
     vector_store.add_documents(docs)
     
     return vector_store
+
+def delete_from_vector_store(vector_store, source=None, doc_ids=None):
+    """
+    Delete documents from the document store
+    
+    Deleted chunks are tombstoned at once and reclaimed by a later compaction.
+    
+    Args:
+        vector_store: The document store to delete from
+        source (str, optional): Delete every chunk added with this source
+        doc_ids (list, optional): Delete these chunk ids
+    
+    Returns:
+        int: Number of documents deleted
+    """
+    deleted = 0
+    if source is not None:
+        deleted += vector_store.delete_source(source)
+    if doc_ids:
+        deleted += vector_store.delete_documents(doc_ids)
+    return deleted